@@ -0,0 +1,34 @@
+from rackattack.physical.alloc import matching
+from rackattack.physical.alloc import priority
+
+
+class AdmissionBatch:
+    def __init__(self, freePool, preemptionCandidates, mostImportantNice):
+        self._freePool = freePool
+        self._candidates = list(preemptionCandidates.nicerThan(mostImportantNice))
+        self._eligible = dict()
+        self._generation = None
+
+    def eligible(self, requirement):
+        if self._generation != self._freePool.generation():
+            self._eligible = dict()
+            self._generation = self._freePool.generation()
+        key = matching.Matching.requirementKey(requirement)
+        hosts = self._eligible.get(key)
+        if hosts is None:
+            hosts = self._freePool.eligible(requirement)
+            self._eligible[key] = hosts
+            return hosts
+        hosts = [host for host in hosts if host in self._freePool]
+        self._eligible[key] = hosts
+        return hosts
+
+    def takeOut(self, hostStateMachine):
+        self._freePool.takeOut(hostStateMachine)
+
+    def nicerThan(self, absoluteNice):
+        for allocation in self._candidates:
+            if priority.Priority.absoluteNice(allocation.allocationInfo()) <= absoluteNice:
+                return
+            if allocation.dead() is None:
+                yield allocation
@@ -1,32 +1,38 @@
 from rackattack.common import globallock
 from rackattack.common import hoststatemachine
-from rackattack.common import timer
 import time
 import logging
 import tempfile
 
 
 class Allocation:
-    _HEARTBEAT_TIMEOUT = 45
     _LIMBO_AFTER_DEATH_DURATION = 60
 
-    def __init__(self, index, requirements, allocationInfo, allocated, broadcaster, freePool, hosts):
+    def __init__(self, index, requirements, allocationInfo, allocated, broadcaster, freePool, hosts,
+                 heartbeats):
         self._index = index
         self._requirements = requirements
         self._allocationInfo = allocationInfo
         self._broadcaster = broadcaster
         self._freePool = freePool
         self._hosts = hosts
+        self._heartbeats = heartbeats
         self._waiting = allocated
         self._inaugurated = dict()
+        self._allocated = dict()
+        self._nameOfStateMachine = dict()
+        self._nodeOfHostID = dict()
         self._forgottenHosts = set()
         self._death = None
+        self._deathCallback = None
+        self._changeCallback = None
         self._startTimestamp = time.time()
         self._broadcastAllocationCreation()
         for name, stateMachine in self._waiting.iteritems():
+            self._addToIndex(name, stateMachine)
             stateMachine.hostImplementation().truncateSerialLogEveryNCalls()
             self._assign(name, stateMachine)
-        self.heartbeat()
+        self._heartbeats.register(self, self._heartbeatTimeout)
 
     def index(self):
         return self._index
@@ -39,10 +45,20 @@ class Allocation:
         return self._inaugurated
 
     def allocated(self):
-        result = dict(self._waiting)
-        if self._inaugurated is not None:
-            result.update(self._inaugurated)
-        return result
+        return self._allocated
+
+    def stateMachines(self):
+        return self._nameOfStateMachine.viewkeys()
+
+    def containsStateMachine(self, stateMachine):
+        return stateMachine in self._nameOfStateMachine
+
+    def inauguratedByHostID(self, hostID):
+        assert self.done()
+        node = self._nodeOfHostID.get(hostID)
+        if node is None:
+            return None
+        return node[1]
 
     def done(self):
         assert self.dead() is None
@@ -56,11 +72,16 @@ class Allocation:
     def withdraw(self, moreInfo):
         self._die("withdrawn", moreInfo=moreInfo)
 
+    def setDeathCallback(self, callback):
+        self._deathCallback = callback
+
+    def setChangeCallback(self, callback):
+        self._changeCallback = callback
+
     def heartbeat(self):
         if self.dead():
             return
-        timer.cancelAllByTag(tag=self)
-        timer.scheduleIn(timeout=self._HEARTBEAT_TIMEOUT, callback=self._heartbeatTimeout, tag=self)
+        self._heartbeats.heartbeat(self)
 
     def dead(self):
         assert self._death is None or self._inaugurated is None
@@ -71,7 +92,11 @@ class Allocation:
     def deadForAWhile(self):
         if not self.dead():
             return False
-        return self._death['when'] < time.time() - self._LIMBO_AFTER_DEATH_DURATION
+        return self.endOfLimboTimestamp() < time.time()
+
+    def endOfLimboTimestamp(self):
+        assert self.dead()
+        return self._death['when'] + self._LIMBO_AFTER_DEATH_DURATION
 
     def createPostMortemPack(self):
         contents = []
@@ -100,9 +125,13 @@ class Allocation:
                              dict(id=stateMachine.hostImplementation().id()))
                 continue
             self._returnHostToFreePool(stateMachine)
+        for name in self._inaugurated:
+            self._removeFromIndex(name)
         self._inaugurated = None
         self._death = dict(when=time.time(), reason=reason)
-        timer.cancelAllByTag(tag=self)
+        self._heartbeats.unregister(self)
+        if self._deathCallback is not None:
+            self._deathCallback(self)
         self._broadcaster.allocationDied(self._index, reason=reason, message=moreInfo)
         self._broadcaster.cleanupAllocationPublishResources(self._index)
         logging.info("Allocation %(idx)s died.", dict(idx=self._index))
@@ -123,6 +152,7 @@ class Allocation:
                              dict(name=name, waiting=self._waiting, inaugurated=self._inaugurated,
                                   hostID=stateMachine.hostImplementation().id()))
             if self.done():
+                self._changed()
                 self._broadcaster.allocationDone(self._index)
 
     def _stateMachineSelfDestructed(self, stateMachine):
@@ -147,29 +177,34 @@ class Allocation:
     def _broadcastAllocationCreation(self):
         self._broadcaster.allocationCreated(allocationID=self._index, allocated=self._waiting)
 
-    def _detachHostFromCollection(self, hostStateMachine, collection):
-        matchingMachines = [name for name, stateMachine in collection.iteritems()
-                            if stateMachine == hostStateMachine]
-        assert len(matchingMachines) == 1, matchingMachines
-        machineName = matchingMachines[0]
-        del collection[machineName]
+    def _addToIndex(self, name, stateMachine):
+        self._allocated[name] = stateMachine
+        self._nameOfStateMachine[stateMachine] = name
+        self._nodeOfHostID[stateMachine.hostImplementation().id()] = (name, stateMachine)
+
+    def _removeFromIndex(self, name):
+        stateMachine = self._allocated.pop(name)
+        del self._nameOfStateMachine[stateMachine]
+        del self._nodeOfHostID[stateMachine.hostImplementation().id()]
 
     def _forgetAboutHost(self, hostStateMachine):
         hostID = hostStateMachine.hostImplementation().id()
         if self.dead() is not None:
             msg = "Cannot release a host after death (allocation #%(index)s)" % dict(index=self.index())
             raise Exception(msg)
-        if hostStateMachine not in self.allocated().values():
+        if hostStateMachine not in self._nameOfStateMachine:
             msg = "Cannot release host %(hostID)s from allocation #%(index)s as it's not allocated to it" \
                 % dict(index=self.index(), hostID=hostID)
             raise Exception(msg)
         self._forgottenHosts.add(hostStateMachine)
-        if hostStateMachine in self._waiting.values():
-            self._detachHostFromCollection(hostStateMachine, self._waiting)
-            if self.dead() is None:
-                assert hostStateMachine not in self._inaugurated.values()
-        elif self.dead() is None and hostStateMachine in self._inaugurated.values():
-            self._detachHostFromCollection(hostStateMachine, self._inaugurated)
+        name = self._nameOfStateMachine[hostStateMachine]
+        if name in self._waiting:
+            assert name not in self._inaugurated
+            del self._waiting[name]
+        else:
+            del self._inaugurated[name]
+        self._removeFromIndex(name)
+        self._changed()
 
     def detachHost(self, hostStateMachine):
         self._forgetAboutHost(hostStateMachine)
@@ -184,6 +219,10 @@ class Allocation:
         if not self.allocated():
             self._die("No hosts left in allocation")
 
+    def _changed(self):
+        if self._changeCallback is not None:
+            self._changeCallback(self)
+
     def _returnHostToFreePool(self, hostStateMachine):
         hostStateMachine.unassign()
         hostStateMachine.setDestroyCallback(None)
@@ -1,8 +1,17 @@
 from rackattack.physical.alloc import allocation
+from rackattack.physical.alloc import heartbeats
 from rackattack.physical.alloc import priority
+from rackattack.physical.alloc import preemptioncandidates
+from rackattack.physical.alloc import osmosislabels
+from rackattack.physical.alloc import admissionbatch
 from rackattack.common import globallock
-from rackattack.virtual import sh
+import collections
 import logging
+import heapq
+import time
+
+
+PublishedStatus = collections.namedtuple("PublishedStatus", "allocation done dead endOfLimboTimestamp")
 
 
 class Allocations:
@@ -10,11 +19,53 @@ class Allocations:
         self._broadcaster = broadcaster
         self._hosts = hosts
         self._freePool = freePool
-        self._osmosisServer = osmosisServer
-        self._allocations = []
+        self._osmosisLabels = osmosislabels.OsmosisLabels(objectStore=osmosisServer + ":1010")
+        self._allocations = collections.OrderedDict()
+        self._expiries = []
+        self._heartbeats = heartbeats.Heartbeats()
+        self._published = dict()
+        self._allocationOfStateMachine = dict()
+        self._stateMachinesOfAllocation = dict()
+        self._preemptionCandidates = preemptioncandidates.PreemptionCandidates()
         self._index = 1
+        self._listeners = []
+
+    def addListener(self, listener):
+        self._listeners.append(listener)
+
+    def preAdmit(self, requirements):
+        labels = [r['imageLabel'] for r in requirements.values()]
+        missing = self._osmosisLabels.missing(labels)
+        if missing:
+            logging.info("Pre-admission found labels missing from the object store: %(missing)s",
+                         dict(missing=missing))
+
+    def createMany(self, requests):
+        assert globallock.assertLocked()
+        order = sorted(xrange(len(requests)), key=lambda idx: (self._priorityOf(requests[idx][1]), idx))
+        results = [None] * len(requests)
+        if not requests:
+            return results
+        self._cleanup()
+        batch = admissionbatch.AdmissionBatch(self._freePool, self._preemptionCandidates,
+                                              self._priorityOf(requests[order[0]][1]))
+        for idx in order:
+            requirements, allocationInfo = requests[idx]
+            try:
+                results[idx] = self.create(requirements, allocationInfo, batch)
+            except Exception as e:
+                results[idx] = e
+        return results
 
-    def create(self, requirements, allocationInfo):
+    def create(self, requirements, allocationInfo, batch=None):
+        before = time.time()
+        try:
+            return self._create(requirements, allocationInfo, batch)
+        finally:
+            logging.info("Allocation request held the lock for %(duration).3f seconds",
+                         dict(duration=time.time() - before))
+
+    def _create(self, requirements, allocationInfo, batch):
         logging.info("Allocation requested: '%(requirements)s' '%(allocationInfo)s'", dict(
             requirements=requirements, allocationInfo=allocationInfo))
         self._broadcaster.allocationRequested(requirements, allocationInfo)
@@ -24,7 +75,8 @@ class Allocations:
         try:
             priorityInstance = priority.Priority(
                 requirements=requirements, allocationInfo=allocationInfo,
-                freePool=self._freePool, allocations=self._allocations)
+                freePool=self._freePool if batch is None else batch,
+                preemptionCandidates=self._preemptionCandidates if batch is None else batch)
         except priority.OutOfResourcesError:
             self._broadcaster.allocationRejected(reason="noResources")
             raise
@@ -33,15 +85,22 @@ class Allocations:
             alloc = allocation.Allocation(
                 index=self._index, requirements=requirements, allocationInfo=allocationInfo,
                 allocated=allocated, broadcaster=self._broadcaster, freePool=self._freePool,
-                hosts=self._hosts)
+                hosts=self._hosts, heartbeats=self._heartbeats)
         except:
             logging.error("Creating allocation fails, freeing up all allocated hosts")
             for allocated in allocated.values():
                 self._freePool.put(allocated)
             self._broadcaster.allocationRejected(reason="unknown")
             raise
-        self._allocations.append(alloc)
+        self._allocations[alloc.index()] = alloc
+        self._stateMachinesOfAllocation[alloc.index()] = set(alloc.stateMachines())
+        for stateMachine in alloc.stateMachines():
+            self._allocationOfStateMachine[stateMachine] = alloc
+        self._preemptionCandidates.add(alloc)
+        alloc.setDeathCallback(self._allocationDied)
+        alloc.setChangeCallback(self._allocationChanged)
         self._index += 1
+        self._allocationChanged(alloc)
         logging.info("Allocation granted: %(allocated)s", dict(
             allocated={k: v.hostImplementation().id() for k, v in alloc.allocated().iteritems()}))
         return alloc
@@ -49,25 +108,83 @@ class Allocations:
     def byIndex(self, index):
         assert globallock.assertLocked()
         self._cleanup()
-        for alloc in self._allocations:
-            if alloc.index() == index:
-                return alloc
-        raise IndexError("No such allocation")
+        try:
+            return self._allocations[index]
+        except KeyError:
+            raise IndexError("No such allocation")
 
     def all(self):
         assert globallock.assertLocked()
         self._cleanup()
-        return self._allocations
+        return self._allocations.values()
+
+    def allocationOf(self, stateMachine):
+        assert globallock.assertLocked()
+        return self._allocationOfStateMachine.get(stateMachine)
+
+    def publishedStatus(self, index):
+        status = self._published.get(index)
+        if status is None or (status.dead is not None and status.endOfLimboTimestamp < time.time()):
+            raise IndexError("No such allocation")
+        return status
+
+    def heartbeat(self, index):
+        self._heartbeats.heartbeat(self.publishedStatus(index).allocation)
+
+    def _allocationDied(self, alloc):
+        self._preemptionCandidates.remove(alloc)
+        heapq.heappush(self._expiries, (alloc.endOfLimboTimestamp(), alloc.index()))
+        self._allocationChanged(alloc)
+
+    def _allocationChanged(self, alloc):
+        self._unindexStateMachines(alloc)
+        dead = alloc.dead()
+        if dead is None:
+            self._published[alloc.index()] = PublishedStatus(alloc, alloc.done(), None, None)
+        else:
+            self._published[alloc.index()] = PublishedStatus(alloc, None, dead, alloc.endOfLimboTimestamp())
+        for listener in self._listeners:
+            listener.allocationChanged(alloc)
+
+    def _unindexStateMachines(self, alloc):
+        stateMachines = self._stateMachinesOfAllocation.get(alloc.index())
+        if stateMachines is None:
+            return
+        dead = alloc.dead() is not None
+        for stateMachine in [stateMachine for stateMachine in stateMachines
+                             if dead or not alloc.containsStateMachine(stateMachine)]:
+            stateMachines.remove(stateMachine)
+            if self._allocationOfStateMachine.get(stateMachine) is alloc:
+                del self._allocationOfStateMachine[stateMachine]
+        if not stateMachines:
+            del self._stateMachinesOfAllocation[alloc.index()]
 
     def _cleanup(self):
-        self._allocations = [a for a in self._allocations if not a.deadForAWhile()]
+        now = time.time()
+        while self._expiries and self._expiries[0][0] < now:
+            expiry, index = self._expiries[0]
+            alloc = self._allocations.get(index)
+            if alloc is not None and not alloc.deadForAWhile():
+                break
+            heapq.heappop(self._expiries)
+            if alloc is not None:
+                del self._allocations[index]
+                self._published.pop(index, None)
+                for listener in self._listeners:
+                    listener.allocationRemoved(index)
+
+    @staticmethod
+    def _priorityOf(allocationInfo):
+        try:
+            return priority.Priority.absoluteNice(allocationInfo)
+        except Exception:
+            return float("inf")
+
+    def osmosisLabelsCacheStats(self):
+        return self._osmosisLabels.stats()
 
     def _verifyLabelsExistsInOsmosis(self, labels):
-        labels = set(labels)
-        for label in labels:
-            existingLabels = sh.run([
-                "osmosis", "listlabels", label, "--objectStores", self._osmosisServer + ":1010"]).strip()
-            existingLabels = existingLabels.splitlines()
-            if label not in existingLabels:
-                self._broadcaster.allocationRejected(reason="labelDoesNotExist")
-                raise Exception("Label '%s' does not exist on object store" % label)
+        missing = self._osmosisLabels.missing(labels)
+        if missing:
+            self._broadcaster.allocationRejected(reason="labelDoesNotExist")
+            raise Exception("Label '%s' does not exist on object store" % missing[0])
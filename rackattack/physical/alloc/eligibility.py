@@ -0,0 +1,96 @@
+class Eligibility:
+    _MINIMUM_NR_SLOTS_BEFORE_COMPACTION = 64
+
+    def __init__(self):
+        self._reset()
+
+    def add(self, stateMachine):
+        assert stateMachine not in self._slotOf
+        if len(self._slots) >= 2 * len(self._slotOf) + self._MINIMUM_NR_SLOTS_BEFORE_COMPACTION:
+            self._compact()
+        self._insert(stateMachine, stateMachine.hostImplementation().capabilities())
+
+    def remove(self, stateMachine):
+        slot, capabilities = self._slotOf.pop(stateMachine)
+        self._slots[slot] = None
+        clear = ~(1 << slot)
+        self._all &= clear
+        for buckets, key in self._bucketKeys(capabilities):
+            buckets[key] &= clear
+            if not buckets[key]:
+                del buckets[key]
+
+    def __contains__(self, stateMachine):
+        return stateMachine in self._slotOf
+
+    def __len__(self):
+        return len(self._slotOf)
+
+    def all(self):
+        return self._all
+
+    def mask(self, pool, minimumNrNICBondings=0, maximumNrNICBondings=None, tags=None):
+        result = self._byPool.get(pool, 0)
+        if result and (minimumNrNICBondings > 0 or maximumNrNICBondings is not None):
+            inRange = 0
+            for nrNICBondings, bucket in self._byNrNICBondings.iteritems():
+                if nrNICBondings < minimumNrNICBondings:
+                    continue
+                if maximumNrNICBondings is not None and nrNICBondings > maximumNrNICBondings:
+                    continue
+                inRange |= bucket
+            result &= inRange
+        for tag in (tags or dict()).iteritems():
+            if not result:
+                break
+            result &= self._byTag.get(tag, 0)
+        return result
+
+    def maskOf(self, stateMachines):
+        result = 0
+        for stateMachine in stateMachines:
+            result |= 1 << self._slotOf[stateMachine][0]
+        return result
+
+    def stateMachines(self, mask):
+        bits = bin(mask)[:1:-1]
+        result = []
+        slot = bits.find("1")
+        while slot != -1:
+            result.append(self._slots[slot])
+            slot = bits.find("1", slot + 1)
+        return result
+
+    @staticmethod
+    def count(mask):
+        return bin(mask).count("1")
+
+    def _insert(self, stateMachine, capabilities):
+        slot = len(self._slots)
+        self._slots.append(stateMachine)
+        self._slotOf[stateMachine] = (slot, capabilities)
+        bit = 1 << slot
+        self._all |= bit
+        for buckets, key in self._bucketKeys(capabilities):
+            buckets[key] = buckets.get(key, 0) | bit
+
+    def _bucketKeys(self, capabilities):
+        yield self._byPool, capabilities.pool
+        yield self._byNrNICBondings, capabilities.nrNICBondings
+        for tag in capabilities.tags.iteritems():
+            yield self._byTag, tag
+
+    def _compact(self):
+        remaining = [(stateMachine, self._slotOf[stateMachine][1])
+                     for stateMachine in self._slots if stateMachine is not None]
+        self._reset()
+        for stateMachine, capabilities in remaining:
+            self._insert(stateMachine, capabilities)
+
+    def _reset(self):
+        self._slots = []
+        self._slotOf = dict()
+        self._all = 0
+        self._byPool = dict()
+        self._byNrNICBondings = dict()
+        self._byTag = dict()
@@ -1,26 +1,91 @@
 from rackattack.common import globallock
+from rackattack.physical import host
+from rackattack.physical import serveridwildcard
+from rackattack.physical.alloc import eligibility
+import bisect
 
 
 class FreePool:
     def __init__(self, hosts):
         self._hosts = hosts
-        self._pool = []
+        self._eligibility = eligibility.Eligibility()
+        self._sortedIDs = []
+        self._byID = dict()
+        self._generation = 0
 
     def put(self, hostStateMachine):
         assert globallock.assertLocked()
-        self._pool.append(hostStateMachine)
+        assert hostStateMachine not in self._eligibility
+        self._index(hostStateMachine)
+        self._generation += 1
         hostStateMachine.setDestroyCallback(self._hostSelfDestructed)
 
+    def __contains__(self, hostStateMachine):
+        assert globallock.assertLocked()
+        return hostStateMachine in self._eligibility
+
     def all(self):
         assert globallock.assertLocked()
-        for hostStateMachine in self._pool:
+        for hostStateMachine in self._eligibility.stateMachines(self._eligibility.all()):
             yield hostStateMachine
 
+    def eligible(self, requirement):
+        assert globallock.assertLocked()
+        mask = self._eligibility.mask(host.Host.requestedPool(requirement),
+                                      host.Host.requestedMinimumNrNICBondings(requirement),
+                                      host.Host.requestedMaximumNrNICBondings(requirement),
+                                      host.Host.requestedTags(requirement))
+        serverIDWildcard = host.Host.requestedServerIDWildcard(requirement)
+        if serverIDWildcard is not None and mask:
+            mask &= self._eligibility.maskOf(self._matchingServerIDWildcard(serverIDWildcard))
+        return self._eligibility.stateMachines(mask)
+
+    def generation(self):
+        return self._generation
+
+    def nrFree(self, pool=None):
+        assert globallock.assertLocked()
+        if pool is None:
+            return len(self._eligibility)
+        return self._eligibility.count(self._eligibility.mask(pool))
+
     def takeOut(self, hostStateMachine):
         assert globallock.assertLocked()
-        self._pool.remove(hostStateMachine)
+        self._unindex(hostStateMachine)
+
+    def hostConfigurationChanged(self, hostStateMachine):
+        assert globallock.assertLocked()
+        if hostStateMachine not in self._eligibility:
+            return
+        self._unindex(hostStateMachine)
+        self._index(hostStateMachine)
+        self._generation += 1
+
+    def _matchingServerIDWildcard(self, serverIDWildcard):
+        prefix = serveridwildcard.literalPrefix(serverIDWildcard)
+        regex = serveridwildcard.compiled(serverIDWildcard)
+        position = bisect.bisect_left(self._sortedIDs, prefix)
+        matching = []
+        while position < len(self._sortedIDs) and self._sortedIDs[position].startswith(prefix):
+            hostID = self._sortedIDs[position]
+            if regex.match(hostID) is not None:
+                matching.append(self._byID[hostID])
+            position += 1
+        return matching
 
     def _hostSelfDestructed(self, hostStateMachine):
         assert globallock.assertLocked()
         self._hosts.destroy(hostStateMachine)
-        self._pool.remove(hostStateMachine)
+        self._unindex(hostStateMachine)
+
+    def _index(self, hostStateMachine):
+        self._eligibility.add(hostStateMachine)
+        hostID = hostStateMachine.hostImplementation().id()
+        bisect.insort(self._sortedIDs, hostID)
+        self._byID[hostID] = hostStateMachine
+
+    def _unindex(self, hostStateMachine):
+        self._eligibility.remove(hostStateMachine)
+        hostID = hostStateMachine.hostImplementation().id()
+        del self._sortedIDs[bisect.bisect_left(self._sortedIDs, hostID)]
+        del self._byID[hostID]
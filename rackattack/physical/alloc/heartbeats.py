@@ -0,0 +1,74 @@
+from rackattack.common import timer
+import collections
+import logging
+import time
+
+
+class Heartbeats:
+    TIMEOUT = 45
+    _SWEEP_INTERVAL = 1
+    _SLOT_DURATION = 1
+
+    def __init__(self, timeout=TIMEOUT):
+        self._timeout = timeout
+        self._tracked = dict()
+        self._slots = collections.defaultdict(set)
+        self._nextSlot = self._slotOf(time.time())
+        timer.scheduleIn(timeout=self._SWEEP_INTERVAL, callback=self._sweep, tag=self)
+
+    def register(self, key, timeoutCallback):
+        assert key not in self._tracked
+        deadline = time.time() + self._timeout
+        self._tracked[key] = [deadline, timeoutCallback]
+        self._slots[max(self._slotOf(deadline), self._nextSlot)].add(key)
+
+    def unregister(self, key):
+        self._tracked.pop(key, None)
+
+    def heartbeat(self, key):
+        entry = self._tracked.get(key)
+        if entry is not None:
+            entry[0] = time.time() + self._timeout
+
+    def __contains__(self, key):
+        return key in self._tracked
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def expire(self, now):
+        lastSlot = self._slotOf(now)
+        if lastSlot - self._nextSlot > len(self._slots):
+            slots = sorted(slot for slot in self._slots if slot < lastSlot)
+        else:
+            slots = xrange(self._nextSlot, lastSlot)
+        self._nextSlot = max(self._nextSlot, lastSlot)
+        expired = []
+        for slot in slots:
+            for key in self._slots.pop(slot, ()):
+                entry = self._tracked.get(key)
+                if entry is None:
+                    continue
+                deadline = entry[0]
+                if deadline <= now:
+                    del self._tracked[key]
+                    expired.append((key, entry[1]))
+                else:
+                    self._slots[max(self._slotOf(deadline), self._nextSlot)].add(key)
+        if expired:
+            logging.info("%(count)d heartbeats timed out", dict(count=len(expired)))
+        for key, timeoutCallback in expired:
+            try:
+                timeoutCallback()
+            except:
+                logging.exception("Heartbeat timeout callback failed")
+        return [key for key, _ in expired]
+
+    def _sweep(self):
+        try:
+            self.expire(time.time())
+        finally:
+            timer.scheduleIn(timeout=self._SWEEP_INTERVAL, callback=self._sweep, tag=self)
+
+    def _slotOf(self, timestamp):
+        return int(timestamp // self._SLOT_DURATION)
@@ -0,0 +1,112 @@
+class Matching:
+    _FIELDS_IRRELEVANT_FOR_MATCHING = ("imageLabel", "imageHint")
+
+    def __init__(self, requirements):
+        self._groups = self._groupIdenticalRequirements(requirements)
+        self._eligible = [[] for _ in self._groups]
+        self._cursors = [0] * len(self._groups)
+        self._nrAssigned = [0] * len(self._groups)
+        self._groupOfHost = dict()
+        self._excluded = set()
+        self._nrUnassigned = sum(len(names) for _, names in self._groups)
+
+    def addHosts(self, hosts):
+        for host in hosts:
+            hostImplementation = host.hostImplementation()
+            for groupIdx, (requirement, _) in enumerate(self._groups):
+                if hostImplementation.fulfillsRequirement(requirement):
+                    self._eligible[groupIdx].append(host)
+
+    def addEligibleHosts(self, eligibleHostsOfRequirement):
+        for groupIdx, (requirement, _) in enumerate(self._groups):
+            self._eligible[groupIdx].extend(eligibleHostsOfRequirement(requirement))
+
+    def complete(self):
+        return self._nrUnassigned == 0
+
+    def augment(self):
+        for groupIdx, (_, names) in enumerate(self._groups):
+            while self._nrAssigned[groupIdx] < len(names):
+                if not self._augmentingPath(groupIdx, set()):
+                    break
+                self._nrAssigned[groupIdx] += 1
+                self._nrUnassigned -= 1
+        return self.complete()
+
+    def tryWithout(self, hosts):
+        hosts = [host for host in hosts if host not in self._excluded]
+        snapshot = (dict(self._groupOfHost), list(self._nrAssigned), self._nrUnassigned)
+        self._excluded.update(hosts)
+        for host in hosts:
+            groupIdx = self._groupOfHost.pop(host, None)
+            if groupIdx is not None:
+                self._nrAssigned[groupIdx] -= 1
+                self._nrUnassigned += 1
+        self._cursors = [0] * len(self._groups)
+        if self.augment():
+            return True
+        self._groupOfHost, self._nrAssigned, self._nrUnassigned = snapshot
+        self._excluded.difference_update(hosts)
+        return False
+
+    def assignment(self):
+        assert self.complete()
+        hostsOfGroups = [[] for _ in self._groups]
+        for groupIdx, eligible in enumerate(self._eligible):
+            for host in eligible:
+                if self._groupOfHost.get(host) == groupIdx:
+                    hostsOfGroups[groupIdx].append(host)
+        result = dict()
+        for groupIdx, (_, names) in enumerate(self._groups):
+            result.update(zip(names, hostsOfGroups[groupIdx]))
+        return result
+
+    def _augmentingPath(self, groupIdx, visitedGroups):
+        visitedGroups.add(groupIdx)
+        eligible = self._eligible[groupIdx]
+        while self._cursors[groupIdx] < len(eligible):
+            host = eligible[self._cursors[groupIdx]]
+            self._cursors[groupIdx] += 1
+            if host not in self._groupOfHost and host not in self._excluded:
+                self._groupOfHost[host] = groupIdx
+                return True
+        for host in eligible:
+            if host in self._excluded:
+                continue
+            ownerIdx = self._groupOfHost.get(host)
+            if ownerIdx is None:
+                self._groupOfHost[host] = groupIdx
+                return True
+            if ownerIdx in visitedGroups:
+                continue
+            self._groupOfHost[host] = groupIdx
+            if self._augmentingPath(ownerIdx, visitedGroups):
+                return True
+            self._groupOfHost[host] = ownerIdx
+        return False
+
+    @classmethod
+    def _groupIdenticalRequirements(cls, requirements):
+        groups = dict()
+        order = []
+        for name in sorted(requirements.keys()):
+            requirement = requirements[name]
+            key = cls.requirementKey(requirement)
+            if key not in groups:
+                groups[key] = (requirement, [])
+                order.append(key)
+            groups[key][1].append(name)
+        return [groups[key] for key in order]
+
+    @classmethod
+    def requirementKey(cls, requirement):
+        return cls._freeze({field: value for field, value in requirement.iteritems()
+                            if field not in cls._FIELDS_IRRELEVANT_FOR_MATCHING})
+
+    @classmethod
+    def _freeze(cls, value):
+        if isinstance(value, dict):
+            return tuple(sorted((key, cls._freeze(item)) for key, item in value.iteritems()))
+        if isinstance(value, list):
+            return tuple(cls._freeze(item) for item in value)
+        return value
@@ -0,0 +1,95 @@
+from rackattack.virtual import sh
+import collections
+import threading
+import logging
+import time
+import re
+
+
+class OsmosisLabels:
+    POSITIVE_TTL = 10 * 60
+    NEGATIVE_TTL = 5
+    MAX_SIZE = 10000
+
+    def __init__(self, objectStore, positiveTTL=POSITIVE_TTL, negativeTTL=NEGATIVE_TTL, maxSize=MAX_SIZE):
+        self._objectStore = objectStore
+        self._positiveTTL = positiveTTL
+        self._negativeTTL = negativeTTL
+        self._maxSize = maxSize
+        self._cache = collections.OrderedDict()
+        self._condition = threading.Condition(threading.Lock())
+        self._pending = set()
+        self._inFlight = None
+        self._hits = 0
+        self._misses = 0
+        self._listings = 0
+
+    def missing(self, labels):
+        labels = set(labels)
+        with self._condition:
+            exist = dict()
+            for label in labels:
+                cached = self._lookup(label)
+                if cached is not None:
+                    exist[label] = cached
+            unresolved = labels - set(exist)
+            self._hits += len(exist)
+            self._misses += len(unresolved)
+            while unresolved:
+                if self._inFlight is None:
+                    listed = self._listAndStore(self._pending | unresolved)
+                    exist.update((label, listed[label]) for label in unresolved)
+                    break
+                self._pending.update(unresolved - self._inFlight)
+                self._condition.wait()
+                for label in list(unresolved):
+                    cached = self._lookup(label)
+                    if cached is not None:
+                        exist[label] = cached
+                        unresolved.remove(label)
+            return sorted(label for label, exists in exist.iteritems() if not exists)
+
+    def stats(self):
+        with self._condition:
+            return dict(hits=self._hits, misses=self._misses, listings=self._listings, size=len(self._cache))
+
+    def _listAndStore(self, batch):
+        self._pending = set()
+        self._inFlight = batch
+        self._listings += 1
+        self._condition.release()
+        try:
+            existing = self._listLabels(batch)
+        finally:
+            self._condition.acquire()
+            self._inFlight = None
+            self._condition.notify_all()
+        now = time.time()
+        result = dict()
+        for label in batch:
+            result[label] = label in existing
+            ttl = self._positiveTTL if result[label] else self._negativeTTL
+            self._store(label, result[label], now + ttl)
+        return result
+
+    def _listLabels(self, labels):
+        regex = "^(%s)$" % "|".join(re.escape(label) for label in sorted(labels))
+        logging.info("Listing %(nrLabels)d labels in the object store", dict(nrLabels=len(labels)))
+        output = sh.run(["osmosis", "listlabels", regex, "--objectStores", self._objectStore])
+        return set(output.strip().splitlines())
+
+    def _lookup(self, label):
+        entry = self._cache.pop(label, None)
+        if entry is None:
+            return None
+        exists, expiry = entry
+        if expiry < time.time():
+            return None
+        self._cache[label] = entry
+        return exists
+
+    def _store(self, label, exists, expiry):
+        self._cache.pop(label, None)
+        self._cache[label] = (exists, expiry)
+        while len(self._cache) > self._maxSize:
+            self._cache.popitem(last=False)
@@ -0,0 +1,39 @@
+from rackattack.physical.alloc import priority
+import bisect
+
+
+class PreemptionCandidates:
+    def __init__(self):
+        self._keys = []
+        self._allocations = []
+
+    def add(self, allocation):
+        key = self._key(allocation)
+        position = bisect.bisect_left(self._keys, key)
+        self._keys.insert(position, key)
+        self._allocations.insert(position, allocation)
+
+    def remove(self, allocation):
+        key = self._key(allocation)
+        position = bisect.bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            del self._keys[position]
+            del self._allocations[position]
+
+    def nicerThan(self, absoluteNice):
+        for position in xrange(len(self._allocations)):
+            if position >= len(self._allocations):
+                return
+            negatedNice, _ = self._keys[position]
+            if -negatedNice <= absoluteNice:
+                return
+            allocation = self._allocations[position]
+            if allocation.dead() is None:
+                yield allocation
+
+    def __len__(self):
+        return len(self._allocations)
+
+    @staticmethod
+    def _key(allocation):
+        return (-priority.Priority.absoluteNice(allocation.allocationInfo()), -allocation.index())
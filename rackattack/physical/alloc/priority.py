@@ -1,3 +1,4 @@
+from rackattack.physical.alloc import matching
 import collections
 
 
@@ -11,60 +12,48 @@ class OutOfResourcesError(Exception):
 class Priority:
     _NICE = {'user': (0, 1), 'racktest': (0.2, 1.2), 'dirbalak': (0.1, 1.1), 'default': (1, 2)}
 
-    def __init__(self, requirements, allocationInfo, freePool, allocations):
+    def __init__(self, requirements, allocationInfo, freePool, preemptionCandidates):
         assert len(requirements) > 0
         self._requirements = requirements
         self._allocationInfo = allocationInfo
         self._freePool = freePool
-        self._allocations = allocations
+        self._preemptionCandidates = preemptionCandidates
         self._allocated = self._allocate()
 
     def allocated(self):
         return self._allocated
 
-    def _absoluteNice(self, allocationInfo):
-        range = self._NICE.get(allocationInfo['purpose'], self._NICE['default'])
+    @classmethod
+    def absoluteNice(cls, allocationInfo):
+        range = cls._NICE.get(allocationInfo['purpose'], cls._NICE['default'])
         return (range[1] - range[0]) * allocationInfo['nice'] + range[0]
 
-    def _allocationsSortedByAscendingAge(self):
-        livingAllocations = [allocation for allocation in self._allocations if allocation.dead() is None]
-        livingAllocationsFromOldestToYoungest = list(livingAllocations)
-        livingAllocationsFromYoungestToOldest = reversed(livingAllocationsFromOldestToYoungest)
-        return livingAllocationsFromYoungestToOldest
-
-    def _allocationsStableSortedByDescendingNice(self, allocations):
-        allocations = list(allocations)
-        allocations.sort(key=lambda x: -self._absoluteNice(x.allocationInfo()))
-        return allocations
-
-    def _freeAndNicer(self):
-        result = [Host(s, None) for s in self._freePool.all()]
-        myNice = self._absoluteNice(self._allocationInfo)
-        allocationsFromYoungestToOldest = self._allocationsSortedByAscendingAge()
-        nicerAllocationsFromYoungestToOldest = \
-            [allocation for allocation in allocationsFromYoungestToOldest if
-             self._absoluteNice(allocation.allocationInfo()) > myNice]
-        nicerAllocationsSortedByDescendingNiceAndByAscendingAge = \
-            self._allocationsStableSortedByDescendingNice(nicerAllocationsFromYoungestToOldest)
-        for allocation in nicerAllocationsSortedByDescendingNiceAndByAscendingAge:
-            result += [Host(s, allocation) for s in allocation.allocated().values()]
-        return result
+    def _nicerAllocationsInPreemptionOrder(self):
+        return self._preemptionCandidates.nicerThan(self.absoluteNice(self._allocationInfo))
 
     def _allocate(self):
-        freeAndNicer = self._freeAndNicer()
-        allocated = []
-        for name, requirement in self._requirements.iteritems():
-            fulfilled = False
-            for host in freeAndNicer:
-                if host.stateMachine.hostImplementation().fulfillsRequirement(requirement):
-                    allocated.append((name, host))
-                    freeAndNicer.remove(host)
-                    fulfilled = True
-                    break
-            if not fulfilled:
-                raise OutOfResourcesError(
-                    "Not enough machines free or busy doing lower priority tasks to allocate "
-                    "requested machines")
+        engine = matching.Matching(self._requirements)
+        engine.addEligibleHosts(self._freePool.eligible)
+        engine.augment()
+        preemptionCandidates = []
+        allocationOfStateMachine = dict()
+        for allocation in self._nicerAllocationsInPreemptionOrder():
+            if engine.complete():
+                break
+            stateMachines = allocation.stateMachines()
+            for stateMachine in stateMachines:
+                allocationOfStateMachine[stateMachine] = allocation
+            engine.addHosts(stateMachines)
+            engine.augment()
+            preemptionCandidates.append(allocation)
+        if not engine.complete():
+            raise OutOfResourcesError(
+                "Not enough machines free or busy doing lower priority tasks to allocate "
+                "requested machines")
+        for allocation in reversed(preemptionCandidates):
+            engine.tryWithout(allocation.stateMachines())
+        allocated = [(name, Host(stateMachine, allocationOfStateMachine.get(stateMachine)))
+                     for name, stateMachine in engine.assignment().iteritems()]
         self._withdrawExistingAllocations(allocated)
         self._takeOutOfFreePool(allocated)
         return {name: h.stateMachine for name, h in allocated}
@@ -73,7 +62,7 @@ class Priority:
         prioritizedUser = self._allocationInfo.get("user", "Unknown")
         prioritizedPurpose = self._allocationInfo["purpose"]
         prioritizedNice = self._allocationInfo["nice"]
-        prioritizedAbsNice = self._absoluteNice(self._allocationInfo)
+        prioritizedAbsNice = self.absoluteNice(self._allocationInfo)
         msg = "An allocation with a higher priority needs your resources; User '%(user)s' with purpose " \
               "'%(purpose)s', nice: '%(nice)s' (ABSOLUTE NICE: '%(absNice)s') trumps your allocation: " % \
               dict(user=prioritizedUser, purpose=prioritizedPurpose, nice=prioritizedNice,
@@ -81,7 +70,7 @@ class Priority:
         toWithdraw = set([h[1].allocation for h in allocated if h[1].allocation is not None])
         for allocation in toWithdraw:
             info = allocation.allocationInfo()
-            myAbsNice = self._absoluteNice(info)
+            myAbsNice = self.absoluteNice(info)
             allocationMsg = "User: %(user)s, purpose: %(purpose)s, nice: %(nice)s, " \
                             "(ABSOLUTE NICE:%(absNice)s)" % dict(user=info.get("user", "Unknown"),
                                                                  purpose=info["purpose"],
@@ -91,5 +80,5 @@ class Priority:
             allocation.withdraw(curMsg)
 
     def _takeOutOfFreePool(self, allocated):
-        for name, host in allocated:
-            self._freePool.takeOut(host.stateMachine)
+        for name, allocatedHost in allocated:
+            self._freePool.takeOut(allocatedHost.stateMachine)
@@ -0,0 +1,36 @@
+from rackattack.common import dnsmasq
+import contextlib
+import logging
+
+
+class BatchedReloads:
+    _batchDepth = 0
+    _reloadPending = False
+
+    @contextlib.contextmanager
+    def batch(self):
+        self._batchDepth += 1
+        try:
+            yield
+        finally:
+            self._batchDepth -= 1
+            if self._batchDepth == 0 and self._reloadPending:
+                self._reloadPending = False
+                self._reloadImmediately()
+
+    def addMany(self, macIPPairs):
+        logging.info("Adding %(nrEntries)d DHCP reservations in one reload", dict(nrEntries=len(macIPPairs)))
+        with self.batch():
+            for mac, ipAddress in macIPPairs:
+                self.addIfNotAlready(mac, ipAddress)
+
+    def _reload(self):
+        if self._batchDepth > 0:
+            self._reloadPending = True
+            return
+        self._reloadImmediately()
+
+
+class BatchedDNSMasq(BatchedReloads, dnsmasq.DNSMasq):
+    def _reloadImmediately(self):
+        dnsmasq.DNSMasq._reload(self)
@@ -4,6 +4,8 @@ RUNTIME_VAR_DIR = "/var/lib/rackattackphysical"
 ROOT_PASSWORD = 'rackattack'
 CONFIGURATION_FILE = "/etc/rackattack-physical/conf.yaml"
 RACK_YAML = "/etc/rackattack-physical/rack.yaml"
+RACK_YAML_FRAGMENTS_DIRECTORY = None
+RACK_YAML_PARSING_PROCESSES = 0
 LOG_CONFIG = "/etc/rackattack-physical/log.conf"
 SERIAL_LOGS_DIRECTORY = os.path.join(RUNTIME_VAR_DIR, "seriallogs")
 MANAGED_POST_MORTEM_PACKS_DIRECTORY = os.path.join(RUNTIME_VAR_DIR, "postMortemPacks")
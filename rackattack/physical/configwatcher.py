@@ -0,0 +1,53 @@
+from twisted.internet import inotify
+from twisted.internet import reactor
+from twisted.python import filepath
+import logging
+import os
+
+
+class ConfigWatcher:
+    DEBOUNCE_INTERVAL = 2
+    _MASK = inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_MOVED_FROM | inotify.IN_DELETE
+
+    def __init__(self, reloadCallback, rackYAML, fragmentsDirectory=None,
+                 debounceInterval=DEBOUNCE_INTERVAL, notifier=None, callLater=reactor.callLater):
+        self._reloadCallback = reloadCallback
+        self._rackYAML = None
+        self._shardDirectories = set()
+        if os.path.isdir(rackYAML):
+            self._shardDirectories.add(os.path.abspath(rackYAML))
+        else:
+            self._rackYAML = os.path.abspath(rackYAML)
+        if fragmentsDirectory is not None:
+            self._shardDirectories.add(os.path.abspath(fragmentsDirectory))
+        self._debounceInterval = debounceInterval
+        self._callLater = callLater
+        self._pending = None
+        if notifier is None:
+            notifier = inotify.INotify()
+            notifier.startReading()
+        directories = set(self._shardDirectories)
+        if self._rackYAML is not None:
+            directories.add(os.path.dirname(self._rackYAML))
+        for directory in sorted(directories):
+            logging.info("Watching %(directory)s for configuration changes", dict(directory=directory))
+            notifier.watch(filepath.FilePath(directory), mask=self._MASK, callbacks=[self._changed])
+
+    def _changed(self, ignored, path, mask):
+        if not self._isConfigurationFile(path.path):
+            return
+        if self._pending is not None and self._pending.active():
+            self._pending.reset(self._debounceInterval)
+            return
+        logging.info("%(path)s was modified, reloading configuration in %(interval)s seconds",
+                     dict(path=path.path, interval=self._debounceInterval))
+        self._pending = self._callLater(self._debounceInterval, self._debounced)
+
+    def _isConfigurationFile(self, path):
+        if path == self._rackYAML:
+            return True
+        return os.path.dirname(path) in self._shardDirectories and path.endswith(".yaml")
+
+    def _debounced(self):
+        self._pending = None
+        self._reloadCallback()
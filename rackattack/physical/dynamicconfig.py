@@ -1,15 +1,46 @@
 from rackattack.common import globallock
 from rackattack.physical import config
 from rackattack.physical import host
+from rackattack.physical import network
 from rackattack.common import hoststatemachine
 import yaml
+import collections
+import json
+import hashlib
 import logging
+import multiprocessing
 import Queue
 import threading
+import os
+
+
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_Shard = collections.namedtuple("_Shard", "mtime contentHash hosts")
+
+
+def _parseShard(contents):
+    rack = yaml.load(contents, Loader=_YAML_LOADER)
+    if rack is None:
+        return []
+    return rack.get('HOSTS', [])
+
+
+def _parseShards(contents, pool):
+    if pool is None or len(contents) <= 1:
+        return [_parseShard(shardContents) for shardContents in contents]
+    return pool.map(_parseShard, contents)
+
+
+def createParsingPool(nrProcesses):
+    if nrProcesses <= 1:
+        return None
+    logging.info("Parsing configuration shards in %(nrProcesses)d processes", dict(nrProcesses=nrProcesses))
+    return multiprocessing.Pool(nrProcesses)
 
 
 class DynamicConfig(threading.Thread):
-    def __init__(self, hosts, dnsmasq, inaugurate, tftpboot, freePool, allocations, reclaimHost):
+    def __init__(self, hosts, dnsmasq, inaugurate, tftpboot, freePool, allocations, reclaimHost,
+                 parsingPool=None):
         threading.Thread.__init__(self)
         self.daemon = True
         self._hostsStateMachines = hosts
@@ -19,12 +50,25 @@ class DynamicConfig(threading.Thread):
         self._freePool = freePool
         self._allocations = allocations
         self._reclaimHost = reclaimHost
+        self._parsingPool = parsingPool
         self._rack = []
         self._hosts = dict()
+        self._stateMachines = dict()
+        self._hostsByState = {state: dict() for state in host.STATES}
+        self._hostCountsByPool = dict()
+        self._indexedAs = dict()
+        self._hostHashes = dict()
+        self._shards = dict()
+        self._signature = None
+        self._appliedContent = None
         self._queue = Queue.Queue()
+        self._listeners = []
         threading.Thread.start(self)
         self.asyncReload()
 
+    def addListener(self, listener):
+        self._listeners.append(listener)
+
     def asyncReload(self):
         logging.info("Queueing a dynamic configuration request...")
         self._queue.put(None)
@@ -32,22 +76,81 @@ class DynamicConfig(threading.Thread):
     def run(self):
         while True:
             self._queue.get(block=True)
+            self._coalescePendingRequests()
             try:
                 self._reload()
             except Exception as e:
                 logging.exception("Could not process dynamic configuration request %(message)s.",
                                   dict(message=str(e)))
 
-    def _loadRackYAML(self):
-        logging.info("Reading %(file)s", dict(file=config.RACK_YAML))
-        with open(config.RACK_YAML) as f:
-            return yaml.load(f.read())
+    def _coalescePendingRequests(self):
+        nrCoalesced = 0
+        while True:
+            try:
+                self._queue.get(block=False)
+            except Queue.Empty:
+                break
+            nrCoalesced += 1
+        if nrCoalesced > 0:
+            logging.info("Coalesced %(nrCoalesced)d pending dynamic configuration requests",
+                         dict(nrCoalesced=nrCoalesced))
+
+    def _configurationFiles(self):
+        if os.path.isdir(config.RACK_YAML):
+            files = [(filename, os.path.basename(filename)[:-len(".yaml")])
+                     for filename in self._shardsIn(config.RACK_YAML)]
+        else:
+            files = [(config.RACK_YAML, None)]
+        directory = config.RACK_YAML_FRAGMENTS_DIRECTORY
+        if directory is not None and os.path.isdir(directory):
+            files.extend((filename, None) for filename in self._shardsIn(directory))
+        return files
+
+    def _shardsIn(self, directory):
+        return [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+                if filename.endswith(".yaml")]
+
+    def _readConfigurationFiles(self, filenames):
+        contents = []
+        for filename in filenames:
+            logging.info("Reading %(file)s", dict(file=filename))
+            with open(filename) as f:
+                contents.append(f.read())
+        return contents
 
-    def _allocationsThatContainStateMachine(self, stateMachine):
-        allocations = self._allocations.all()
-        for allocation in allocations:
-            if stateMachine in allocation.allocated().values():
-                yield allocation
+    def _loadShards(self, signature):
+        outdated = [(filename, rackID, mtime) for filename, rackID, mtime in signature
+                    if filename not in self._shards or self._shards[filename].mtime != mtime]
+        contents = self._readConfigurationFiles([filename for filename, _, _ in outdated])
+        toParse = []
+        for (filename, rackID, mtime), shardContents in zip(outdated, contents):
+            contentHash = hashlib.md5(shardContents).hexdigest()
+            shard = self._shards.get(filename)
+            if shard is not None and shard.contentHash == contentHash:
+                self._shards[filename] = shard._replace(mtime=mtime)
+            else:
+                toParse.append((filename, rackID, mtime, contentHash, shardContents))
+        if toParse:
+            logging.info("Parsing %(nrShards)d configuration shards", dict(nrShards=len(toParse)))
+        parsed = _parseShards([shardContents for _, _, _, _, shardContents in toParse], self._parsingPool)
+        for (filename, rackID, mtime, contentHash, _), hosts in zip(toParse, parsed):
+            self._validateShard(filename, rackID, hosts)
+            self._shards[filename] = _Shard(mtime=mtime, contentHash=contentHash, hosts=hosts)
+        filenames = set(filename for filename, _, _ in signature)
+        for filename in [filename for filename in self._shards if filename not in filenames]:
+            del self._shards[filename]
+
+    def _validateShard(self, filename, rackID, hosts):
+        if rackID is None:
+            return
+        for hostData in hosts:
+            actual = hostData.get("topology", dict()).get("rackID")
+            if actual is None:
+                raise ValueError("Host %(hostID)s in shard %(filename)s has no topology.rackID" %
+                                 dict(hostID=hostData.get("id"), filename=filename))
+            if actual != rackID:
+                raise ValueError("Host %(hostID)s of rack %(actual)s found in the shard of rack %(rackID)s" %
+                                 dict(hostID=hostData.get("id"), actual=actual, rackID=rackID))
 
     def _takeHostOffline(self, hostData, oldState):
         hostInstance = self._hosts[hostData['id']]
@@ -56,13 +159,13 @@ class DynamicConfig(threading.Thread):
         if stateMachine is not None:
             logging.info("Destroying state machine of host %(id)s", dict(id=hostData['id']))
             stateMachine.destroy()
-            for allocation in self._allocationsThatContainStateMachine(stateMachine):
-                if allocation.dead() is None:
-                    logging.error("Allocation %(id)s is not dead although its node was killed",
-                                  dict(id=allocation.index()))
-                    allocation.withdraw("node %(id)s taken offline" % dict(id=hostData['id']))
-            if stateMachine in self._hostsStateMachines.all():
-                logging.error("State machine was not removed from hosts pool")
+            allocation = self._allocations.allocationOf(stateMachine)
+            if allocation is not None:
+                logging.error("Allocation %(id)s is not dead although its node was killed",
+                              dict(id=allocation.index()))
+                allocation.withdraw("node %(id)s taken offline" % dict(id=hostData['id']))
+            if self._findStateMachine(hostInstance) is not None:
+                logging.error("State machine was not destroyed")
                 self._hostsStateMachines.destroy(stateMachine)
         hostInstance.turnOff()
 #        if oldState == host.STATES.ONLINE:
@@ -94,19 +197,15 @@ class DynamicConfig(threading.Thread):
             logging.error("Could not find a state machine for host ID: '%(hostID)s'",
                           dict(hostID=hostID))
             return
-        allocations = self._allocationsThatContainStateMachine(stateMachine)
-        wasDetachedFromAnAllocation = False
-        for allocation in allocations:
-            if allocation.dead() is None:
-                logging.info("Detaching host %(hostID)s from allocation %(id)s...",
-                             dict(hostID=hostID, id=allocation.index()))
-                if stateMachine in allocation.allocated().values():
-                    allocation.detachHost(stateMachine)
-                    wasDetachedFromAnAllocation = True
-        if not wasDetachedFromAnAllocation:
+        allocation = self._allocations.allocationOf(stateMachine)
+        if allocation is not None:
+            logging.info("Detaching host %(hostID)s from allocation %(id)s...",
+                         dict(hostID=hostID, id=allocation.index()))
+            allocation.detachHost(stateMachine)
+        else:
             stateMachine.destroy()
-        assert stateMachine not in self._hostsStateMachines.all()
-        assert stateMachine not in self._freePool.all()
+        assert self._findStateMachine(hostInstance) is None
+        assert stateMachine not in self._freePool
 
     def _registeredHost(self, hostID):
         return hostID in self._hosts
@@ -127,6 +226,7 @@ class DynamicConfig(threading.Thread):
             elif newState == host.STATES.DETACHED:
                 logging.info("Host %(hostID)s has been detached", dict(hostID=hostID))
                 self._detachHost(hostData, oldState=oldState)
+        capabilities = _host.capabilities()
         pool = hostData.get("pool", host.Host.DEFAULT_POOL)
         _host.setPool(pool)
         targetDevice = hostData.get("targetDevice", host.Host.DEFAULT_TARGET_DEVICE)
@@ -137,6 +237,12 @@ class DynamicConfig(threading.Thread):
         _host.setOtherMACAddresses(otherMACAddresses)
         targetDevice = hostData.get("targetDeviceType", host.Host.DEFAULT_TARGET_DEVICE_TYPE)
         _host.setTargetDeviceType(targetDevice)
+        tags = hostData.get("tags", dict())
+        _host.setTags(tags)
+        if _host.capabilities() != capabilities:
+            stateMachine = self._findStateMachine(_host)
+            if stateMachine is not None:
+                self._freePool.hostConfigurationChanged(stateMachine)
         serialPort = hostData.get("serialPort", 0)
         if serialPort != _host.getSerialPort():
             _host.setSerialPort(serialPort)
@@ -147,24 +253,74 @@ class DynamicConfig(threading.Thread):
 
     def _reload(self):
         logging.info("Reloading configuration...")
-        rack = self._loadRackYAML()
-        logging.info("Configuration file was read. Acquiring lock...")
+        files = self._configurationFiles()
+        signature = [(filename, rackID, os.stat(filename).st_mtime) for filename, rackID in files]
+        filenames = [filename for filename, _ in files]
+        if signature == self._signature:
+            logging.info("Configuration files were not modified since the last reload")
+            return
+        self._loadShards(signature)
+        content = [(filename, self._shards[filename].contentHash) for filename in filenames]
+        if content != self._appliedContent:
+            self._apply(dict(HOSTS=[hostData for filename in filenames
+                                    for hostData in self._shards[filename].hosts]))
+        else:
+            logging.info("Configuration files were touched but their content did not change")
+        self._signature = signature
+        self._appliedContent = content
+
+    def _apply(self, rack):
+        changed, removed = self._diff(rack['HOSTS'])
+        logging.info("Configuration file was read: %(nrChanged)d hosts added or changed, %(nrRemoved)d "
+                     "removed", dict(nrChanged=len(changed), nrRemoved=len(removed)))
+        if not changed and not removed:
+            return
+        logging.info("Acquiring lock...")
         with globallock.lock():
             logging.info("Processing dynamic configuration request...")
-            for hostData in rack['HOSTS']:
-                self._normalizeStateCase(hostData)
+            self._reserveAddressesOfNewHosts([hostData for hostData, _ in changed
+                                              if not self._registeredHost(hostData["id"])])
+            for hostData, contentHash in changed:
                 if self._registeredHost(hostData["id"]):
                     self._registeredHostConfiguration(hostData)
                 else:
                     self._newHostInConfiguration(hostData)
+                self._hostHashes[hostData["id"]] = contentHash
+                for listener in self._listeners:
+                    listener.hostChanged(self._hosts[hostData["id"]])
+            for hostID in removed:
+                logging.warning("Host %(hostID)s was removed from the configuration file, leaving it in its "
+                                "current state", dict(hostID=hostID))
+                del self._hostHashes[hostID]
+
+    def _diff(self, hostsData):
+        changed = []
+        hostIDs = set()
+        for hostData in hostsData:
+            self._normalizeStateCase(hostData)
+            hostIDs.add(hostData["id"])
+            contentHash = hashlib.md5(json.dumps(hostData, sort_keys=True, default=repr)).hexdigest()
+            if self._hostHashes.get(hostData["id"]) != contentHash:
+                changed.append((hostData, contentHash))
+        removed = [hostID for hostID in self._hostHashes if hostID not in hostIDs]
+        return changed, removed
+
+    def _reserveAddressesOfNewHosts(self, hostsData):
+        if not hostsData:
+            return
+        logging.info("Adding DHCP reservations of %(nrHosts)d new hosts", dict(nrHosts=len(hostsData)))
+        firstIndex = self._availableIndex()
+        self._dnsmasq.addMany([(hostData['primaryMAC'], network.ipAddressFromHostIndex(firstIndex + idx))
+                               for idx, hostData in enumerate(hostsData)])
 
     def _newHostInConfiguration(self, hostData):
         chewed = dict(hostData)
         hostInstance = host.Host(index=self._availableIndex(), **chewed)
+        hostInstance.setChangeCallback(self._indexHost)
+        self._indexHost(hostInstance)
         hostID = hostInstance.id()
         logging.info("Adding host %(hostID)s - %(ip)s", dict(hostID=hostID, ip=hostInstance.ipAddress()))
         state = hostInstance.state()
-        self._dnsmasq.add(hostData['primaryMAC'], hostInstance.ipAddress())
         if state == host.STATES.ONLINE:
             self._startUsingHost(hostInstance)
             logging.info('Host %(hostID)s added in online state', dict(hostID=hostID))
@@ -181,20 +337,45 @@ class DynamicConfig(threading.Thread):
             reclaimHost=self._reclaimHost,
             freshVMJustStarted=False)
         self._hostsStateMachines.add(stateMachine)
+        self._stateMachines[hostInstance.id()] = stateMachine
         self._freePool.put(stateMachine)
 
     def _findStateMachine(self, hostInstance):
-        for stateMachine in self._hostsStateMachines.all():
-            if stateMachine.hostImplementation() is hostInstance:
-                return stateMachine
-        return None
+        stateMachine = self._stateMachines.get(hostInstance.id())
+        if stateMachine is None:
+            return None
+        if stateMachine.state() == hoststatemachine.STATE_DESTROYED:
+            del self._stateMachines[hostInstance.id()]
+            return None
+        return stateMachine
 
     def _availableIndex(self):
         return 1 + len(self._hosts)
 
+    def _indexHost(self, hostInstance):
+        hostID = hostInstance.id()
+        indexedAs = (hostInstance.state(), hostInstance.pool())
+        previous = self._indexedAs.get(hostID)
+        if previous == indexedAs:
+            return
+        if previous is not None:
+            state, pool = previous
+            del self._hostsByState[state][hostID]
+            counts = self._hostCountsByPool[pool]
+            counts[state] -= 1
+            if sum(counts.itervalues()) == 0:
+                del self._hostCountsByPool[pool]
+        state, pool = indexedAs
+        self._hostsByState[state][hostID] = hostInstance
+        self._hostCountsByPool.setdefault(pool, collections.Counter())[state] += 1
+        self._indexedAs[hostID] = indexedAs
+
     def _getHostsByState(self, state):
-        return {hostID: host for (hostID, host) in self._hosts.iteritems() if
-                host.state() == state}
+        return dict(self._hostsByState[state])
+
+    def poolSummary(self):
+        return {pool: {state: counts[state] for state in host.STATES}
+                for pool, counts in self._hostCountsByPool.iteritems()}
 
     def getOfflineHosts(self):
         return self._getHostsByState(host.STATES.OFFLINE)
@@ -2,9 +2,10 @@ from rackattack.physical import ipmi
 from rackattack.physical import network
 from rackattack.physical import config
 from rackattack.physical import serialoverlan
+from rackattack.physical import serveridwildcard
+import collections
 import logging
 import enum
-import re
 
 
 class Enum(set):
@@ -17,6 +18,10 @@ class Enum(set):
 STATES = Enum(["ONLINE", "OFFLINE", "DETACHED"])
 
 
+Capabilities = collections.namedtuple("Capabilities",
+                                      "pool nrNICBondings targetDevice targetDeviceType tags")
+
+
 class Host:
     DEFAULT_POOL = "default"
     DEFAULT_TARGET_DEVICE = None
@@ -25,7 +30,7 @@ class Host:
 
     def __init__(self, index, id, ipmiLogin, primaryMAC, secondaryMAC, topology, state, pool=None,
                  targetDevice=None, NICBondings=None, targetDeviceType=None, otherMACAddresses=None,
-                 serialPort=0):
+                 serialPort=0, tags=None):
         self._index = index
         self._id = id
         self._ipmiLogin = ipmiLogin
@@ -35,6 +40,11 @@ class Host:
         if pool is None:
             pool = self.DEFAULT_POOL
         self._pool = pool
+        if tags is None:
+            tags = dict()
+        self._tags = tags
+        self._capabilities = None
+        self._changeCallback = None
         self.setState(state)
         self._ipmiLogin = ipmiLogin
         self._ipmi = ipmi.IPMI(**ipmiLogin)
@@ -81,6 +91,22 @@ class Host:
             logging.info("Moving host %(hostID)s from pool %(oldPool)s to %(newPool)s",
                          dict(hostID=self._id, oldPool=self._pool, newPool=pool))
             self._pool = pool
+            self._refreshCapabilities()
+            self._changed()
+
+    def tags(self):
+        return self._tags
+
+    def setTags(self, tags):
+        assert isinstance(tags, dict)
+        if tags != self._tags:
+            logging.info("Changing tags of %(hostID)s from %(old)s to %(new)s",
+                         dict(hostID=self._id, old=self._tags, new=tags))
+            self._tags = tags
+            self._refreshCapabilities()
+
+    def capabilities(self):
+        return self._capabilities
 
     def rootSSHCredentials(self):
         return dict(hostname=self.ipAddress(), username="root", password=config.ROOT_PASSWORD)
@@ -102,23 +128,52 @@ class Host:
         if reason is not None:
             self._reasonForDestruction = reason
 
-    def fulfillsRequirement(self, requirement):
-        requestedPool = requirement.get("pool", self.DEFAULT_POOL)
+    @classmethod
+    def requestedPool(cls, requirement):
+        requestedPool = requirement.get("pool", cls.DEFAULT_POOL)
         if requestedPool is None:
-            requestedPool = self.DEFAULT_POOL
-        if requestedPool != self.pool():
-            return False
-        minimumNrNICBondings = requirement.get("hardwareConstraints", dict()).get("minimumNrNICBondings", 0)
-        if len(self.getNICBondings()) < minimumNrNICBondings:
-            return False
+            requestedPool = cls.DEFAULT_POOL
+        return requestedPool
+
+    @staticmethod
+    def requestedMinimumNrNICBondings(requirement):
+        return requirement.get("hardwareConstraints", dict()).get("minimumNrNICBondings", 0)
+
+    @staticmethod
+    def requestedMaximumNrNICBondings(requirement):
         maximumNrNICBondings = requirement.get("hardwareConstraints", dict()).get("maximumNrNICBondings",
                                                                                   None)
         if maximumNrNICBondings is not None:
             assert isinstance(maximumNrNICBondings, int)
-            if len(self.getNICBondings()) > minimumNrNICBondings:
-                return False
+        return maximumNrNICBondings
+
+    @staticmethod
+    def requestedTags(requirement):
+        tags = requirement.get("hardwareConstraints", dict()).get("tags", dict())
+        assert isinstance(tags, dict)
+        return tags
+
+    @staticmethod
+    def requestedServerIDWildcard(requirement):
         wildcard = requirement.get("serverIDWildcard", None)
-        if wildcard is not None and wildcard:
+        if not wildcard:
+            return None
+        return wildcard
+
+    def fulfillsRequirement(self, requirement):
+        capabilities = self._capabilities
+        if self.requestedPool(requirement) != capabilities.pool:
+            return False
+        if capabilities.nrNICBondings < self.requestedMinimumNrNICBondings(requirement):
+            return False
+        maximumNrNICBondings = self.requestedMaximumNrNICBondings(requirement)
+        if maximumNrNICBondings is not None and capabilities.nrNICBondings > maximumNrNICBondings:
+            return False
+        for tag, value in self.requestedTags(requirement).iteritems():
+            if capabilities.tags.get(tag) != value:
+                return False
+        wildcard = self.requestedServerIDWildcard(requirement)
+        if wildcard is not None:
             assert isinstance(wildcard, str), str(wildcard)
             if not self._doesSearchTermMatchWildcardPattern(self._id, wildcard):
                 return False
@@ -153,6 +208,14 @@ class Host:
     def setState(self, state):
         assert state in STATES, state
         self._state = state
+        self._changed()
+
+    def setChangeCallback(self, callback):
+        self._changeCallback = callback
+
+    def _changed(self):
+        if self._changeCallback is not None:
+            self._changeCallback(self)
 
     def targetDevice(self):
         return self._targetDevice
@@ -162,6 +225,7 @@ class Host:
             logging.info("Changing target device of %(hostID)s from %(old)s to %(new)s",
                          dict(hostID=self._id, old=self._targetDevice, new=targetDevice))
             self._targetDevice = targetDevice
+            self._refreshCapabilities()
 
     def targetDeviceType(self):
         return self._targetDeviceType
@@ -171,6 +235,7 @@ class Host:
             logging.info("Changing target device type of %(hostID)s from %(old)s to %(new)s",
                          dict(hostID=self._id, old=self._targetDeviceType, new=targetDeviceType))
             self._targetDeviceType = targetDeviceType
+            self._refreshCapabilities()
 
     def getNICBondings(self):
         return self._NICBondings
@@ -182,6 +247,7 @@ class Host:
                          dict(hostID=self._id, old=self._NICBondings, new=NICBondings))
 
             self._NICBondings = NICBondings
+            self._refreshCapabilities()
 
     def setOtherMACAddresses(self, otherMACAddresses):
         assert isinstance(otherMACAddresses, dict)
@@ -205,9 +271,12 @@ class Host:
 
     @staticmethod
     def _doesSearchTermMatchWildcardPattern(searchTerm, wildcard):
-        regexPattern = ".*".join([re.escape(part) for part in wildcard.split("*")]) + "$"
-        regex = re.compile(regexPattern)
-        return regex.match(searchTerm) is not None
+        return serveridwildcard.matches(searchTerm, wildcard)
+
+    def _refreshCapabilities(self):
+        self._capabilities = Capabilities(pool=self._pool, nrNICBondings=len(self._NICBondings),
+                                          targetDevice=self._targetDevice,
+                                          targetDeviceType=self._targetDeviceType, tags=self._tags)
 
     def getReasonForDestruction(self):
         return self._reasonForDestruction
@@ -0,0 +1,136 @@
+from rackattack.common import globallock
+from twisted.web import resource
+import collections
+import threading
+import bisect
+import time
+
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self._bounds = buckets
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value):
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self._bounds, self._counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+        lines.append('%s_bucket{%s,le="+Inf"} %d' % (name, labels, self._count))
+        lines.append('%s_sum{%s} %f' % (name, labels, self._sum))
+        lines.append('%s_count{%s} %d' % (name, labels, self._count))
+        return lines
+
+
+class Instrumentation:
+    def __init__(self, threadCallers=()):
+        self._threadCallers = tuple(threadCallers)
+        self._commandLatency = collections.OrderedDict()
+        self._commandErrors = collections.OrderedDict()
+        self._lockWait = collections.OrderedDict()
+        self._lockHold = collections.OrderedDict()
+        self._originalLock = None
+
+    def install(self):
+        assert self._originalLock is None
+        self._originalLock = globallock.lock
+        globallock.lock = self.lock
+
+    def uninstall(self):
+        globallock.lock = self._originalLock
+        self._originalLock = None
+
+    def timed(self, command, handler):
+        histogram = self._commandLatency.setdefault(command, Histogram())
+        self._commandErrors.setdefault(command, 0)
+
+        def timedHandler(*args, **kwargs):
+            before = time.time()
+            try:
+                return handler(*args, **kwargs)
+            except:
+                self._commandErrors[command] += 1
+                raise
+            finally:
+                histogram.observe(time.time() - before)
+        return timedHandler
+
+    def lock(self):
+        return _MeasuredLock(self, self._originalLock())
+
+    def lockAcquired(self, caller, waited):
+        self._histogram(self._lockWait, caller).observe(waited)
+
+    def lockReleased(self, caller, held):
+        self._histogram(self._lockHold, caller).observe(held)
+
+    def callerOf(self, thread):
+        for threadType, caller in self._threadCallers:
+            if isinstance(thread, threadType):
+                return caller
+        if thread.name.startswith("PoolThread-"):
+            return "ipc"
+        if thread.name == "MainThread":
+            return "http"
+        return "stateMachine"
+
+    def render(self):
+        lines = ["# TYPE rackattack_ipc_command_seconds histogram"]
+        for command, histogram in self._commandLatency.items():
+            lines.extend(histogram.render("rackattack_ipc_command_seconds", 'command="%s"' % command))
+        lines.append("# TYPE rackattack_ipc_command_errors_total counter")
+        for command, count in self._commandErrors.items():
+            lines.append('rackattack_ipc_command_errors_total{command="%s"} %d' % (command, count))
+        for name, histograms in (("rackattack_globallock_wait_seconds", self._lockWait),
+                                 ("rackattack_globallock_hold_seconds", self._lockHold)):
+            lines.append("# TYPE %s histogram" % name)
+            for caller, histogram in histograms.items():
+                lines.extend(histogram.render(name, 'caller="%s"' % caller))
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _histogram(histograms, caller):
+        histogram = histograms.get(caller)
+        if histogram is None:
+            histogram = histograms.setdefault(caller, Histogram())
+        return histogram
+
+
+class _MeasuredLock:
+    def __init__(self, instrumentation, lock):
+        self._instrumentation = instrumentation
+        self._lock = lock
+
+    def __enter__(self):
+        self._caller = self._instrumentation.callerOf(threading.current_thread())
+        before = time.time()
+        self._lock.__enter__()
+        self._acquired = time.time()
+        self._instrumentation.lockAcquired(self._caller, self._acquired - before)
+
+    def __exit__(self, *args):
+        self._instrumentation.lockReleased(self._caller, time.time() - self._acquired)
+        return self._lock.__exit__(*args)
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, instrumentation):
+        resource.Resource.__init__(self)
+        self._instrumentation = instrumentation
+
+    def render_GET(self, request):
+        request.setHeader("Content-Type", "text/plain; version=0.0.4")
+        return self._instrumentation.render()
@@ -1,24 +1,168 @@
 from rackattack.tcp import heartbeat
 from rackattack.common import baseipcserver
 from rackattack.physical import network
-from rackattack.common.hoststatemachine import STATE_DESTROYED
+from rackattack.physical import status
+from rackattack.physical import responseencoding
+from rackattack.physical import nodedescriptors
+from rackattack.common import globallock
+from twisted.internet import threads
 import logging
+import json
 
 
 class IPCServer(baseipcserver.BaseIPCServer):
+    _LOCK_FREE_COMMANDS = frozenset(["allocation__done", "allocation__dead", "heartbeat"])
+
     def __init__(self, osmosisServerIP, dnsmasq, allocations, hosts, dynamicConfig,
-                 reclaimHost):
+                 reclaimHost, publish=None, instrumentation=None):
         self._osmosisServerIP = osmosisServerIP
         self._dnsmasq = dnsmasq
         self._allocations = allocations
         self._hosts = hosts
         self._dynamicConfig = dynamicConfig
         self._reclaimHost = reclaimHost
+        self._admissionQueue = []
+        self._admitting = False
+        self._status = status.Status(hosts, dynamicConfig, allocations, publish)
+        self._nodeDescriptors = nodedescriptors.NodeDescriptors(allocations, osmosisServerIP)
+        if instrumentation is not None:
+            for name in dir(self):
+                if name.startswith("cmd_"):
+                    setattr(self, name, instrumentation.timed(name[len("cmd_"):], getattr(self, name)))
+            self._createMany = instrumentation.timed("allocate", self._createMany)
         baseipcserver.BaseIPCServer.__init__(self)
 
-    def cmd_allocate(self, requirements, allocationInfo, peer):
-        allocation = self._allocations.create(requirements, allocationInfo)
-        return allocation.index()
+    def handle(self, string, respondCallback, peer):
+        incoming = self._parse(string)
+        encoding = responseencoding.LEGACY if incoming is None else responseencoding.negotiate(
+            incoming.get('accept'))
+        if incoming is not None and incoming.get('cmd') in self._LOCK_FREE_COMMANDS:
+            return self._handleLockFree(incoming, encoding, respondCallback, peer)
+        if incoming is not None and incoming.get('cmd') == 'allocate':
+            return self._handleAllocate(incoming, encoding, respondCallback)
+        cached = self._cachedResponse(incoming, encoding)
+        if cached is not None:
+            return respondCallback(cached)
+        if encoding != responseencoding.LEGACY:
+            return self._handleEncoded(incoming, encoding, respondCallback, peer)
+        return baseipcserver.BaseIPCServer.handle(self, string, respondCallback, peer)
+
+    def _parse(self, string):
+        try:
+            incoming = json.loads(string)
+        except Exception:
+            return None
+        if not isinstance(incoming, dict):
+            return None
+        return incoming
+
+    def _allocateRequest(self, incoming):
+        arguments = incoming.get('arguments')
+        if not isinstance(arguments, dict):
+            raise ValueError("Allocate request has no arguments")
+        unexpected = set(arguments) - set(['requirements', 'allocationInfo'])
+        if unexpected:
+            raise TypeError("Unexpected allocate arguments: %s" % ", ".join(sorted(unexpected)))
+        requirements = arguments.get('requirements')
+        allocationInfo = arguments.get('allocationInfo')
+        if not isinstance(requirements, dict) or not requirements:
+            raise ValueError("Allocate request must specify the requirements of at least one node")
+        if not isinstance(allocationInfo, dict):
+            raise ValueError("Allocate request must specify allocation info")
+        return requirements, allocationInfo
+
+    def _cachedResponse(self, incoming, encoding):
+        if incoming is None or incoming.get('cmd') != "allocation__nodes":
+            return None
+        try:
+            index = incoming['arguments']['id']
+        except Exception:
+            return None
+        return self._nodeDescriptors.encoded(index, encoding)
+
+    def _handleLockFree(self, incoming, encoding, respondCallback, peer):
+        respondCallback(responseencoding.encode(self._execute(incoming, peer), encoding))
+
+    def _handleEncoded(self, incoming, encoding, respondCallback, peer):
+        deferred = threads.deferToThread(self._executeLockedAndEncode, incoming, encoding, peer)
+        deferred.addErrback(self._encodedHandlingFailed, incoming, encoding)
+        deferred.addCallback(respondCallback)
+
+    def _encodedHandlingFailed(self, failure, incoming, encoding):
+        logging.error("Handling command %(cmd)s failed: %(failure)s",
+                      dict(cmd=incoming.get('cmd'), failure=failure.getTraceback()))
+        return responseencoding.encode(self._failureResponse(failure), encoding)
+
+    def _executeLockedAndEncode(self, incoming, encoding, peer):
+        with globallock.lock():
+            response = self._execute(incoming, peer)
+        return responseencoding.encode(response, encoding)
+
+    def _execute(self, incoming, peer):
+        try:
+            handler = getattr(self, "cmd_" + incoming['cmd'])
+            return handler(peer=peer, **incoming['arguments'])
+        except Exception as e:
+            logging.exception("Handling command %(cmd)s", dict(cmd=incoming.get('cmd')))
+            return self._exceptionResponse(e)
+
+    @staticmethod
+    def _exceptionResponse(exception):
+        return dict(exceptionString=str(exception), exceptionType=exception.__class__.__name__)
+
+    @staticmethod
+    def _failureResponse(failure):
+        return dict(exceptionString=failure.getErrorMessage(), exceptionType=failure.type.__name__)
+
+    def _handleAllocate(self, incoming, encoding, respondCallback):
+        try:
+            request = self._allocateRequest(incoming)
+        except Exception as e:
+            logging.warning("Rejecting a malformed allocate request: %(error)s", dict(error=e))
+            return respondCallback(responseencoding.encode(self._exceptionResponse(e), encoding))
+        deferred = threads.deferToThread(self._allocations.preAdmit, request[0])
+        deferred.addErrback(self._preAdmissionFailed)
+        deferred.addCallback(lambda _: self._queueForAdmission(request, encoding, respondCallback))
+
+    def _preAdmissionFailed(self, failure):
+        logging.error("Pre-admission of an allocation request failed: %(failure)s",
+                      dict(failure=failure.getErrorMessage()))
+
+    def _queueForAdmission(self, request, encoding, respondCallback):
+        self._admissionQueue.append((request, encoding, respondCallback))
+        if not self._admitting:
+            self._admit()
+
+    def _admit(self):
+        batch = self._admissionQueue
+        self._admissionQueue = []
+        self._admitting = True
+        logging.info("Admitting a batch of %(nrRequests)d allocation requests", dict(nrRequests=len(batch)))
+        deferred = threads.deferToThread(self._createMany, [request for request, _, _ in batch])
+        deferred.addCallbacks(lambda responses: self._respondAdmitted(batch, responses),
+                              lambda failure: self._admissionFailed(batch, failure))
+        deferred.addBoth(self._admissionDone)
+
+    def _admissionDone(self, result):
+        self._admitting = False
+        if self._admissionQueue:
+            self._admit()
+
+    def _createMany(self, requests):
+        with globallock.lock():
+            results = self._allocations.createMany(requests)
+        return [self._exceptionResponse(result) if isinstance(result, Exception) else result.index()
+                for result in results]
+
+    def _respondAdmitted(self, batch, responses):
+        for (request, encoding, respondCallback), response in zip(batch, responses):
+            respondCallback(responseencoding.encode(response, encoding))
+
+    def _admissionFailed(self, batch, failure):
+        logging.error("Batched admission failed: %(failure)s", dict(failure=failure.getTraceback()))
+        response = self._failureResponse(failure)
+        for request, encoding, respondCallback in batch:
+            respondCallback(responseencoding.encode(response, encoding))
 
     def cmd_allocation__inauguratorsIDs(self, id, peer):
         allocation = self._allocations.byIndex(id)
@@ -36,45 +180,31 @@ class IPCServer(baseipcserver.BaseIPCServer):
             raise Exception("Must not fetch nodes from a dead allocation")
         if not allocation.done():
             raise Exception("Must not fetch nodes from a not done allocation")
-        result = {}
-        for name, stateMachine in allocation.allocated().iteritems():
-            host = stateMachine.hostImplementation()
-            result[name] = dict(
-                id=host.id(),
-                primaryMACAddress=host.primaryMACAddress(),
-                secondaryMACAddress=host.secondaryMACAddress(),
-                ipAddress=host.ipAddress(),
-                netmask=network.NETMASK,
-                inauguratorServerIP=network.GATEWAY_IP_ADDRESS,
-                gateway=network.GATEWAY_IP_ADDRESS,
-                osmosisServerIP=self._osmosisServerIP,
-                NICBondings=host.getNICBondings(),
-                otherMACAddresses=host.getOtherMACAddresses())
-        return result
+        return self._nodeDescriptors.descriptors(allocation)
 
     def cmd_allocation__free(self, id, peer):
         allocation = self._allocations.byIndex(id)
         allocation.free()
 
     def cmd_allocation__done(self, id, peer):
-        allocation = self._allocations.byIndex(id)
-        return allocation.done()
+        status = self._allocations.publishedStatus(id)
+        if status.dead is not None:
+            raise Exception("Allocation %(id)s is dead: '%(reason)s'" % dict(id=id, reason=status.dead))
+        return status.done
 
     def cmd_allocation__dead(self, id, peer):
-        allocation = self._allocations.byIndex(id)
-        return allocation.dead()
+        return self._allocations.publishedStatus(id).dead
 
     def cmd_heartbeat(self, ids, peer):
         for id in ids:
-            allocation = self._allocations.byIndex(id)
-            allocation.heartbeat()
+            self._allocations.heartbeat(id)
         return heartbeat.HEARTBEAT_OK
 
     def _findNode(self, allocationID, nodeID):
         allocation = self._allocations.byIndex(allocationID)
-        for stateMachine in allocation.inaugurated().values():
-            if stateMachine.hostImplementation().id() == nodeID:
-                return stateMachine
+        stateMachine = allocation.inauguratedByHostID(nodeID)
+        if stateMachine is not None:
+            return stateMachine
         raise Exception("Node with id '%s' was not found in this allocation" % nodeID)
 
     def cmd_node__rootSSHCredentials(self, allocationID, nodeID, peer):
@@ -114,58 +244,18 @@ class IPCServer(baseipcserver.BaseIPCServer):
                      dict(hostID=hostID, allocationID=allocationID))
         allocation.releaseHost(stateMachine)
 
-    def cmd_admin__queryStatus(self, peer):
-        allocations = [dict(
-            index=a.index(),
-            allocationInfo=a.allocationInfo(),
-            allocated={k: v.hostImplementation().index() for k, v in a.allocated().iteritems()},
-            done=a.dead() or a.done(),
-            dead=a.dead(),
-            duration=int(a.getDuration())
-            ) for a in self._allocations.all()]
-        hosts = self._onlineHosts() + self._offlineHosts() + self._detachedHosts()
-        return dict(allocations=allocations, hosts=hosts)
+    def cmd_admin__queryStatus(self, peer, sinceVersion=None):
+        return self._status.query(sinceVersion)
+
+    def cmd_admin__queryStatusFiltered(self, peer, kind, filters=None, idWildcard=None, fields=None,
+                                       cursor=None, limit=None):
+        return self._status.queryFiltered(kind, filters, idWildcard, fields, cursor, limit)
+
+    def cmd_admin__queryPoolSummary(self, peer):
+        return self._dynamicConfig.poolSummary()
+
+    def cmd_admin__queryOsmosisLabelsCache(self, peer):
+        return self._allocations.osmosisLabelsCacheStats()
 
     def cmd_admin__asyncReloadConfiguration(self, peer):
         self._dynamicConfig.asyncReload()
-
-    def _detachedHosts(self):
-        return [dict(index=host.index(),
-                     id=host_id,
-                     primaryMACAddress=host.primaryMACAddress(),
-                     secondaryMACAddress=host.secondaryMACAddress(),
-                     ipAddress=host.ipAddress(),
-                     state="DETACHED",
-                     pool=host.pool())
-                for host_id, host in self._dynamicConfig.getDetachedHosts().iteritems()]
-
-    def _offlineHosts(self):
-        return [dict(index=host.index(),
-                     id=host_id,
-                     primaryMACAddress=host.primaryMACAddress(),
-                     secondaryMACAddress=host.secondaryMACAddress(),
-                     ipAddress=host.ipAddress(),
-                     state="OFFLINE",
-                     pool=host.pool(),
-                     reasonForDestruction=host.getReasonForDestruction())
-                for host_id, host in self._dynamicConfig.getOfflineHosts().iteritems()]
-
-    def _onlineHosts(self):
-        STATE = {
-            1: "QUICK_RECLAIMATION_IN_PROGRESS",
-            2: "SLOW_RECLAIMATION_IN_PROGRESS",
-            3: "CHECKED_IN",
-            4: "INAUGURATION_LABEL_PROVIDED",
-            5: "INAUGURATION_DONE",
-            6: "DESTROYED"}
-        statesOfHostsThatHaveMachines = dict([(machine.hostImplementation().id(), machine.state())
-                                             for machine in self._hosts.all()])
-        return [dict(index=host.index(),
-                     id=hostID,
-                     primaryMACAddress=host.primaryMACAddress(),
-                     secondaryMACAddress=host.secondaryMACAddress(),
-                     ipAddress=host.ipAddress(),
-                     state=STATE[statesOfHostsThatHaveMachines.get(hostID, STATE_DESTROYED)],
-                     pool=host.pool(),
-                     reasonForDestruction=host.getReasonForDestruction())
-                for hostID, host in self._dynamicConfig.getOnlineHosts().iteritems()]
@@ -5,6 +5,8 @@ import argparse
 from rackattack.physical import config
 from rackattack.physical import network
 from rackattack.physical import dynamicconfig
+from rackattack.physical import configwatcher
+from rackattack.physical import batcheddnsmasq
 import rackattack.virtual.handlekill
 from rackattack.common import dnsmasq
 from rackattack.common import globallock
@@ -15,7 +17,9 @@ from rackattack.common import hosts
 from rackattack.physical.alloc import freepool
 from rackattack.physical.alloc import allocations
 from rackattack.physical import ipcserver
+from rackattack.physical import statusstream
 from rackattack.tcp import publish
+from rackattack.physical import instrumentation
 from rackattack.tcp import transportserver
 from twisted.internet import reactor
 from twisted.web import server
@@ -31,6 +35,8 @@ parser.add_argument("--requestPort", default=1014, type=int)
 parser.add_argument("--subscribePort", default=1015, type=int)
 parser.add_argument("--httpPort", default=1016, type=int)
 parser.add_argument("--rackYAML")
+parser.add_argument("--rackYAMLFragmentsDirectory")
+parser.add_argument("--rackYAMLParsingProcesses", type=int)
 parser.add_argument("--serialLogsDirectory")
 parser.add_argument("--managedPostMortemPacksDirectory")
 parser.add_argument("--configurationFile")
@@ -38,6 +44,10 @@ args = parser.parse_args()
 
 if args.rackYAML:
     config.RACK_YAML = args.rackYAML
+if args.rackYAMLFragmentsDirectory:
+    config.RACK_YAML_FRAGMENTS_DIRECTORY = args.rackYAMLFragmentsDirectory
+if args.rackYAMLParsingProcesses is not None:
+    config.RACK_YAML_PARSING_PROCESSES = args.rackYAMLParsingProcesses
 if args.serialLogsDirectory:
     config.SERIAL_LOGS_DIRECTORY = args.serialLogsDirectory
 if args.configurationFile:
@@ -53,6 +63,10 @@ config.ARE_IPMI_COMMANDS_SYNCHRONOUS = conf["ARE_IPMI_COMMANDS_SYNCHRONOUS"]
 logging.info("IPMI commands synchronous mode: %(syncMode)s",
              dict(syncMode=config.ARE_IPMI_COMMANDS_SYNCHRONOUS))
 
+parsingPool = dynamicconfig.createParsingPool(config.RACK_YAML_PARSING_PROCESSES)
+instrumentationInstance = instrumentation.Instrumentation(threadCallers=[
+    (timer.TimersThread, "timer"), (dynamicconfig.DynamicConfig, "dynamicConfig")])
+instrumentationInstance.install()
 timer.TimersThread()
 withLocalObjectStore = config.WITH_LOCAL_OBJECT_STORE
 tftpbootInstance = tftpboot.TFTPBoot(
@@ -65,7 +79,7 @@ tftpbootInstance = tftpboot.TFTPBoot(
     withLocalObjectStore=withLocalObjectStore)
 dnsmasq.DNSMasq.eraseLeasesFile()
 dnsmasq.DNSMasq.killAllPrevious()
-dnsmasqInstance = dnsmasq.DNSMasq(
+dnsmasqInstance = batcheddnsmasq.BatchedDNSMasq(
     tftpboot=tftpbootInstance,
     serverIP=network.BOOTSERVER_IP_ADDRESS,
     netmask=network.NETMASK,
@@ -74,7 +88,9 @@ dnsmasqInstance = dnsmasq.DNSMasq(
     gateway=network.GATEWAY_IP_ADDRESS,
     nameserver=network.BOOTSERVER_IP_ADDRESS)
 inaugurateInstance = inaugurate.Inaugurate(config.RABBIT_MQ_DIRECTORY)
-publishInstance = publish.Publish("ampq://localhost:%d/%%2F" % inaugurator.server.config.PORT)
+amqpURL = "ampq://localhost:%d/%%2F" % inaugurator.server.config.PORT
+publishInstance = publish.Publish(amqpURL)
+statusPublishInstance = statusstream.Publish(amqpURL)
 hostsInstance = hosts.Hosts()
 freePool = freepool.FreePool(hostsInstance)
 allocationsInstance = allocations.Allocations(
@@ -90,14 +106,19 @@ dynamicConfig = dynamicconfig.DynamicConfig(
     tftpboot=tftpbootInstance,
     freePool=freePool,
     allocations=allocationsInstance,
-    reclaimHost=reclaimHost)
+    reclaimHost=reclaimHost,
+    parsingPool=parsingPool)
+configWatcher = configwatcher.ConfigWatcher(
+    dynamicConfig.asyncReload, config.RACK_YAML, config.RACK_YAML_FRAGMENTS_DIRECTORY)
 ipcServer = ipcserver.IPCServer(
     osmosisServerIP=conf['OSMOSIS_SERVER_IP'],
     dnsmasq=dnsmasqInstance,
     allocations=allocationsInstance,
     hosts=hostsInstance,
     dynamicConfig=dynamicConfig,
-    reclaimHost=reclaimHost)
+    reclaimHost=reclaimHost,
+    publish=statusPublishInstance,
+    instrumentation=instrumentationInstance)
 
 
 def serialLogFilename(vmID):
@@ -114,6 +135,7 @@ log.startLogging(sys.stderr)
 root = httprootresource.HTTPRootResource(
     serialLogFilename, createPostMortemPackForAllocationID,
     config.MANAGED_POST_MORTEM_PACKS_DIRECTORY)
+root.putChild("metrics", instrumentation.MetricsResource(instrumentationInstance))
 reactor.listenTCP(args.httpPort, server.Site(root))
 reactor.listenTCP(args.requestPort, transportserver.TransportFactory(ipcServer.handle))
 logging.info("Physical RackAttack up and running")
@@ -0,0 +1,61 @@
+from rackattack.physical import network
+from rackattack.physical import responseencoding
+
+
+class NodeDescriptors:
+    def __init__(self, allocations, osmosisServerIP):
+        self._osmosisServerIP = osmosisServerIP
+        self._entries = dict()
+        allocations.addListener(self)
+
+    def allocationChanged(self, allocation):
+        index = allocation.index()
+        if allocation.dead() is None and allocation.done():
+            self._entries[index] = _Entry(self._build(allocation))
+        else:
+            self._entries.pop(index, None)
+
+    def allocationRemoved(self, index):
+        self._entries.pop(index, None)
+
+    def descriptors(self, allocation):
+        entry = self._entries.get(allocation.index())
+        if entry is None:
+            return self._build(allocation)
+        return entry.descriptors
+
+    def encoded(self, index, encoding):
+        entry = self._entries.get(index)
+        if entry is None:
+            return None
+        return entry.encoded(encoding)
+
+    def _build(self, allocation):
+        result = {}
+        for name, stateMachine in allocation.allocated().iteritems():
+            host = stateMachine.hostImplementation()
+            result[name] = dict(
+                id=host.id(),
+                primaryMACAddress=host.primaryMACAddress(),
+                secondaryMACAddress=host.secondaryMACAddress(),
+                ipAddress=host.ipAddress(),
+                netmask=network.NETMASK,
+                inauguratorServerIP=network.GATEWAY_IP_ADDRESS,
+                gateway=network.GATEWAY_IP_ADDRESS,
+                osmosisServerIP=self._osmosisServerIP,
+                NICBondings=host.getNICBondings(),
+                otherMACAddresses=host.getOtherMACAddresses())
+        return result
+
+
+class _Entry:
+    def __init__(self, descriptors):
+        self.descriptors = descriptors
+        self._encoded = dict()
+
+    def encoded(self, encoding):
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = responseencoding.encode(self.descriptors, encoding)
+            self._encoded[encoding] = data
+        return data
@@ -0,0 +1,64 @@
+import json
+import zlib
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+LEGACY = None
+JSON = "json"
+JSON_ZLIB = "json+zlib"
+MSGPACK = "msgpack"
+MSGPACK_ZLIB = "msgpack+zlib"
+COMPRESSION_THRESHOLD = 16 * 1024
+_COMPRESSION_LEVEL = 1
+_COMPRESSED_SUFFIX = "+zlib"
+_HEADERS = {JSON: "J", JSON_ZLIB: "Z", MSGPACK: "M", MSGPACK_ZLIB: "C"}
+_ENCODINGS = {header: encoding for encoding, header in _HEADERS.iteritems()}
+
+
+def supported():
+    if msgpack is None:
+        return [JSON_ZLIB, JSON]
+    return [MSGPACK_ZLIB, MSGPACK, JSON_ZLIB, JSON]
+
+
+def negotiate(accepted):
+    if not isinstance(accepted, list):
+        return LEGACY
+    available = supported()
+    for encoding in accepted:
+        if encoding in available:
+            return encoding
+    return JSON
+
+
+def encode(response, encoding):
+    if encoding == LEGACY:
+        return json.dumps(response)
+    if encoding.startswith(MSGPACK):
+        serialized = msgpack.packb(response, use_bin_type=True)
+        uncompressed = MSGPACK
+    else:
+        serialized = json.dumps(response)
+        uncompressed = JSON
+    if encoding.endswith(_COMPRESSED_SUFFIX) and len(serialized) > COMPRESSION_THRESHOLD:
+        return _HEADERS[encoding] + zlib.compress(serialized, _COMPRESSION_LEVEL)
+    return _HEADERS[uncompressed] + serialized
+
+
+def encodingOf(data):
+    return _ENCODINGS.get(data[:1], LEGACY)
+
+
+def decode(data):
+    encoding = encodingOf(data)
+    if encoding == LEGACY:
+        return json.loads(data)
+    serialized = data[1:]
+    if encoding.endswith(_COMPRESSED_SUFFIX):
+        serialized = zlib.decompress(serialized)
+    if encoding.startswith(MSGPACK):
+        return msgpack.unpackb(serialized, raw=False)
+    return json.loads(serialized)
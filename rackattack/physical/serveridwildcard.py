@@ -0,0 +1,24 @@
+import re
+
+
+_MAX_NR_CACHED = 1024
+_compiled = dict()
+
+
+def compiled(wildcard):
+    regex = _compiled.get(wildcard)
+    if regex is None:
+        if len(_compiled) >= _MAX_NR_CACHED:
+            _compiled.clear()
+        regexPattern = ".*".join([re.escape(part) for part in wildcard.split("*")]) + "$"
+        regex = re.compile(regexPattern)
+        _compiled[wildcard] = regex
+    return regex
+
+
+def matches(serverID, wildcard):
+    return compiled(wildcard).match(serverID) is not None
+
+
+def literalPrefix(wildcard):
+    return wildcard.split("*", 1)[0]
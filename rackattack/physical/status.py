@@ -0,0 +1,172 @@
+from rackattack.common import globallock
+from rackattack.common import timer
+from rackattack.common.hoststatemachine import STATE_DESTROYED
+from rackattack.physical import host
+from rackattack.physical import statusdocument
+from rackattack.physical import statusindex
+
+
+STATE = {
+    1: "QUICK_RECLAIMATION_IN_PROGRESS",
+    2: "SLOW_RECLAIMATION_IN_PROGRESS",
+    3: "CHECKED_IN",
+    4: "INAUGURATION_LABEL_PROVIDED",
+    5: "INAUGURATION_DONE",
+    6: "DESTROYED"}
+
+
+class Status:
+    _PUBLISH_INTERVAL = 10
+    _MAX_NR_EVENTS_PER_MESSAGE = 1000
+    _DEFAULT_PAGE_SIZE = 500
+    _MAX_PAGE_SIZE = 5000
+
+    def __init__(self, hosts, dynamicConfig, allocations, publish=None):
+        self._hosts = hosts
+        self._dynamicConfig = dynamicConfig
+        self._allocations = allocations
+        self._publish = publish
+        self._pendingEvents = []
+        self._index = statusindex.StatusIndex()
+        self._document = statusdocument.StatusDocument(self._documentChanged)
+        self._hostInstances = dict()
+        self._fingerprints = dict()
+        self._allocationInstances = dict()
+        self._populated = False
+        allocations.addListener(self)
+        dynamicConfig.addListener(self)
+        self._schedulePublishing()
+
+    def query(self, sinceVersion=None):
+        assert globallock.assertLocked()
+        self._refreshOnFirstQuery()
+        if sinceVersion is None or not self._document.canDeltaSince(sinceVersion):
+            return dict(version=self._document.version(),
+                        allocations=self._withDurations(self._document.allocations()),
+                        hosts=self._document.hosts())
+        return dict(version=self._document.version(),
+                    sinceVersion=sinceVersion,
+                    allocations=self._withDurations(self._document.allocationsChangedSince(sinceVersion)),
+                    hosts=self._document.hostsChangedSince(sinceVersion),
+                    removedAllocations=self._document.removedSince(sinceVersion, "allocation"),
+                    removedHosts=self._document.removedSince(sinceVersion, "host"))
+
+    def queryFiltered(self, kind, filters=None, idWildcard=None, fields=None, cursor=None, limit=None):
+        assert globallock.assertLocked()
+        if kind not in statusindex.StatusIndex.FILTERS:
+            raise ValueError("Unknown kind of status entries: '%s'" % kind)
+        if idWildcard is not None and kind != "host":
+            raise ValueError("Only hosts can be filtered by an ID wildcard")
+        if limit is None:
+            limit = self._DEFAULT_PAGE_SIZE
+        limit = max(1, min(limit, self._MAX_PAGE_SIZE))
+        self._refreshOnFirstQuery()
+        found, nextCursor = self._index.query(kind, filters or dict(), idWildcard, cursor, limit)
+        entries = [entry for _, entry in found]
+        if kind == "allocation" and (fields is None or "duration" in fields):
+            entries = self._withDurations(entries)
+        if fields is not None:
+            entries = [{field: entry[field] for field in fields if field in entry} for entry in entries]
+        return dict(version=self._document.version(), kind=kind, entries=entries, cursor=nextCursor)
+
+    def hostChanged(self, hostInstance):
+        self._hostInstances[hostInstance.id()] = hostInstance
+        self._fingerprints.pop(hostInstance.id(), None)
+
+    def allocationChanged(self, allocation):
+        self._allocationInstances[allocation.index()] = allocation
+        self._document.setAllocation(allocation.index(), self._allocationEntry(allocation))
+        self._flushEvents()
+
+    def allocationRemoved(self, index):
+        self._document.removeAllocation(index)
+        self._allocationInstances.pop(index, None)
+        self._flushEvents()
+
+    def _schedulePublishing(self):
+        timer.scheduleIn(timeout=self._PUBLISH_INTERVAL, callback=self._publishChanges, tag=self)
+
+    def _publishChanges(self):
+        try:
+            self._refresh()
+            self._flushEvents()
+        finally:
+            self._schedulePublishing()
+
+    def _documentChanged(self, version, kind, key, entry):
+        if entry is None:
+            self._index.remove(kind, key)
+        else:
+            self._index.set(kind, key, entry)
+        if self._publish is None:
+            return
+        event = dict(seq=version, kind=kind, key=key)
+        if entry is None:
+            event["removed"] = True
+        elif kind == "allocation":
+            event["entry"] = self._withDurations([entry])[0]
+        else:
+            event["entry"] = entry
+        self._pendingEvents.append(event)
+
+    def _flushEvents(self):
+        while self._pendingEvents:
+            events = self._pendingEvents[:self._MAX_NR_EVENTS_PER_MESSAGE]
+            del self._pendingEvents[:self._MAX_NR_EVENTS_PER_MESSAGE]
+            self._publish.statusEvents(events)
+
+    def _refreshOnFirstQuery(self):
+        if not self._populated:
+            self._refresh()
+            self._flushEvents()
+
+    def _refresh(self):
+        if not self._populated:
+            self._populate()
+        machineStates = dict((machine.hostImplementation().id(), machine.state())
+                             for machine in self._hosts.all())
+        for hostID, hostInstance in self._hostInstances.iteritems():
+            machineState = machineStates.get(hostID, STATE_DESTROYED)
+            fingerprint = (hostInstance.state(), machineState, hostInstance.pool(),
+                           hostInstance.getReasonForDestruction())
+            if self._fingerprints.get(hostID) != fingerprint:
+                self._fingerprints[hostID] = fingerprint
+                self._document.setHost(hostID, self._hostEntry(hostID, hostInstance, machineState))
+
+    def _populate(self):
+        self._populated = True
+        for hosts in (self._dynamicConfig.getOnlineHosts(), self._dynamicConfig.getOfflineHosts(),
+                      self._dynamicConfig.getDetachedHosts()):
+            for hostInstance in hosts.itervalues():
+                self.hostChanged(hostInstance)
+        for allocation in self._allocations.all():
+            self.allocationChanged(allocation)
+
+    def _hostEntry(self, hostID, hostInstance, machineState):
+        entry = dict(index=hostInstance.index(),
+                     id=hostID,
+                     primaryMACAddress=hostInstance.primaryMACAddress(),
+                     secondaryMACAddress=hostInstance.secondaryMACAddress(),
+                     ipAddress=hostInstance.ipAddress(),
+                     pool=hostInstance.pool())
+        hostState = hostInstance.state()
+        if hostState == host.STATES.ONLINE:
+            entry["state"] = STATE[machineState]
+        else:
+            entry["state"] = hostState
+        if hostState != host.STATES.DETACHED:
+            entry["reasonForDestruction"] = hostInstance.getReasonForDestruction()
+        return entry
+
+    @staticmethod
+    def _allocationEntry(allocation):
+        return dict(index=allocation.index(),
+                    allocationInfo=allocation.allocationInfo(),
+                    allocated={name: stateMachine.hostImplementation().index()
+                               for name, stateMachine in allocation.allocated().iteritems()},
+                    done=allocation.dead() or allocation.done(),
+                    dead=allocation.dead())
+
+    def _withDurations(self, entries):
+        return [dict(entry, duration=int(self._allocationInstances[entry["index"]].getDuration()))
+                for entry in entries]
@@ -0,0 +1,87 @@
+import collections
+
+
+class StatusDocument:
+    MAX_NR_TOMBSTONES = 10000
+
+    def __init__(self, changeCallback=None):
+        self._changeCallback = changeCallback
+        self._version = 0
+        self._hosts = collections.OrderedDict()
+        self._allocations = collections.OrderedDict()
+        self._tombstones = collections.deque()
+        self._oldestDeltaVersion = 0
+
+    def version(self):
+        return self._version
+
+    def setHost(self, hostID, entry):
+        self._set(self._hosts, "host", hostID, entry)
+
+    def removeHost(self, hostID):
+        self._remove(self._hosts, "host", hostID)
+
+    def setAllocation(self, index, entry):
+        self._set(self._allocations, "allocation", index, entry)
+
+    def removeAllocation(self, index):
+        self._remove(self._allocations, "allocation", index)
+
+    def hosts(self):
+        return [entry for _, entry in self._hosts.itervalues()]
+
+    def allocations(self):
+        return [entry for _, entry in self._allocations.itervalues()]
+
+    def canDeltaSince(self, version):
+        return self._oldestDeltaVersion <= version <= self._version
+
+    def hostsChangedSince(self, version):
+        return self._changedSince(self._hosts, version)
+
+    def allocationsChangedSince(self, version):
+        return self._changedSince(self._allocations, version)
+
+    def removedSince(self, version, kind):
+        result = []
+        for tombstoneVersion, tombstoneKind, key in reversed(self._tombstones):
+            if tombstoneVersion <= version:
+                break
+            if tombstoneKind == kind:
+                result.append(key)
+        result.reverse()
+        return result
+
+    def _set(self, entries, kind, key, entry):
+        existing = entries.get(key)
+        if existing is not None and existing[1] == entry:
+            return
+        self._version += 1
+        entries.pop(key, None)
+        entries[key] = (self._version, entry)
+        self._changed(kind, key, entry)
+
+    def _remove(self, entries, kind, key):
+        if key not in entries:
+            return
+        self._version += 1
+        del entries[key]
+        self._tombstones.append((self._version, kind, key))
+        while len(self._tombstones) > self.MAX_NR_TOMBSTONES:
+            self._oldestDeltaVersion = self._tombstones.popleft()[0]
+        self._changed(kind, key, None)
+
+    def _changed(self, kind, key, entry):
+        if self._changeCallback is not None:
+            self._changeCallback(self._version, kind, key, entry)
+
+    @staticmethod
+    def _changedSince(entries, version):
+        result = []
+        for key in reversed(entries):
+            entryVersion, entry = entries[key]
+            if entryVersion <= version:
+                break
+            result.append(entry)
+        result.reverse()
+        return result
@@ -0,0 +1,81 @@
+from rackattack.physical import serveridwildcard
+import bisect
+
+
+class StatusIndex:
+    FILTERS = dict(host=("pool", "state"), allocation=("user", "purpose"))
+
+    def __init__(self):
+        self._entries = dict()
+        self._sortedKeys = dict()
+        self._buckets = dict()
+        for kind, fields in self.FILTERS.iteritems():
+            self._entries[kind] = dict()
+            self._sortedKeys[kind] = []
+            self._buckets[kind] = {field: dict() for field in fields}
+
+    def set(self, kind, key, entry):
+        existing = self._entries[kind].get(key)
+        if existing is None:
+            bisect.insort(self._sortedKeys[kind], key)
+        else:
+            self._unbucket(kind, key, existing)
+        self._entries[kind][key] = entry
+        for field, buckets in self._buckets[kind].iteritems():
+            bisect.insort(buckets.setdefault(self._valueOf(kind, field, entry), []), key)
+
+    def remove(self, kind, key):
+        entry = self._entries[kind].pop(key, None)
+        if entry is None:
+            return
+        self._unbucket(kind, key, entry)
+        keys = self._sortedKeys[kind]
+        del keys[bisect.bisect_left(keys, key)]
+
+    def query(self, kind, filters, keyWildcard=None, cursor=None, limit=None):
+        buckets = self._buckets[kind]
+        keys = self._sortedKeys[kind]
+        for field, value in filters.iteritems():
+            if field not in buckets:
+                raise ValueError("Cannot filter %(kind)ss by '%(field)s'" % dict(kind=kind, field=field))
+            bucket = buckets[field].get(value, [])
+            if len(bucket) < len(keys):
+                keys = bucket
+        prefix = "" if keyWildcard is None else serveridwildcard.literalPrefix(keyWildcard)
+        regex = None if keyWildcard is None else serveridwildcard.compiled(keyWildcard)
+        position = bisect.bisect_left(keys, prefix) if prefix else 0
+        if cursor is not None:
+            position = max(position, bisect.bisect_right(keys, cursor))
+        entries = self._entries[kind]
+        result = []
+        while position < len(keys):
+            key = keys[position]
+            position += 1
+            if prefix and not key.startswith(prefix):
+                break
+            entry = entries[key]
+            if regex is not None and regex.match(key) is None:
+                continue
+            if any(self._valueOf(kind, field, entry) != value for field, value in filters.iteritems()):
+                continue
+            if limit is not None and len(result) >= limit:
+                return result, result[-1][0]
+            result.append((key, entry))
+        return result, None
+
+    def _unbucket(self, kind, key, entry):
+        for field, buckets in self._buckets[kind].iteritems():
+            value = self._valueOf(kind, field, entry)
+            bucket = buckets[value]
+            del bucket[bisect.bisect_left(bucket, key)]
+            if not bucket:
+                del buckets[value]
+
+    @staticmethod
+    def _valueOf(kind, field, entry):
+        if kind == "allocation":
+            allocationInfo = entry.get("allocationInfo")
+            if not isinstance(allocationInfo, dict):
+                return None
+            return allocationInfo.get(field)
+        return entry.get(field)
@@ -0,0 +1,124 @@
+import pika
+import json
+import Queue
+import logging
+import threading
+
+
+STATUS_EXCHANGE = "rackattack_physical_status"
+
+
+def _statusChannel(amqpURL):
+    connection = pika.BlockingConnection(pika.URLParameters(amqpURL))
+    channel = connection.channel()
+    channel.exchange_declare(exchange=STATUS_EXCHANGE, exchange_type="fanout")
+    return channel
+
+
+class Publish(threading.Thread):
+    def __init__(self, amqpURL):
+        self._amqpURL = amqpURL
+        self._queue = Queue.Queue()
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.start()
+
+    def statusEvents(self, events):
+        self._queue.put(dict(events=events))
+
+    def run(self):
+        channel = None
+        while True:
+            message = self._queue.get()
+            try:
+                if channel is None:
+                    channel = _statusChannel(self._amqpURL)
+                channel.basic_publish(exchange=STATUS_EXCHANGE, routing_key="", body=json.dumps(message))
+            except:
+                logging.exception("Unable to publish status events, subscribers will resync")
+                channel = None
+
+
+class Subscribe(threading.Thread):
+    def __init__(self, amqpURL):
+        self._callbacks = []
+        self._channel = _statusChannel(amqpURL)
+        queue = self._channel.queue_declare(exclusive=True).method.queue
+        self._channel.queue_bind(queue=queue, exchange=STATUS_EXCHANGE)
+        self._channel.basic_consume(self._consume, queue=queue, no_ack=True)
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.start()
+
+    def registerForStatusEvents(self, callback):
+        self._callbacks.append(callback)
+
+    def run(self):
+        self._channel.start_consuming()
+
+    def _consume(self, channel, method, properties, body):
+        message = json.loads(body)
+        for callback in list(self._callbacks):
+            callback(message)
+
+
+class StatusMirror:
+    def __init__(self, queryStatus, subscription=None):
+        self._queryStatus = queryStatus
+        self._lock = threading.RLock()
+        self._version = None
+        self._hosts = dict()
+        self._allocations = dict()
+        if subscription is not None:
+            subscription.registerForStatusEvents(self.handleEvents)
+        self.resync()
+
+    def version(self):
+        return self._version
+
+    def hosts(self):
+        return self._hosts.values()
+
+    def allocations(self):
+        return self._allocations.values()
+
+    def resync(self):
+        with self._lock:
+            self._resync()
+
+    def _resync(self):
+        status = self._queryStatus(self._version)
+        if "sinceVersion" not in status:
+            self._hosts = dict()
+            self._allocations = dict()
+        for entry in status["hosts"]:
+            self._hosts[entry["id"]] = entry
+        for entry in status["allocations"]:
+            self._allocations[entry["index"]] = entry
+        for hostID in status.get("removedHosts", []):
+            self._hosts.pop(hostID, None)
+        for index in status.get("removedAllocations", []):
+            self._allocations.pop(index, None)
+        self._version = status["version"]
+
+    def handleEvents(self, message):
+        with self._lock:
+            if self._version is None:
+                return
+            self._handleEvents(message)
+
+    def _handleEvents(self, message):
+        for event in message["events"]:
+            if event["seq"] <= self._version:
+                continue
+            if event["seq"] != self._version + 1:
+                logging.warning("Missed status events %(first)d to %(last)d, resyncing", dict(
+                    first=self._version + 1, last=event["seq"] - 1))
+                self._resync()
+                continue
+            entries = self._hosts if event["kind"] == "host" else self._allocations
+            if event.get("removed", False):
+                entries.pop(event["key"], None)
+            else:
+                entries[event["key"]] = event["entry"]
+            self._version = event["seq"]
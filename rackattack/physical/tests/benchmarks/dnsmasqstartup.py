@@ -0,0 +1,125 @@
+import os
+import sys
+import time
+import signal
+import argparse
+import tempfile
+import subprocess
+import collections
+from rackattack.common import globallock
+from rackattack.physical import network
+from rackattack.physical import batcheddnsmasq
+from rackattack.physical.tests.benchmarks import hoststates
+
+FAKE_DNSMASQ = """
+import signal
+import sys
+import time
+signal.signal(signal.SIGHUP, lambda *args: open(sys.argv[1]).read())
+while True:
+    time.sleep(3600)
+"""
+
+
+class FakeDNSMasq(batcheddnsmasq.BatchedReloads):
+    def __init__(self, hostsFilename):
+        self._hostsFilename = hostsFilename
+        self._reservations = collections.OrderedDict()
+        self._writeHostsFile()
+        self._popen = subprocess.Popen([sys.executable, "-c", FAKE_DNSMASQ, hostsFilename])
+        self.nrReloads = 0
+        self.duration = 0.0
+
+    def add(self, mac, ipAddress):
+        self._reservations[mac] = ipAddress
+        self._reload()
+
+    def addIfNotAlready(self, mac, ipAddress):
+        if mac not in self._reservations:
+            self.add(mac, ipAddress)
+
+    def kill(self):
+        self._popen.kill()
+        self._popen.wait()
+
+    def _reloadImmediately(self):
+        before = time.time()
+        self._writeHostsFile()
+        self._popen.send_signal(signal.SIGHUP)
+        self.nrReloads += 1
+        self.duration += time.time() - before
+
+    def _writeHostsFile(self):
+        with open(self._hostsFilename, "w") as f:
+            f.write("".join("%s,%s,infinite\n" % pair for pair in self._reservations.iteritems()))
+
+
+class LockHold:
+    def __init__(self, lock):
+        self._lock = lock
+        self.duration = 0.0
+
+    def __call__(self):
+        return _MeasuredLock(self, self._lock())
+
+
+class _MeasuredLock:
+    def __init__(self, lockHold, lock):
+        self._lockHold = lockHold
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.__enter__()
+        self._acquired = time.time()
+
+    def __exit__(self, *args):
+        self._lockHold.duration += time.time() - self._acquired
+        return self._lock.__exit__(*args)
+
+
+def reservePerHost(tested):
+    newHostInConfiguration = tested._newHostInConfiguration
+
+    def reserveAndAdd(hostData):
+        newHostInConfiguration(hostData)
+        tested._dnsmasq.add(hostData['primaryMAC'], tested._hosts[hostData['id']].ipAddress())
+    tested._newHostInConfiguration = reserveAndAdd
+    tested._reserveAddressesOfNewHosts = lambda hostsData: None
+
+
+def measure(hostsData, perHost):
+    hostsFilename = tempfile.mktemp(suffix=".dnsmasq.hosts")
+    dnsmasq = FakeDNSMasq(hostsFilename)
+    lockHold = LockHold(globallock.lock)
+    globallock.lock = lockHold
+    try:
+        tested = hoststates.createDynamicConfig(dnsmasq)
+        if perHost:
+            reservePerHost(tested)
+        before = time.time()
+        hoststates.apply(tested, hostsData)
+        duration = time.time() - before
+    finally:
+        globallock.lock = lockHold._lock
+        dnsmasq.kill()
+        os.unlink(hostsFilename)
+    return dict(duration=duration, lockHeld=lockHold.duration, dnsmasq=dnsmasq.duration,
+                nrReloads=dnsmasq.nrReloads)
+
+
+def main(args):
+    network.initialize_globals(hoststates.NETWORK_CONF)
+    hostsData = hoststates.generateHostsData(args.nrHosts)
+    print "Cold start of %(nrHosts)d hosts against a fake dnsmasq process" % vars(args)
+    for name, perHost in (("reserved per host", True), ("reserved in one pass", False)):
+        result = measure([dict(hostData) for hostData in hostsData], perHost)
+        assert result["nrReloads"] == (len(hostsData) if perHost else 1)
+        print "%(name)24s: %(duration).3f seconds, lock held %(lockHeld).3f, dnsmasq %(dnsmasq).3f " \
+            "in %(nrReloads)d reloads" % dict(result, name=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=2000, type=int)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,68 @@
+import time
+import random
+import argparse
+from rackattack.physical import status
+from rackattack.physical import responseencoding
+from rackattack.physical.tests.benchmarks import syntheticrack
+
+
+def statusDocument(nrHosts, nrAllocations, seed):
+    randomInstance = random.Random(seed)
+    hosts = []
+    for index in xrange(nrHosts):
+        hosts.append(dict(index=index + 1,
+                          id="rack%02d-server%02d" % (index // 40 + 1, index % 40 + 1),
+                          primaryMACAddress="00:1e:67:%02x:%02x:%02x" % (index >> 16, (index >> 8) & 0xff,
+                                                                          index & 0xff),
+                          secondaryMACAddress="00:1e:68:%02x:%02x:%02x" % (index >> 16, (index >> 8) & 0xff,
+                                                                            index & 0xff),
+                          ipAddress="10.%d.%d.%d" % (index >> 16, (index >> 8) & 0xff, index & 0xff),
+                          pool=syntheticrack.weightedChoice(randomInstance, syntheticrack.POOLS),
+                          state=randomInstance.choice(status.STATE.values()),
+                          reasonForDestruction=None))
+    allocations = []
+    for index in xrange(nrAllocations):
+        nrNodes = randomInstance.randint(1, 16)
+        allocations.append(dict(index=index + 1,
+                                allocationInfo=dict(user="user%d" % randomInstance.randrange(50),
+                                                    purpose="racktest", nice=0.5),
+                                allocated={"node%d" % node: randomInstance.randrange(nrHosts) + 1
+                                           for node in xrange(nrNodes)},
+                                done=True, dead=None, duration=randomInstance.randrange(10000)))
+    return dict(version=1, hosts=hosts, allocations=allocations)
+
+
+def measure(document, encoding, nrRuns):
+    before = time.time()
+    for _ in xrange(nrRuns):
+        encoded = responseencoding.encode(document, encoding)
+    encodeDuration = (time.time() - before) / nrRuns
+    before = time.time()
+    for _ in xrange(nrRuns):
+        responseencoding.decode(encoded)
+    decodeDuration = (time.time() - before) / nrRuns
+    return dict(size=len(encoded), encode=encodeDuration, decode=decodeDuration)
+
+
+def main(args):
+    document = statusDocument(args.nrHosts, args.nrAllocations, args.seed)
+    print "Status document of %(nrHosts)d hosts and %(nrAllocations)d allocations" % vars(args)
+    if responseencoding.msgpack is not None:
+        print "msgpack implementation: %s" % responseencoding.msgpack.Packer.__module__
+    baseline = None
+    for encoding in responseencoding.supported()[::-1]:
+        result = measure(document, encoding, args.nrRuns)
+        if baseline is None:
+            baseline = result
+        print "%(encoding)13s: %(size)8d bytes (%(ratio)5.1f%%), encode %(encode).4f decode %(decode).4f " \
+            "seconds" % dict(result, encoding=encoding, ratio=100.0 * result["size"] / baseline["size"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=5000, type=int)
+    parser.add_argument("--nrAllocations", default=500, type=int)
+    parser.add_argument("--nrRuns", default=10, type=int)
+    parser.add_argument("--seed", default=1, type=int)
+    args = parser.parse_args()
+    main(args)
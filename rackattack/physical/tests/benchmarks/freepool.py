@@ -0,0 +1,72 @@
+import time
+import random
+import argparse
+from rackattack.common import globallock
+from rackattack.physical.alloc import freepool
+from rackattack.physical.tests.common import HostStateMachine, Host, Hosts
+
+
+# The list-based free pool that FreePool replaced, kept as the baseline to compare against
+class ListFreePool:
+    def __init__(self, hosts):
+        self._hosts = hosts
+        self._pool = []
+
+    def put(self, hostStateMachine):
+        self._pool.append(hostStateMachine)
+
+    def all(self):
+        for hostStateMachine in self._pool:
+            yield hostStateMachine
+
+    def eligible(self, requirement):
+        return [hostStateMachine for hostStateMachine in self._pool
+                if hostStateMachine.hostImplementation().fulfillsRequirement(requirement)]
+
+    def takeOut(self, hostStateMachine):
+        self._pool.remove(hostStateMachine)
+
+
+def generateStateMachines(nrHosts, nrPools):
+    return [HostStateMachine(Host("rack%02d-server%05d" % (i % nrPools, i), pool="pool%d" % (i % nrPools)))
+            for i in xrange(nrHosts)]
+
+
+def measure(freePoolClass, stateMachines, nrPools, nrTakeOuts):
+    tested = freePoolClass(Hosts())
+    results = dict()
+    before = time.time()
+    for stateMachine in stateMachines:
+        tested.put(stateMachine)
+    results["put"] = time.time() - before
+    before = time.time()
+    for poolIdx in xrange(nrPools):
+        tested.eligible(dict(pool="pool%d" % poolIdx))
+    results["eligibleOfEachPool"] = time.time() - before
+    toTakeOut = random.Random(1).sample(stateMachines, nrTakeOuts)
+    before = time.time()
+    for stateMachine in toTakeOut:
+        tested.takeOut(stateMachine)
+    results["takeOut"] = time.time() - before
+    return results
+
+
+def main(nrHosts, nrPools, nrTakeOuts):
+    stateMachines = generateStateMachines(nrHosts, nrPools)
+    print "%(nrHosts)d hosts in %(nrPools)d pools, %(nrTakeOuts)d take-outs" % dict(
+        nrHosts=nrHosts, nrPools=nrPools, nrTakeOuts=nrTakeOuts)
+    with globallock.lock():
+        for name, freePoolClass in (("list", ListFreePool), ("indexed", freepool.FreePool)):
+            results = measure(freePoolClass, stateMachines, nrPools, nrTakeOuts)
+            for operation, duration in sorted(results.iteritems()):
+                print "%(name)10s %(operation)26s: %(duration).4f seconds" % dict(
+                    name=name, operation=operation, duration=duration)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=10000, type=int)
+    parser.add_argument("--nrPools", default=20, type=int)
+    parser.add_argument("--nrTakeOuts", default=500, type=int)
+    args = parser.parse_args()
+    main(args.nrHosts, args.nrPools, args.nrTakeOuts)
@@ -0,0 +1,97 @@
+import time
+import mock
+import argparse
+from rackattack.common import timer
+from rackattack.common import globallock
+from rackattack.physical.alloc import heartbeats
+from rackattack.physical.tests.benchmarks import scheduler
+
+
+class PerAllocationTimers:
+    def __init__(self):
+        self._callbacks = dict()
+
+    def register(self, key, timeoutCallback):
+        self._callbacks[key] = timeoutCallback
+        self.heartbeat(key)
+
+    def heartbeat(self, key):
+        timer.cancelAllByTag(tag=key)
+        timer.scheduleIn(timeout=heartbeats.Heartbeats.TIMEOUT, callback=self._callbacks[key], tag=key)
+
+    def unregister(self, key):
+        del self._callbacks[key]
+        timer.cancelAllByTag(tag=key)
+
+
+class FakeAllocation:
+    def __init__(self, index):
+        self.index = index
+
+    def timeout(self):
+        pass
+
+
+def measure(tested, args):
+    allocations = [FakeAllocation(index) for index in xrange(args.nrAllocations)]
+    with globallock.lock():
+        for allocation in allocations:
+            tested.register(allocation, allocation.timeout)
+    heartbeatDurations = []
+    roundDurations = []
+    for _ in xrange(args.nrRounds):
+        roundStart = time.time()
+        for allocation in allocations:
+            with globallock.lock():
+                before = time.time()
+                tested.heartbeat(allocation)
+                heartbeatDurations.append(time.time() - before)
+        roundDurations.append(time.time() - roundStart)
+    result = dict(heartbeat=scheduler.summarize(heartbeatDurations),
+                  round=scheduler.summarize(roundDurations))
+    if hasattr(tested, "expire"):
+        nrSilent = int(len(allocations) * args.silentFraction)
+        halfTimeout = heartbeats.Heartbeats.TIMEOUT / 2.0
+        later = time.time() + halfTimeout
+        with mock.patch.object(heartbeats.time, "time", lambda: later):
+            for allocation in allocations[nrSilent:]:
+                tested.heartbeat(allocation)
+        with globallock.lock():
+            before = time.time()
+            nothingExpired = tested.expire(before + 1)
+            result["emptySweep"] = time.time() - before
+            before = time.time()
+            expired = tested.expire(before + heartbeats.Heartbeats.TIMEOUT + 2)
+            result["expirySweep"] = time.time() - before
+        assert not nothingExpired
+        assert len(expired) == nrSilent
+        result["nrExpired"] = len(expired)
+    with globallock.lock():
+        for allocation in allocations:
+            tested.unregister(allocation)
+    return result
+
+
+def main(args):
+    print "%(nrAllocations)d allocations, %(nrRounds)d heartbeat rounds" % vars(args)
+    for name, factory in (("per-allocation timers", PerAllocationTimers),
+                          ("heartbeat tracker", heartbeats.Heartbeats)):
+        with globallock.lock():
+            tested = factory()
+        result = measure(tested, args)
+        print "%(name)22s: heartbeat p50 %(p50).7f p99 %(p99).7f, round p50 %(roundP50).4f seconds" % dict(
+            result["heartbeat"], name=name, roundP50=result["round"]["p50"])
+        if "expirySweep" in result:
+            print "%(name)22s: sweep %(emptySweep).5f seconds when idle, %(expirySweep).5f seconds to " \
+                "expire %(nrExpired)d allocations" % dict(result, name=name)
+        timer.cancelAllByTag(tag=tested)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrAllocations", default=5000, type=int)
+    parser.add_argument("--nrRounds", default=10, type=int)
+    parser.add_argument("--silentFraction", default=0.1, type=float,
+                        help="Fraction of the allocations which stop heartbeating before the sweep")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,94 @@
+import time
+import mock
+import random
+import argparse
+import threading
+from rackattack.common import hoststatemachine
+from rackattack.physical import ipmi
+from rackattack.physical import host
+from rackattack.physical import network
+from rackattack.physical import dynamicconfig
+from rackattack.physical.alloc import freepool
+from rackattack.physical.tests import common
+from rackattack.physical.tests.benchmarks import scheduler
+from rackattack.physical.tests.benchmarks import syntheticrack
+
+STATES_MIX = ((host.STATES.ONLINE, 0.9), (host.STATES.OFFLINE, 0.08), (host.STATES.DETACHED, 0.02))
+NETWORK_CONF = dict(FIRST_IP="10.16.0.11", NODES_SUBNET_PREFIX_LENGTH=16, PUBLIC_NAT_IP="10.16.0.2",
+                    GATEWAY_IP="10.16.0.2", BOOTSERVER_IP="10.16.0.1")
+
+
+def generateHostsData(nrHosts):
+    randomInstance = random.Random(1)
+    hostsData = syntheticrack.generateHostsData(nrHosts)
+    for hostData in hostsData:
+        hostData["state"] = syntheticrack.weightedChoice(randomInstance, STATES_MIX)
+    return hostsData
+
+
+def createDynamicConfig(dnsmasq):
+    hosts = common.Hosts()
+    with mock.patch.object(threading.Thread, "start"), \
+            mock.patch.object(dynamicconfig.DynamicConfig, "asyncReload"):
+        return dynamicconfig.DynamicConfig(
+            hosts=hosts, dnsmasq=dnsmasq, inaugurate=mock.Mock(), tftpboot=mock.Mock(),
+            freePool=freepool.FreePool(hosts), allocations=common.Allocations(), reclaimHost=mock.Mock())
+
+
+def apply(tested, hostsData):
+    with mock.patch.object(ipmi, "IPMI"), \
+            mock.patch.object(hoststatemachine, "HostStateMachine", common.HostStateMachine):
+        tested._apply(dict(HOSTS=hostsData))
+
+
+def generateDynamicConfig(nrHosts):
+    tested = createDynamicConfig(mock.Mock())
+    apply(tested, generateHostsData(nrHosts))
+    return tested
+
+
+def filteredStatus(tested):
+    result = []
+    for state in (host.STATES.ONLINE, host.STATES.OFFLINE, host.STATES.DETACHED):
+        result.append({hostID: hostInstance for hostID, hostInstance in tested._hosts.iteritems()
+                       if hostInstance.state() == state})
+    summary = dict()
+    for hostInstance in tested._hosts.itervalues():
+        counts = summary.setdefault(hostInstance.pool(), {state: 0 for state in host.STATES})
+        counts[hostInstance.state()] += 1
+    result.append(summary)
+    return result
+
+
+def indexedStatus(tested):
+    return [tested.getOnlineHosts(), tested.getOfflineHosts(), tested.getDetachedHosts(),
+            tested.poolSummary()]
+
+
+def measure(tested, query, nrQueries):
+    latencies = []
+    for _ in xrange(nrQueries):
+        before = time.time()
+        query(tested)
+        latencies.append(time.time() - before)
+    return scheduler.summarize(latencies)
+
+
+def main(args):
+    network.initialize_globals(NETWORK_CONF)
+    tested = generateDynamicConfig(args.nrHosts)
+    assert filteredStatus(tested) == indexedStatus(tested)
+    print "%(nrHosts)d hosts, %(nrQueries)d status queries (three state accessors and a pool summary)" % \
+        vars(args)
+    for name, query in (("filtered per query", filteredStatus), ("per-state indexes", indexedStatus)):
+        result = measure(tested, query, args.nrQueries)
+        print "%(name)20s: latency p50 %(p50).6f p99 %(p99).6f max %(max).6f seconds" % \
+            dict(result, name=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=10000, type=int)
+    parser.add_argument("--nrQueries", default=200, type=int)
+    args = parser.parse_args()
+    main(args)
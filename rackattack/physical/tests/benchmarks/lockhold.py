@@ -0,0 +1,67 @@
+import time
+import mock
+import argparse
+from rackattack.virtual import sh
+from rackattack.common import timer
+from rackattack.common import globallock
+from rackattack.physical.alloc import freepool
+from rackattack.physical.alloc import allocations
+from rackattack.physical.tests import common
+from rackattack.physical.tests.benchmarks import syntheticrack
+
+
+def slowListLabels(latency):
+    def run(cmd):
+        time.sleep(latency)
+        return "\n".join(common.labelsOfListLabelsCommand(cmd))
+    return run
+
+
+def generateAllocations(nrHosts):
+    hosts = common.Hosts()
+    freePool = freepool.FreePool(hosts)
+    with globallock.lock():
+        for stateMachine in syntheticrack.generateStateMachines(nrHosts):
+            hosts.add(stateMachine)
+            freePool.put(stateMachine)
+    return allocations.Allocations(broadcaster=mock.Mock(), hosts=hosts, freePool=freePool,
+                                   osmosisServer="objectstore")
+
+
+def measure(args, preAdmit):
+    tested = generateAllocations(args.nrHosts)
+    allocationInfo = dict(user="benchmark", purpose="user", nice=0)
+    holdTimes = []
+    for runIdx in xrange(args.nrRuns):
+        requirements = {"node%d" % idx: dict(imageLabel="label%d-%d" % (runIdx, idx % 3), imageHint="hint")
+                        for idx in xrange(args.nrNodes)}
+        if preAdmit:
+            tested.preAdmit(requirements)
+        with globallock.lock():
+            before = time.time()
+            allocation = tested.create(requirements, allocationInfo)
+            holdTimes.append(time.time() - before)
+            allocation.free()
+    return holdTimes
+
+
+def main(args):
+    timer.scheduleIn = mock.Mock()
+    timer.cancelAllByTag = mock.Mock()
+    print "%(nrHosts)d hosts, %(nrNodes)d-node requests, %(latency).2f seconds per label listing" % dict(
+        nrHosts=args.nrHosts, nrNodes=args.nrNodes, latency=args.listLabelsLatency)
+    with mock.patch.object(sh, "run", slowListLabels(args.listLabelsLatency)):
+        for name, preAdmit in (("verification under lock", False), ("pre-admitted", True)):
+            holdTimes = sorted(measure(args, preAdmit))
+            print "%(name)25s: lock held %(average).4f seconds on average, %(max).4f at most" % dict(
+                name=name, average=sum(holdTimes) / len(holdTimes), max=holdTimes[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=1000, type=int)
+    parser.add_argument("--nrNodes", default=20, type=int)
+    parser.add_argument("--nrRuns", default=10, type=int)
+    parser.add_argument("--listLabelsLatency", default=0.2, type=float)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,80 @@
+import time
+import mock
+import argparse
+import threading
+from rackattack.common import timer
+from rackattack.common import globallock
+from rackattack.physical.alloc import osmosislabels
+from rackattack.physical.tests.benchmarks import scheduler
+
+
+def lockedPoll(tested, index):
+    with globallock.lock():
+        allocation = tested.byIndex(index)
+        return allocation.dead() or allocation.done()
+
+
+def lockFreePoll(tested, index):
+    status = tested.publishedStatus(index)
+    return status.dead or status.done
+
+
+class Reload(threading.Thread):
+    def __init__(self, tested, duration):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self._tested = tested
+        self._duration = duration
+        self.holding = threading.Event()
+
+    def run(self):
+        freePool = self._tested._freePool
+        with globallock.lock():
+            self.holding.set()
+            end = time.time() + self._duration
+            while time.time() < end:
+                for stateMachine in list(freePool.all()):
+                    freePool.hostConfigurationChanged(stateMachine)
+
+
+def measure(tested, indices, poll, args):
+    reload = Reload(tested, args.reloadDuration)
+    latencies = []
+    reload.start()
+    reload.holding.wait()
+    end = time.time() + args.reloadDuration
+    idx = 0
+    while time.time() < end or not latencies:
+        before = time.time()
+        poll(tested, indices[idx % len(indices)])
+        latencies.append(time.time() - before)
+        idx += 1
+    reload.join()
+    return scheduler.summarize(latencies)
+
+
+def main(args):
+    timer.scheduleIn = lambda **kwargs: None
+    timer.cancelAllByTag = lambda **kwargs: None
+    with mock.patch.object(osmosislabels.sh, "run", scheduler.listAllLabels):
+        tested = scheduler.generateAllocations(args.nrHosts, seed=1)
+        requirements = {"node0": dict(imageLabel="label0", imageHint="hint", pool="default")}
+        allocationInfo = dict(user="benchmark", purpose="user", nice=0)
+        with globallock.lock():
+            indices = [tested.create(requirements, allocationInfo).index()
+                       for _ in xrange(args.nrAllocations)]
+    print "%(nrHosts)d hosts, %(nrAllocations)d allocations, polled during a %(reloadDuration).1f " \
+        "second reload" % vars(args)
+    for name, poll in (("under the global lock", lockedPoll), ("lock-free", lockFreePoll)):
+        result = measure(tested, indices, poll, args)
+        print "%(name)22s: %(count)8d polls, latency p50 %(p50).6f p99 %(p99).6f max %(max).6f seconds" % \
+            dict(result, name=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=5000, type=int)
+    parser.add_argument("--nrAllocations", default=200, type=int)
+    parser.add_argument("--reloadDuration", default=1.0, type=float)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,100 @@
+import time
+import mock
+import argparse
+from rackattack.common import globallock
+from rackattack.physical.alloc import freepool
+from rackattack.physical.alloc import priority
+from rackattack.physical.alloc import preemptioncandidates
+from rackattack.physical.tests import common
+from rackattack.physical.tests.benchmarks import syntheticrack
+
+
+# The first-fit allocation that the matching engine replaced, kept as the baseline to compare against
+class GreedyPriority(priority.Priority):
+    def _allocate(self):
+        freeAndNicer = [priority.Host(stateMachine, None) for stateMachine in self._freePool.all()]
+        for allocation in self._nicerAllocationsInPreemptionOrder():
+            freeAndNicer += [priority.Host(s, allocation) for s in allocation.allocated().values()]
+        allocated = []
+        for name, requirement in self._requirements.iteritems():
+            for candidate in freeAndNicer:
+                if candidate.stateMachine.hostImplementation().fulfillsRequirement(requirement):
+                    allocated.append((name, candidate))
+                    freeAndNicer.remove(candidate)
+                    break
+            else:
+                raise priority.OutOfResourcesError("Greedy allocation failed")
+        self._withdrawExistingAllocations(allocated)
+        self._takeOutOfFreePool(allocated)
+        return {name: h.stateMachine for name, h in allocated}
+
+
+def generateRequirements(nrNodes):
+    requirements = dict()
+    for idx in xrange(nrNodes):
+        requirement = dict(imageLabel="label%d" % idx, imageHint="hint")
+        if idx % 10 == 0:
+            requirement["serverIDWildcard"] = "rack01-*"
+        elif idx % 10 in (1, 2):
+            requirement["hardwareConstraints"] = dict(minimumNrNICBondings=1)
+        elif idx % 10 == 3:
+            requirement["pool"] = "performance"
+        requirements["node%03d" % idx] = requirement
+    return requirements
+
+
+def generateRack(nrHosts, busyFraction, nrHostsPerExistingAllocation):
+    stateMachines = syntheticrack.generateStateMachines(nrHosts)
+    hosts = mock.Mock()
+    freePool = freepool.FreePool(hosts)
+    preemptionCandidates = preemptioncandidates.PreemptionCandidates()
+    nrBusy = int(nrHosts * busyFraction)
+    for first in xrange(0, nrBusy, nrHostsPerExistingAllocation):
+        allocated = stateMachines[first:min(first + nrHostsPerExistingAllocation, nrBusy)]
+        preemptionCandidates.add(common.Allocation(allocated, freePool, hosts, nice=0.9))
+    for stateMachine in stateMachines[nrBusy:]:
+        freePool.put(stateMachine)
+    return freePool, preemptionCandidates
+
+
+def measure(priorityClass, args):
+    requirements = generateRequirements(args.nrNodes)
+    allocationInfo = dict(user="benchmark", purpose="user", nice=0)
+    durations = []
+    nrRejected = 0
+    nrPreempted = 0
+    for _ in xrange(args.nrRuns):
+        freePool, preemptionCandidates = generateRack(args.nrHosts, args.busyFraction,
+                                                      args.nrHostsPerExistingAllocation)
+        nrCandidatesBefore = len(preemptionCandidates)
+        before = time.time()
+        try:
+            priorityClass(requirements, allocationInfo, freePool, preemptionCandidates)
+        except priority.OutOfResourcesError:
+            nrRejected += 1
+        durations.append(time.time() - before)
+        nrPreempted += nrCandidatesBefore - len(list(preemptionCandidates.nicerThan(0)))
+    return dict(averageDuration=sum(durations) / len(durations), maxDuration=max(durations),
+                nrRejected=nrRejected, averageNrPreempted=float(nrPreempted) / args.nrRuns)
+
+
+def main(args):
+    print "%(nrHosts)d hosts, %(busy)d%% busy, %(nrNodes)d-node requests, %(nrRuns)d runs" % dict(
+        nrHosts=args.nrHosts, busy=int(args.busyFraction * 100), nrNodes=args.nrNodes, nrRuns=args.nrRuns)
+    with globallock.lock():
+        for name, priorityClass in (("greedy", GreedyPriority), ("matching", priority.Priority)):
+            results = measure(priorityClass, args)
+            print "%(name)10s: average %(averageDuration).4f seconds, max %(maxDuration).4f seconds, " \
+                "%(nrRejected)d rejected, %(averageNrPreempted).1f allocations preempted on average" % \
+                dict(results, name=name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=5000, type=int)
+    parser.add_argument("--nrNodes", default=200, type=int)
+    parser.add_argument("--nrRuns", default=5, type=int)
+    parser.add_argument("--busyFraction", default=0.97, type=float)
+    parser.add_argument("--nrHostsPerExistingAllocation", default=10, type=int)
+    args = parser.parse_args()
+    main(args)
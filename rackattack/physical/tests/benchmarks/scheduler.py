@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import mock
+import argparse
+from rackattack.common import timer
+from rackattack.common import globallock
+from rackattack.physical.alloc import freepool
+from rackattack.physical.alloc import allocations
+from rackattack.physical.alloc import osmosislabels
+from rackattack.physical.tests import common
+from rackattack.physical.tests.benchmarks import syntheticrack
+from rackattack.physical.tests.benchmarks import trace
+
+
+class NullBroadcaster:
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(durations):
+    return dict(count=len(durations), p50=percentile(durations, 0.5), p99=percentile(durations, 0.99),
+                max=max(durations) if durations else None, total=sum(durations))
+
+
+def generateAllocations(nrHosts, seed):
+    hosts = common.Hosts()
+    freePool = freepool.FreePool(hosts)
+    with globallock.lock():
+        for stateMachine in syntheticrack.generateStateMachines(nrHosts, seed):
+            hosts.add(stateMachine)
+            freePool.put(stateMachine)
+    return allocations.Allocations(broadcaster=NullBroadcaster(), hosts=hosts, freePool=freePool,
+                                   osmosisServer="objectstore")
+
+
+class Replay:
+    def __init__(self, tested, events):
+        self._tested = tested
+        self._events = events
+        self._allocationOfTraceID = dict()
+        self._latencies = dict(allocate=[], free=[], heartbeat=[])
+        self._lockHoldTimes = dict(allocate=[], free=[], heartbeat=[])
+        self._nrGranted = 0
+        self._nrRejected = 0
+
+    def run(self):
+        before = time.time()
+        for event in self._events:
+            getattr(self, "_" + event["op"])(event)
+        duration = time.time() - before
+        return dict(nrEvents=len(self._events), duration=duration, nrGranted=self._nrGranted,
+                    nrRejected=self._nrRejected, allocationsPerSecond=self._nrGranted / duration,
+                    latency={op: summarize(values) for op, values in self._latencies.iteritems()},
+                    lockHold={op: summarize(values) for op, values in self._lockHoldTimes.iteritems()})
+
+    def _allocate(self, event):
+        requirements = trace.requirementsOf(event)
+        before = time.time()
+        self._tested.preAdmit(requirements)
+        with self._measuredLock("allocate"):
+            try:
+                self._allocationOfTraceID[event["allocation"]] = self._tested.create(
+                    requirements, trace.allocationInfoOf(event))
+                self._nrGranted += 1
+            except Exception:
+                self._nrRejected += 1
+        self._latencies["allocate"].append(time.time() - before)
+
+    def _free(self, event):
+        allocation = self._allocationOfTraceID.pop(event["allocation"], None)
+        if allocation is None:
+            return
+        before = time.time()
+        with self._measuredLock("free"):
+            if allocation.dead() is None:
+                allocation.free()
+        self._latencies["free"].append(time.time() - before)
+
+    def _heartbeat(self, event):
+        before = time.time()
+        with self._measuredLock("heartbeat"):
+            for allocation in self._tested.all():
+                allocation.heartbeat()
+        self._latencies["heartbeat"].append(time.time() - before)
+
+    def _measuredLock(self, op):
+        return _MeasuredLock(self._lockHoldTimes[op])
+
+
+class _MeasuredLock:
+    def __init__(self, holdTimes):
+        self._holdTimes = holdTimes
+        self._lock = globallock.lock()
+
+    def __enter__(self):
+        self._lock.__enter__()
+        self._acquired = time.time()
+
+    def __exit__(self, *args):
+        self._holdTimes.append(time.time() - self._acquired)
+        return self._lock.__exit__(*args)
+
+
+def listAllLabels(cmd):
+    return "\n".join(common.labelsOfListLabelsCommand(cmd))
+
+
+def main(args):
+    timer.scheduleIn = lambda **kwargs: None
+    timer.cancelAllByTag = lambda **kwargs: None
+    results = dict(arguments=vars(args), timestamp=time.time(), runs=[])
+    with mock.patch.object(osmosislabels.sh, "run", listAllLabels):
+        for nrHosts in args.nrHosts:
+            if args.trace is None:
+                events = trace.generate(nrHosts, args.nrEvents, args.seed)
+                traceName = "generated"
+            else:
+                events = trace.load(args.trace)
+                traceName = os.path.basename(args.trace)
+            if args.saveTrace is not None:
+                trace.save(events, args.saveTrace)
+            run = Replay(generateAllocations(nrHosts, args.seed), events).run()
+            run.update(nrHosts=nrHosts, trace=traceName)
+            results["runs"].append(run)
+            report(run)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(json.load(f), results)
+
+
+def report(run):
+    print "%(nrHosts)6d hosts, %(trace)s trace of %(nrEvents)d events: %(nrGranted)d granted, " \
+        "%(nrRejected)d rejected, %(allocationsPerSecond).1f allocations/sec" % run
+    for op in sorted(run["latency"]):
+        latency = run["latency"][op]
+        if not latency["count"]:
+            continue
+        lockHold = run["lockHold"][op]
+        print "    %(op)10s x%(count)-6d latency p50 %(p50).5f p99 %(p99).5f, " \
+            "lock held p50 %(holdP50).5f p99 %(holdP99).5f max %(holdMax).5f seconds" % dict(
+                latency, op=op, holdP50=lockHold["p50"], holdP99=lockHold["p99"], holdMax=lockHold["max"])
+
+
+def compare(baseline, results):
+    baselineRuns = {(run["nrHosts"], run["trace"]): run for run in baseline["runs"]}
+    for run in results["runs"]:
+        before = baselineRuns.get((run["nrHosts"], run["trace"]))
+        if before is None:
+            continue
+        for op in sorted(run["latency"]):
+            if not run["latency"][op]["count"] or not before["latency"][op]["count"]:
+                continue
+            print "%(nrHosts)6d hosts %(op)10s: p99 latency %(before).5f -> %(after).5f seconds" % dict(
+                nrHosts=run["nrHosts"], op=op, before=before["latency"][op]["p99"],
+                after=run["latency"][op]["p99"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=[100, 1000, 5000, 20000], type=int, nargs="+")
+    parser.add_argument("--nrEvents", default=2000, type=int)
+    parser.add_argument("--seed", default=1, type=int)
+    parser.add_argument("--trace", help="Replay a recorded trace instead of generating one")
+    parser.add_argument("--saveTrace", help="Record the replayed trace to this file")
+    parser.add_argument("--output", help="Write machine-readable results to this file")
+    parser.add_argument("--baseline", help="Compare to results previously written with --output")
+    args = parser.parse_args()
+    if args.saveTrace is not None and len(args.nrHosts) > 1:
+        parser.error("--saveTrace records the trace of a single rack size")
+    main(args)
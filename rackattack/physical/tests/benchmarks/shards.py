@@ -0,0 +1,75 @@
+import os
+import mock
+import time
+import yaml
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from rackattack.physical import config
+from rackattack.physical import dynamicconfig
+from rackattack.physical.tests.benchmarks import hoststates
+from rackattack.physical.tests.benchmarks import syntheticrack
+
+
+def writeShards(directory, hostsData):
+    shards = dict()
+    for hostData in hostsData:
+        shards.setdefault(hostData["topology"]["rackID"], []).append(hostData)
+    for rackID, hosts in shards.iteritems():
+        with open(os.path.join(directory, rackID + ".yaml"), "w") as f:
+            f.write(yaml.dump(dict(HOSTS=hosts)))
+    return sorted(shards)
+
+
+def loadShards(tested):
+    before = time.time()
+    files = tested._configurationFiles()
+    tested._loadShards([(filename, rackID, os.stat(filename).st_mtime) for filename, rackID in files])
+    return time.time() - before
+
+
+def main(args):
+    hostsData = syntheticrack.generateHostsData(args.nrHosts)
+    directory = tempfile.mkdtemp()
+    try:
+        monolithic = os.path.join(directory, "rack.yaml")
+        with open(monolithic, "w") as f:
+            f.write(yaml.dump(dict(HOSTS=hostsData)))
+        shardsDirectory = os.path.join(directory, "shards")
+        os.mkdir(shardsDirectory)
+        rackIDs = writeShards(shardsDirectory, hostsData)
+        print "%(nrHosts)d hosts in %(nrShards)d shards, %(nrCPUs)d CPUs, LibYAML %(libyaml)s" % dict(
+            nrHosts=args.nrHosts, nrShards=len(rackIDs), nrCPUs=multiprocessing.cpu_count(),
+            libyaml="available" if yaml.__with_libyaml__ else "missing")
+        before = time.time()
+        with open(monolithic) as f:
+            yaml.load(f.read(), Loader=yaml.Loader)
+        print "%30s: %.3f seconds" % ("monolithic, pure-Python loader", time.time() - before)
+        tested = hoststates.createDynamicConfig(mock.Mock())
+        with mock.patch.object(config, "RACK_YAML", shardsDirectory):
+            print "%30s: %.3f seconds" % ("sharded, cold", loadShards(tested))
+            shard = os.path.join(shardsDirectory, rackIDs[0] + ".yaml")
+            with open(shard, "a") as f:
+                f.write("\n")
+            os.utime(shard, (time.time() + 1, time.time() + 1))
+            print "%30s: %.3f seconds" % ("sharded, one shard modified", loadShards(tested))
+            if args.nrProcesses > 1:
+                tested = hoststates.createDynamicConfig(mock.Mock())
+                tested._parsingPool = dynamicconfig.createParsingPool(args.nrProcesses)
+                try:
+                    print "%30s: %.3f seconds" % ("sharded, cold, %d processes" % args.nrProcesses,
+                                                  loadShards(tested))
+                finally:
+                    tested._parsingPool.terminate()
+                    tested._parsingPool.join()
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nrHosts", default=10000, type=int)
+    parser.add_argument("--nrProcesses", default=multiprocessing.cpu_count(), type=int)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,49 @@
+import mock
+import random
+from rackattack.physical import host
+from rackattack.physical import ipmi
+from rackattack.physical.tests.common import HostStateMachine
+
+POOLS = (("default", 0.7), ("performance", 0.2), ("storage", 0.1))
+NIC_BONDINGS_MIX = ((0, 0.6), (1, 0.25), (2, 0.15))
+NR_HOSTS_PER_RACK = 48
+
+
+def weightedChoice(randomInstance, choices):
+    point = randomInstance.random()
+    for value, weight in choices:
+        point -= weight
+        if point <= 0:
+            return value
+    return choices[-1][0]
+
+
+def hostID(idx):
+    return "rack%02d-server%02d" % (idx // NR_HOSTS_PER_RACK + 1, idx % NR_HOSTS_PER_RACK + 1)
+
+
+def generateHostsData(nrHosts, seed=1):
+    randomInstance = random.Random(seed)
+    result = []
+    for idx in xrange(nrHosts):
+        nrNICBondings = weightedChoice(randomInstance, NIC_BONDINGS_MIX)
+        hostData = dict(id=hostID(idx),
+                        ipmiLogin=dict(hostname="10.0.%d.%d" % (idx // 250, idx % 250 + 1),
+                                       username="root", password="strato"),
+                        primaryMAC="00:1e:67:%02x:%02x:01" % (idx // 256, idx % 256),
+                        secondaryMAC="00:1e:67:%02x:%02x:02" % (idx // 256, idx % 256),
+                        topology=dict(rackID="rack%02d" % (idx // NR_HOSTS_PER_RACK + 1)),
+                        state="ONLINE",
+                        pool=weightedChoice(randomInstance, POOLS))
+        if nrNICBondings > 0:
+            hostData["NICBondings"] = [dict(name="bond%d" % bondIdx, slaves=["eth%d" % (bondIdx * 2),
+                                                                             "eth%d" % (bondIdx * 2 + 1)])
+                                       for bondIdx in xrange(nrNICBondings)]
+        result.append(hostData)
+    return result
+
+
+def generateStateMachines(nrHosts, seed=1):
+    with mock.patch.object(ipmi, "IPMI"):
+        return [HostStateMachine(host.Host(index=idx + 1, **hostData))
+                for idx, hostData in enumerate(generateHostsData(nrHosts, seed))]
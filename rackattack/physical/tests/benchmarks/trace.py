@@ -0,0 +1,57 @@
+import json
+import random
+from rackattack.physical.tests.benchmarks import syntheticrack
+
+NR_NODES_MIX = ((1, 0.45), (2, 0.15), (4, 0.15), (8, 0.1), (16, 0.08), (32, 0.05), (64, 0.02))
+PURPOSES = (("user", 0.3), ("racktest", 0.5), ("dirbalak", 0.2))
+OPERATIONS = (("allocate", 0.45), ("free", 0.35), ("heartbeat", 0.2))
+NR_LABELS = 50
+
+
+def generate(nrHosts, nrEvents, seed=1):
+    randomInstance = random.Random(seed)
+    maximumNrNodes = max(1, nrHosts // 10)
+    events = []
+    live = []
+    nextAllocation = 0
+    for _ in xrange(nrEvents):
+        operation = syntheticrack.weightedChoice(randomInstance, OPERATIONS)
+        if operation == "free" and not live:
+            operation = "allocate"
+        if operation == "allocate":
+            nrNodes = min(syntheticrack.weightedChoice(randomInstance, NR_NODES_MIX), maximumNrNodes)
+            events.append(dict(op="allocate", allocation=nextAllocation, nrNodes=nrNodes,
+                               pool=syntheticrack.weightedChoice(randomInstance, syntheticrack.POOLS),
+                               minimumNrNICBondings=randomInstance.choice((0, 0, 0, 1)),
+                               purpose=syntheticrack.weightedChoice(randomInstance, PURPOSES),
+                               nice=round(randomInstance.random(), 2),
+                               label="label%d" % randomInstance.randrange(NR_LABELS)))
+            live.append(nextAllocation)
+            nextAllocation += 1
+        elif operation == "free":
+            allocation = live.pop(randomInstance.randrange(len(live)))
+            events.append(dict(op="free", allocation=allocation))
+        else:
+            events.append(dict(op="heartbeat"))
+    return events
+
+
+def requirementsOf(event):
+    requirement = dict(imageLabel=event["label"], imageHint="hint", pool=event["pool"],
+                       hardwareConstraints=dict(minimumNrNICBondings=event["minimumNrNICBondings"]))
+    return {"node%d" % idx: dict(requirement) for idx in xrange(event["nrNodes"])}
+
+
+def allocationInfoOf(event):
+    return dict(user="benchmark", purpose=event["purpose"], nice=event["nice"])
+
+
+def save(events, filename):
+    with open(filename, "w") as f:
+        for event in events:
+            f.write(json.dumps(event, sort_keys=True) + "\n")
+
+
+def load(filename):
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -5,6 +5,7 @@ from rackattack.common import hosts
 from rackattack.common import globallock
 from rackattack.physical.alloc import freepool
 from rackattack.physical.alloc import priority
+from rackattack.physical.alloc import preemptioncandidates
 from rackattack.physical.tests.common import HostStateMachine, Allocation, Host
 
 
@@ -17,6 +18,7 @@ class Test(unittest.TestCase):
         self.hostsStateMachines = mock.Mock()
         self.allocationInfo = api.AllocationInfo(user='test', purpose='user', nice=0.5).__dict__
         self.allocations = []
+        self.preemptionCandidates = preemptioncandidates.PreemptionCandidates()
         self.requirements = {}
 
     @staticmethod
@@ -25,17 +27,17 @@ class Test(unittest.TestCase):
 
     def construct(self):
         self.tested = priority.Priority(
-            self.requirements, self.allocationInfo, self.freePool, self.allocations)
+            self.requirements, self.allocationInfo, self.freePool, self.preemptionCandidates)
 
     def test_NoHostsAllocationFailes(self):
-        self.requirements['yuvu'] = 'spec'
+        self.requirements['yuvu'] = dict()
         with self.assertRaises(priority.OutOfResourcesError):
             self.construct()
 
     def test_AllocateOneFromFreePool(self):
         stateMachine = self._generateStateMachine('host1')
         self.freePool.put(stateMachine)
-        self.requirements['yuvu'] = 'spec'
+        self.requirements['yuvu'] = dict()
         self.construct()
         self.assertEquals(len(self.tested.allocated()), 1)
         self.assertIs(self.tested.allocated()['yuvu'], stateMachine)
@@ -44,8 +46,8 @@ class Test(unittest.TestCase):
     def test_AllocateOneByWithdrawingAnAllocation(self):
         stateMachine = self._generateStateMachine('host1')
         allocated = [stateMachine]
-        self.allocations.append(Allocation(allocated, self.freePool, self.hostsStateMachines, 0.9))
-        self.requirements['yuvu'] = 'spec'
+        self._addAllocation(Allocation(allocated, self.freePool, self.hostsStateMachines, 0.9))
+        self.requirements['yuvu'] = dict()
         self.construct()
         self.assertEquals(len(self.tested.allocated()), 1)
         self.assertIs(self.tested.allocated()['yuvu'], stateMachine)
@@ -55,8 +57,8 @@ class Test(unittest.TestCase):
     def test_DoesNotTakeMachinesFromHigherPriority(self):
         stateMachine = self._generateStateMachine('host1')
         allocated = [stateMachine]
-        self.allocations.append(Allocation(allocated, self.freePool, self.hostsStateMachines, 0.1))
-        self.requirements['yuvu'] = 'spec'
+        self._addAllocation(Allocation(allocated, self.freePool, self.hostsStateMachines, 0.1))
+        self.requirements['yuvu'] = dict()
         with self.assertRaises(priority.OutOfResourcesError):
             self.construct()
         self.assertEquals(len(self.allocations[0].allocated()), 1)
@@ -64,10 +66,10 @@ class Test(unittest.TestCase):
     def test_AllocateOneFromFreePool_DontTouchExisting(self):
         stateMachineWhichIsAlreadyAllocated = self._generateStateMachine('busyHost')
         allocated = [stateMachineWhichIsAlreadyAllocated]
-        self.allocations.append(Allocation(allocated, self.freePool, self.hostsStateMachines, 0.9))
+        self._addAllocation(Allocation(allocated, self.freePool, self.hostsStateMachines, 0.9))
         stateMachineExpectedToBeAllocated = self._generateStateMachine('freeHost')
         self.freePool.put(stateMachineExpectedToBeAllocated)
-        self.requirements['yuvu'] = 'spec'
+        self.requirements['yuvu'] = dict()
         self.construct()
         self.assertEquals(len(self.tested.allocated()), 1)
         self.assertIs(self.tested.allocated()['yuvu'], stateMachineExpectedToBeAllocated)
@@ -84,7 +86,7 @@ class Test(unittest.TestCase):
             stateMachine = self._generateStateMachine('stateMachine_%(idx)s' % dict(idx=idx))
             allocated = [stateMachine]
             allocation = Allocation(allocated, self.freePool, self.hostsStateMachines, nice)
-            self.allocations.append(allocation)
+            self._addAllocation(allocation)
             if nice == nicest:
                 nicestAllocations.append(allocation)
             machines.append(stateMachine)
@@ -93,7 +95,7 @@ class Test(unittest.TestCase):
         youngestOfNicestAllocations = nicestAllocations[-1]
         allocationExpectedToBePreempted = youngestOfNicestAllocations
         machineExpectedToBePreempted = allocationExpectedToBePreempted.allocated()['yuvu0']
-        self.requirements['yuvu'] = 'spec'
+        self.requirements['yuvu'] = dict()
         self.construct()
         self.assertEquals(len(self.tested.allocated()), 1)
         self.assertIs(self.tested.allocated()['yuvu'], machineExpectedToBePreempted)
@@ -109,18 +111,60 @@ class Test(unittest.TestCase):
         stateMachine = self._generateStateMachine('host1')
         allocated = [stateMachine]
         allocationNotToTakeHostsFrom = Allocation(allocated, self.freePool, self.hostsStateMachines, 0.9)
-        self.allocations.append(allocationNotToTakeHostsFrom)
+        self._addAllocation(allocationNotToTakeHostsFrom)
         allocationNotToTakeHostsFrom.withdraw("some reason")
         self.assertIsNotNone(self.allocations[0].dead())
         self.assertEquals(list(self.freePool.all())[0], stateMachine)
         self.assertEquals(len(list(self.freePool.all())), 1)
-        self.requirements['yuvu1'] = 'spec'
-        self.requirements['yuvu2'] = 'spec'
+        self.requirements['yuvu1'] = dict()
+        self.requirements['yuvu2'] = dict()
         with self.assertRaises(priority.OutOfResourcesError):
             self.construct()
         self.assertEquals(len(list(self.freePool.all())), 1)
         self.assertIsNotNone(self.allocations[0].dead())
 
+    def test_ReassignsHostsToSatisfyMixedRequirements(self):
+        anyHost = self._generateStateMachine('host1')
+        specificHost = self._generateStateMachine('host2')
+        self.freePool.put(specificHost)
+        self.freePool.put(anyHost)
+        self.requirements['a'] = dict()
+        self.requirements['b'] = dict(serverIDWildcard='host2')
+        self.construct()
+        self.assertIs(self.tested.allocated()['a'], anyHost)
+        self.assertIs(self.tested.allocated()['b'], specificHost)
+        self.assertEquals(len(list(self.freePool.all())), 0)
+
+    def test_DoesNotPreemptAnAllocationWhoseHostsAreNotNeeded(self):
+        spareable = self._generateStateMachine('spareable')
+        specific = self._generateStateMachine('specific')
+        other = self._generateStateMachine('other')
+        olderAllocation = Allocation([specific, other], self.freePool, self.hostsStateMachines, 0.9)
+        self._addAllocation(olderAllocation)
+        youngerAllocation = Allocation([spareable], self.freePool, self.hostsStateMachines, 0.9)
+        self._addAllocation(youngerAllocation)
+        self.requirements['a'] = dict()
+        self.requirements['b'] = dict(serverIDWildcard='specific')
+        self.construct()
+        self.assertIs(self.tested.allocated()['a'], other)
+        self.assertIs(self.tested.allocated()['b'], specific)
+        self.assertIsNotNone(olderAllocation.dead())
+        self.assertIsNone(youngerAllocation.dead())
+        self.assertEquals(youngerAllocation.allocated().values(), [spareable])
+
+    def test_IdenticalRequirementsGetDistinctHosts(self):
+        stateMachines = [self._generateStateMachine('host%d' % idx) for idx in xrange(5)]
+        for stateMachine in stateMachines:
+            self.freePool.put(stateMachine)
+        for idx in xrange(5):
+            self.requirements['node%d' % idx] = dict(imageLabel='label%d' % idx, imageHint='hint')
+        self.construct()
+        self.assertEquals(set(self.tested.allocated().values()), set(stateMachines))
+
+    def _addAllocation(self, allocation):
+        self.allocations.append(allocation)
+        self.preemptionCandidates.add(allocation)
+
     def _generateStateMachine(self, name):
         stateMachine = HostStateMachine(Host(name))
         self.hosts.add(stateMachine)
@@ -8,6 +8,7 @@ from rackattack.tcp import publish
 from rackattack.common import timer
 from rackattack.common import globallock
 from rackattack.physical.alloc import allocation
+from rackattack.physical.alloc import heartbeats
 from rackattack.physical.alloc.freepool import FreePool
 from rackattack.physical.tests.common import (HostStateMachine, Host, Hosts, Publish,
                                               executeCodeWhileAllocationIsDeadOfHeartbeatTimeout)
@@ -21,10 +22,9 @@ class Test(unittest.TestCase):
     def setUp(self):
         self.addCleanup(globallock._lock.release)
         globallock._lock.acquire()
-        self.currentTimer = None
-        self.currentTimerTag = None
-        timer.scheduleIn = self.scheduleTimerIn
-        timer.cancelAllByTag = self.cancelAllTimersByTag
+        timer.scheduleIn = mock.Mock()
+        timer.cancelAllByTag = mock.Mock()
+        self.heartbeats = heartbeats.Heartbeats()
         requirements = dict(node0=dict(imageHint='alpha-bravo', imageLabel='tango-lima'),
                             node1=dict(imageHint='charlie-delta', imageLabel='kilo-juliet'),
                             node2=dict(imageHint='echo-foxtrot', imageLabel='zooloo-papa'))
@@ -45,7 +45,7 @@ class Test(unittest.TestCase):
         for stateMachine in allocated.values():
             self.hosts.add(stateMachine)
         self.tested = allocation.Allocation(self.index, requirements, self.allocationInfo, allocated,
-                                            self.broadcaster, self.freepool, self.hosts)
+                                            self.broadcaster, self.freepool, self.hosts, self.heartbeats)
 
     def test_Index(self):
         self.assertEquals(self.tested.index(), self.index)
@@ -82,11 +82,11 @@ class Test(unittest.TestCase):
         self.validate()
 
     def test_HeartBeatWhenDeadDoesNothing(self):
-        self.assertIsNotNone(self.currentTimer)
+        self.assertIn(self.tested, self.heartbeats)
         self.tested.free()
-        self.assertIsNone(self.currentTimer)
+        self.assertNotIn(self.tested, self.heartbeats)
         self.tested.heartbeat()
-        self.assertIsNone(self.currentTimer)
+        self.assertNotIn(self.tested, self.heartbeats)
         self.validate()
 
     def test_NotDeadForAWhileIfNotDead(self):
@@ -115,7 +115,7 @@ class Test(unittest.TestCase):
             time.time = orig_time
 
     def test_HeartBeatTimeout(self):
-        self.currentTimer()
+        self.heartbeats.expire(time.time() + heartbeats.Heartbeats.TIMEOUT + 2)
         self.assertEquals(self.tested.dead(), "heartbeat timeout")
         self.validate()
 
@@ -195,6 +195,14 @@ class Test(unittest.TestCase):
         self.releaseHost(machine)
         self.validate()
 
+    def test_InauguratedByHostID(self):
+        self.assertRaises(AssertionError, self.tested.inauguratedByHostID, 'node0')
+        self.fakeInaugurationDoneForAll()
+        self.assertIs(self.tested.inauguratedByHostID('node0'), self.originalAllocated['node0'])
+        self.releaseHost(self.originalAllocated['node0'])
+        self.assertIsNone(self.tested.inauguratedByHostID('node0'))
+        self.assertIs(self.tested.inauguratedByHostID('node1'), self.originalAllocated['node1'])
+
     def test_CannotRelaseHostAfterDestroyed(self):
         machine = self.originalAllocated['node0']
         self.destroyMachineByName('node0')
@@ -253,19 +261,6 @@ class Test(unittest.TestCase):
                 collection.remove(stateMachine)
                 self.expectedStates["inaugurated"].add(stateMachine)
 
-    def scheduleTimerIn(self, timeout, callback, tag):
-        self.assertIs(self.currentTimer, None)
-        self.assertIs(self.currentTimerTag, None)
-        self.currentTimer = callback
-        self.currentTimerTag = tag
-
-    def cancelAllTimersByTag(self, tag):
-        if self.currentTimerTag is not None:
-            self.assertIsNot(self.currentTimer, None)
-            self.assertIs(self.currentTimerTag, tag)
-        self.currentTimer = None
-        self.currentTimerTag = None
-
     def _validateFreePool(self):
         isDead = self.tested.dead() is not None
         expectedHostsInFreePool = set()
@@ -291,6 +286,10 @@ class Test(unittest.TestCase):
             expected = expected.union(self.expectedStates["inaugurated"])
         expected = {stateMachine.hostImplementation().id(): stateMachine for stateMachine in expected}
         self.assertEquals(expected, actual)
+        self.assertEquals(set(expected.values()), set(self.tested.stateMachines()))
+        for stateMachine in self.originalAllocated.values():
+            self.assertEquals(stateMachine in expected.values(),
+                              self.tested.containsStateMachine(stateMachine))
 
     def _validateInaugurated(self):
         isDead = self.tested.dead() is not None
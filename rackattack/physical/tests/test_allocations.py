@@ -7,12 +7,13 @@ from rackattack.common import globallock
 from rackattack.physical.alloc import allocation, priority, freepool
 from rackattack.physical.alloc.allocations import Allocations
 from rackattack.physical.tests.common import (Host, HostStateMachine, Hosts, Publish,
-                                              executeCodeWhileAllocationIsDeadOfHeartbeatTimeout)
+                                              executeCodeWhileAllocationIsDeadOfHeartbeatTimeout,
+                                              labelsOfListLabelsCommand)
 
 
 def osmosisListLabelsFoundMock(cmd):
     if cmd[0:2] == ['osmosis', 'listlabels']:
-        return cmd[2]
+        return "\n".join(labelsOfListLabelsCommand(cmd))
     raise ValueError("Implement me")
 
 
@@ -69,7 +70,7 @@ class Test(unittest.TestCase):
 
         def anotherLabelMock(cmd):
             if cmd[0:2] == ['osmosis', 'listlabels']:
-                return cmd[2] + "_not"
+                return "\n".join(label + "_not" for label in labelsOfListLabelsCommand(cmd))
             abused = True
         self.assertRaises(Exception, self.createAllocation, self.requirements, self.allocationInfo,
                           listLabelsMock=anotherLabelMock)
@@ -92,6 +93,53 @@ class Test(unittest.TestCase):
         self.assertRaises(IndexError, executeCodeWhileAllocationIsDeadOfHeartbeatTimeout, _allocation,
                           lambda: self.tested.byIndex(idx))
 
+    def test_PublishedStatus(self):
+        _allocation = self.createAllocation(self.requirements, self.allocationInfo)
+        idx = _allocation.index()
+        self.assertEquals(self.tested.publishedStatus(idx), (_allocation, False, None, None))
+        _allocation.free()
+        status = self.tested.publishedStatus(idx)
+        self.assertEquals(status.dead, "freed")
+        self.assertEquals(status.endOfLimboTimestamp, _allocation.endOfLimboTimestamp())
+        self.assertRaises(IndexError, executeCodeWhileAllocationIsDeadOfHeartbeatTimeout, _allocation,
+                          lambda: self.tested.publishedStatus(idx))
+        self.assertRaises(IndexError, self.tested.publishedStatus, idx + 1)
+
+    def test_AllocationOf(self):
+        _allocation = self.createAllocation(self.requirements, self.allocationInfo)
+        node0, node1 = _allocation.allocated()['node0'], _allocation.allocated()['node1']
+        free = list(self.freePool.all())[0]
+        self.assertIs(self.tested.allocationOf(node0), _allocation)
+        self.assertIs(self.tested.allocationOf(node1), _allocation)
+        self.assertIsNone(self.tested.allocationOf(free))
+        _allocation.releaseHost(node0)
+        self.assertIsNone(self.tested.allocationOf(node0))
+        self.assertIs(self.tested.allocationOf(node1), _allocation)
+        _allocation.free()
+        self.assertIsNone(self.tested.allocationOf(node1))
+
+    def test_AllocationOfIsUpdatedWithoutBeingQueried(self):
+        _allocation = self.createAllocation(self.requirements, self.allocationInfo)
+        node0, node1 = _allocation.allocated()['node0'], _allocation.allocated()['node1']
+        _allocation.releaseHost(node0)
+        self.assertEquals(self.tested._allocationOfStateMachine, {node1: _allocation})
+        node1.destroy()
+        self.assertTrue(_allocation.dead())
+        self.assertEquals(self.tested._allocationOfStateMachine, dict())
+        self.assertEquals(self.tested._stateMachinesOfAllocation, dict())
+
+    def test_AllocationOfAHostThatMovedToANewerAllocation(self):
+        first = self.createAllocation(self.requirements, self.allocationInfo)
+        node0 = first.allocated()['node0']
+        first.releaseHost(node0)
+        for stateMachine in list(self.freePool.all()):
+            if stateMachine is not node0:
+                self.freePool.takeOut(stateMachine)
+        second = self.createAllocation(dict(node0=self.requirements['node0']), self.allocationInfo)
+        self.assertIs(self.tested.allocationOf(node0), second)
+        first.free()
+        self.assertIs(self.tested.allocationOf(node0), second)
+
     def test_AllCleansUp(self):
         _allocation = self.createAllocation(self.requirements, self.allocationInfo)
         _allocation.free()
@@ -100,6 +148,30 @@ class Test(unittest.TestCase):
             self.assertNotIn(_allocation, self.tested.all())
         executeCodeWhileAllocationIsDeadOfHeartbeatTimeout(_allocation, validateNotInAll)
 
+    def test_DeadAllocationIsNoLongerAPreemptionCandidate(self):
+        _allocation = self.createAllocation(self.requirements, self.allocationInfo)
+        self.assertEquals(list(self.tested._preemptionCandidates.nicerThan(-1)), [_allocation])
+        _allocation.free()
+        self.assertEquals(len(self.tested._preemptionCandidates), 0)
+
+    def test_CleanupEvictsOnlyAllocationsWhoseLimboHasEnded(self):
+        first = self.createAllocation(dict(node0=self.requirements['node0']), self.allocationInfo)
+        second = self.createAllocation(dict(node1=self.requirements['node1']), self.allocationInfo)
+        first.free()
+        origTime = time.time
+        try:
+            time.time = mock.Mock(return_value=origTime() + first._LIMBO_AFTER_DEATH_DURATION / 2)
+            second.free()
+        finally:
+            time.time = origTime
+
+        def validateOnlyFirstWasEvicted():
+            self.assertFalse(second.deadForAWhile())
+            self.assertEquals(self.tested.all(), [second])
+            self.assertIs(self.tested.byIndex(second.index()), second)
+            self.assertRaises(IndexError, self.tested.byIndex, first.index())
+        executeCodeWhileAllocationIsDeadOfHeartbeatTimeout(first, validateOnlyFirstWasEvicted)
+
     def test_All(self):
         _allocation = self.createAllocation(self.requirements, self.allocationInfo)
         self.assertEquals(self.tested.all(), [_allocation])
@@ -173,6 +245,35 @@ class Test(unittest.TestCase):
         self.expectedRejectedBroadcasts.append(dict(reason="labelDoesNotExist"))
         self.validateRejectedBroadcasts()
 
+    def test_CreateManyComputesEligibilityOncePerBatch(self):
+        requests = [(dict(node0=self.requirements['node0']), dict(purpose='forfun', nice=nice))
+                    for nice in [0.5, 0.1, 0.9]]
+        with mock.patch.object(self.freePool, "eligible", wraps=self.freePool.eligible) as eligible:
+            with mock.patch.object(sh, "run", osmosisListLabelsFoundMock):
+                results = self.tested.createMany(requests)
+        self.assertEquals([result.index() for result in results], [2, 1, 3])
+        self.assertEquals(eligible.call_count, 1)
+        self.assertEquals(len(list(self.freePool.all())), 1)
+
+    def test_CreateManyEnumeratesPreemptionCandidatesOncePerBatch(self):
+        requests = [(self.requirements, dict(purpose='forfun', nice=nice)) for nice in [0.5, 0.1]]
+        candidates = self.tested._preemptionCandidates
+        with mock.patch.object(candidates, "nicerThan", wraps=candidates.nicerThan) as nicerThan:
+            with mock.patch.object(sh, "run", osmosisListLabelsFoundMock):
+                self.tested.create(self.requirements, dict(purpose='forfun', nice=0.9))
+                results = self.tested.createMany(requests)
+        self.assertEquals(nicerThan.call_count, 2)
+        self.assertEquals(nicerThan.call_args[0][0], priority.Priority.absoluteNice(requests[1][1]))
+        self.assertEquals([result.index() for result in results], [3, 2])
+
+    def test_CreateManySeesHostsReturnedToTheFreePoolDuringTheBatch(self):
+        requests = [(self.requirements, dict(purpose='forfun', nice=nice)) for nice in [0.1, 0.5]]
+        with mock.patch.object(sh, "run", osmosisListLabelsFoundMock):
+            victim = self.tested.create(self.requirements, dict(purpose='forfun', nice=0.9))
+            results = self.tested.createMany(requests)
+        self.assertEquals([result.index() for result in results], [2, 3])
+        self.assertIsNotNone(victim.dead())
+
     def createAllocation(self, requirements, allocationInfo, listLabelsMock=osmosisListLabelsFoundMock,
                          outOfResourcesExpected=False):
         origRun = sh.run
@@ -0,0 +1,63 @@
+import unittest
+from rackattack.physical import batcheddnsmasq
+
+
+class FakeDNSMasq(batcheddnsmasq.BatchedReloads):
+    def __init__(self):
+        self.entries = dict()
+        self.reloads = []
+
+    def add(self, mac, ipAddress):
+        assert mac not in self.entries
+        self.entries[mac] = ipAddress
+        self._reload()
+
+    def addIfNotAlready(self, mac, ipAddress):
+        if mac not in self.entries:
+            self.add(mac, ipAddress)
+
+    def _reloadImmediately(self):
+        self.reloads.append(dict(self.entries))
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tested = FakeDNSMasq()
+
+    def test_AddOutsideOfABatchReloadsImmediately(self):
+        self.tested.add("mac1", "10.0.0.1")
+        self.tested.add("mac2", "10.0.0.2")
+        self.assertEquals(len(self.tested.reloads), 2)
+
+    def test_AddManyReloadsOnce(self):
+        self.tested.add("mac1", "10.0.0.1")
+        self.tested.addMany([("mac%d" % idx, "10.0.0.%d" % idx) for idx in xrange(1, 101)])
+        self.assertEquals(len(self.tested.reloads), 2)
+        self.assertEquals(len(self.tested.reloads[-1]), 100)
+
+    def test_NestedBatchesReloadOnceWhenTheOutermostEnds(self):
+        with self.tested.batch():
+            self.tested.addMany([("mac1", "10.0.0.1")])
+            self.tested.add("mac2", "10.0.0.2")
+            self.assertEquals(self.tested.reloads, [])
+        self.assertEquals(self.tested.reloads, [dict(mac1="10.0.0.1", mac2="10.0.0.2")])
+
+    def test_ReservationsAddedBeforeAFailureAreReloaded(self):
+        origAdd = self.tested.add
+
+        def add(mac, ipAddress):
+            if mac == "mac2":
+                raise ValueError("dnsmasq is down")
+            origAdd(mac, ipAddress)
+        self.tested.add = add
+        self.assertRaises(ValueError, self.tested.addMany,
+                          [("mac1", "10.0.0.1"), ("mac2", "10.0.0.2"), ("mac3", "10.0.0.3")])
+        self.assertEquals(self.tested.reloads, [dict(mac1="10.0.0.1")])
+
+    def test_EmptyBatchDoesNotReload(self):
+        self.tested.addMany([])
+        self.assertEquals(self.tested.reloads, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import mock
+import unittest
+from twisted.internet import task
+from twisted.python import filepath
+from rackattack.physical import configwatcher
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.clock = task.Clock()
+        self.notifier = mock.Mock()
+        self.reload = mock.Mock()
+        self.tested = configwatcher.ConfigWatcher(
+            self.reload, "/etc/rack/rack.yaml", "/etc/rack/fragments", debounceInterval=2,
+            notifier=self.notifier, callLater=self.clock.callLater)
+        self.callback = self.notifier.watch.call_args[1]['callbacks'][0]
+
+    def changed(self, path):
+        self.callback(None, filepath.FilePath(path), 0)
+
+    def test_WatchesTheDirectoriesOfTheConfigurationFiles(self):
+        watched = [call[0][0].path for call in self.notifier.watch.call_args_list]
+        self.assertEquals(watched, ["/etc/rack", "/etc/rack/fragments"])
+
+    def test_BurstOfWritesIsDebouncedIntoASingleReload(self):
+        self.changed("/etc/rack/rack.yaml")
+        self.clock.advance(1.5)
+        self.changed("/etc/rack/fragments/rack02.yaml")
+        self.clock.advance(1.5)
+        self.changed("/etc/rack/rack.yaml")
+        self.clock.advance(1.5)
+        self.assertFalse(self.reload.called)
+        self.clock.advance(0.5)
+        self.reload.assert_called_once_with()
+        self.changed("/etc/rack/rack.yaml")
+        self.clock.advance(2)
+        self.assertEquals(self.reload.call_count, 2)
+
+    def test_ShardsDirectory(self):
+        notifier = mock.Mock()
+        with mock.patch.object(configwatcher.os.path, "isdir", return_value=True):
+            configwatcher.ConfigWatcher(self.reload, "/etc/rack/shards", notifier=notifier,
+                                        callLater=self.clock.callLater)
+        self.assertEquals([call[0][0].path for call in notifier.watch.call_args_list], ["/etc/rack/shards"])
+        callback = notifier.watch.call_args[1]['callbacks'][0]
+        callback(None, filepath.FilePath("/etc/rack/shards/README"), 0)
+        callback(None, filepath.FilePath("/etc/rack/shards/rack07.yaml"), 0)
+        self.clock.advance(2)
+        self.reload.assert_called_once_with()
+
+    def test_UnrelatedFilesAreIgnored(self):
+        self.changed("/etc/rack/conf.yaml")
+        self.changed("/etc/rack/.rack.yaml.swp")
+        self.changed("/etc/rack/fragments/README")
+        self.clock.advance(10)
+        self.assertFalse(self.reload.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
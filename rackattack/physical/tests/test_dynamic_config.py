@@ -3,6 +3,7 @@ import mock
 import contextlib
 from mock import patch
 from rackattack.physical import dynamicconfig
+from rackattack.physical import batcheddnsmasq
 from rackattack.common import hosts
 from rackattack.common import dnsmasq
 from rackattack.common import tftpboot
@@ -18,6 +19,7 @@ from rackattack.physical.host import Host, STATES
 from rackattack.physical import reclaimhost, network
 from rackattack.physical.alloc import freepool
 from rackattack.physical.alloc.allocation import Allocation
+from rackattack.physical.alloc.heartbeats import Heartbeats
 from rackattack.common.tests.mockfilesystem import enableMockedFilesystem, disableMockedFilesystem
 import netaddr
 import threading
@@ -27,23 +29,34 @@ import greenlet
 configurations = {}
 
 
-class FakeDNSMasq:
+class FakeDNSMasq(batcheddnsmasq.BatchedReloads):
     def __init__(self):
         self.items = dict()
         self.side_effect = None
+        self.nrReloads = 0
 
     def add(self, mac, address):
         if self.side_effect is not None:
             raise self.side_effect
         assert mac not in self.items
         self.items[mac] = address
+        self._reload()
+
+    def _reloadImmediately(self):
+        self.nrReloads += 1
+
+    def addIfNotAlready(self, mac, address):
+        if mac not in self.items:
+            self.add(mac, address)
 
     def reset(self):
         self.items = dict()
         self.side_effect = None
+        self.nrReloads = 0
 
     def remove(self, mac):
         del self.items[mac]
+        self._reload()
 
     def __getitem__(self, key):
         return self.items[key]
@@ -175,10 +188,12 @@ class Test(unittest.TestCase):
         threadInstance = args[0]
         self._threads.add(threadInstance)
 
-    def _generateTestedInstanceWithMockedThreading(self):
+    def _generateTestedInstanceWithMockedThreading(self, parsingPool=None):
         module = dynamicconfig
         self._origThreadInit = threading.Thread.__init__
         origThreadStart = threading.Thread.start
+        origThreadDaemon = threading.Thread.daemon
+        origEvent = threading.Event
         self._threads = set()
         try:
             module.threading.Thread.__init__ = \
@@ -193,10 +208,13 @@ class Test(unittest.TestCase):
                                                    tftpboot=self.tftpMock,
                                                    freePool=self.freePool,
                                                    allocations=self.allocationsMock,
-                                                   reclaimHost=self.reclaimHost)
+                                                   reclaimHost=self.reclaimHost,
+                                                   parsingPool=parsingPool)
         finally:
             threading.Thread.__init__ = self._origThreadInit
             threading.Thread.start = origThreadStart
+            threading.Thread.daemon = origThreadDaemon
+            threading.Event = origEvent
         assert len(self._threads) == 1
         thread = self._threads.pop()
         return instance
@@ -245,6 +263,16 @@ class Test(unittest.TestCase):
         self._reloadRackConf('offline_rack_conf.yaml')
         self._validate()
 
+    def test_TakingHostsOfflineOrDetachingThemDoesNotScanAllStateMachines(self, *_args):
+        self._init('online_rack_conf.yaml')
+        self._allocateHost(self.HOST_THAT_WILL_BE_TAKEN_OFFLINE)
+        self._allocateHost("rack01-server41")
+        with mock.patch.object(self._hosts, "all", wraps=self._hosts.all) as allStateMachines:
+            self._reloadRackConf('offline_rack_conf.yaml')
+            self._reloadRackConf('detached_rack_conf.yaml')
+        self.assertFalse(allStateMachines.called)
+        self._validate()
+
     def test_DetachOnlineHostWhileNotAllocated(self, *_args):
         self._init('online_rack_conf.yaml')
         self._validate()
@@ -339,6 +367,52 @@ class Test(unittest.TestCase):
             self.dnsMasqMock.side_effect = None
         self._validate()
 
+    def test_DHCPReservationsOfNewHostsAreAddedUnderTheLockBeforeAnyHost(self, *_args):
+        reservationsWhenHostsAdded = []
+        origNewHostInConfiguration = dynamicconfig.DynamicConfig._newHostInConfiguration
+
+        def newHostInConfiguration(tested, hostData):
+            self.assertTrue(globallock.assertLocked())
+            reservationsWhenHostsAdded.append(len(self.dnsMasqMock))
+            origNewHostInConfiguration(tested, hostData)
+        with mock.patch.object(dynamicconfig.DynamicConfig, "_newHostInConfiguration",
+                               newHostInConfiguration):
+            self._init('online_rack_conf.yaml')
+        self.assertEquals(reservationsWhenHostsAdded, [4] * 4)
+        self.assertEquals(self.dnsMasqMock.nrReloads, 1)
+        self._validate()
+
+    def test_DHCPReservationsAreRetriedAfterAPartialFailure(self, *_args):
+        self.fakeFilesystem.CreateFile("empty_rack_conf.yaml", contents=yaml.dump(dict(HOSTS=[])))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "empty_rack_conf.yaml")
+        config.RACK_YAML = "empty_rack_conf.yaml"
+        with self.unlock():
+            self.tested = self._generateTestedInstanceWithMockedThreading()
+        config.RACK_YAML = 'online_rack_conf.yaml'
+        origAdd = self.dnsMasqMock.add
+
+        def addFailingOnTheThirdReservation(mac, address):
+            if len(self.dnsMasqMock) == 2:
+                raise ValueError("dnsmasq is down")
+            origAdd(mac, address)
+        with mock.patch.object(self.dnsMasqMock, "add", addFailingOnTheThirdReservation):
+            with self.unlock():
+                self.assertRaises(ValueError, self.tested._reload)
+        self.assertEquals(len(self.dnsMasqMock), 2)
+        self.assertEquals(list(self._hosts.all()), [])
+        self._updateExpectedDnsMasqEntriesUponLoad(configurations[config.RACK_YAML]["HOSTS"])
+        with self.unlock():
+            self.tested._reload()
+        self._validate()
+
+    def test_NoHostIsAddedIfADHCPReservationFails(self, *_args):
+        self.dnsMasqMock.side_effect = AssertionError('Ignore this error')
+        config.RACK_YAML = 'online_rack_conf.yaml'
+        with self.unlock():
+            self.assertRaises(AssertionError, self._generateTestedInstanceWithMockedThreading)
+        self.assertEquals(list(self._hosts.all()), [])
+        self.assertEquals(list(self.freePool.all()), [])
+
     def test_NotPoweringOffHostsWhenReoadingYaml(self, *_args):
         origTurnOff = Host.turnOff
         Host.turnOff = mock.Mock()
@@ -368,6 +442,14 @@ class Test(unittest.TestCase):
         for host in hosts.values():
             self.assertEquals(host.pool(), Host.DEFAULT_POOL)
 
+    def test_PoolSummary(self, *args):
+        self._init('different_pool_rack_conf.yaml')
+        self.assertEquals(self.tested.poolSummary(), dict(
+            default=dict(ONLINE=3, OFFLINE=0, DETACHED=0),
+            anotherPool=dict(ONLINE=1, OFFLINE=0, DETACHED=0)))
+        self._reloadRackConf('offline_rack_conf.yaml')
+        self.assertEquals(self.tested.poolSummary(), dict(default=dict(ONLINE=3, OFFLINE=1, DETACHED=0)))
+
     def test_HostGoesToDefaultTargetDeviceIfFieldIsRemovedFromConfiguration(self, *args):
         self._init('different_target_device_rack_conf.yaml')
         hosts = self.tested.getOnlineHosts()
@@ -401,6 +483,152 @@ class Test(unittest.TestCase):
         self._reloadRackConf('nic_bonding_rack_conf.yaml')
         self._validate()
 
+    def test_Tags(self, *args):
+        self._init('tags_rack_conf.yaml')
+        self._validate()
+        requirement = dict(hardwareConstraints=dict(tags=dict(cpu="skylake", ssd=True)))
+        eligible = [stateMachine.hostImplementation().id()
+                    for stateMachine in self.freePool.eligible(requirement)]
+        self.assertEquals(eligible, ["rack01-server41"])
+        self._reloadRackConf('online_rack_conf.yaml')
+        self.assertEquals(self.tested.getOnlineHosts()["rack01-server41"].tags(), dict())
+        self.assertEquals(self.freePool.eligible(requirement), [])
+
+    def test_ListenersAreNotifiedOfChangedHostsOnly(self, *args):
+        listener = mock.Mock()
+        self._init('online_rack_conf.yaml')
+        self.tested.addListener(listener)
+        self._reloadRackConf('offline_rack_conf.yaml')
+        notified = [call[0][0].id() for call in listener.hostChanged.call_args_list]
+        self.assertEquals(notified, [self.HOST_THAT_WILL_BE_TAKEN_OFFLINE])
+
+    def test_ReloadingAnUnchangedConfigurationDoesNotTakeTheLock(self, *args):
+        self._init('online_rack_conf.yaml')
+        listener = mock.Mock()
+        self.tested.addListener(listener)
+        with mock.patch.object(globallock, "lock") as lock:
+            self._reloadRackConf('online_rack_conf.yaml')
+        self.assertFalse(lock.called)
+        self.assertFalse(listener.hostChanged.called)
+        self._validate()
+
+    def test_TouchedButUnchangedConfigurationIsNotParsed(self, *args):
+        self._init('online_rack_conf.yaml')
+        self.fakeFilesystem.GetObject('online_rack_conf.yaml').SetMTime(1)
+        with mock.patch.object(dynamicconfig, "_parseShard") as parseShard:
+            self._reloadRackConf('online_rack_conf.yaml')
+        self.assertFalse(parseShard.called)
+        self._validate()
+
+    def test_HostsFromFragmentsDirectory(self, *args):
+        hostData = dict(id="rack02-server01", primaryMAC="00:1e:67:48:20:10",
+                        secondaryMAC="00:1e:67:48:20:11",
+                        ipmiLogin=dict(username="root", password="strato", hostname="rack02-server01"),
+                        topology=dict(rackID="rack02"), state="online")
+        self.fakeFilesystem.CreateFile("fragments/rack02.yaml", contents=yaml.dump(dict(HOSTS=[hostData])))
+        self.fakeFilesystem.CreateFile("fragments/README", contents="not a fragment")
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "fragments")
+        with mock.patch.object(config, "RACK_YAML_FRAGMENTS_DIRECTORY", "fragments"):
+            self._init('online_rack_conf.yaml')
+        onlineHosts = self.tested.getOnlineHosts()
+        self.assertIn("rack02-server01", onlineHosts)
+        expected = self._idsOfHostsInConfiguration() | set(["rack02-server01"])
+        self.assertItemsEqual(onlineHosts.keys(), expected)
+
+    def test_ShardedConfigurationBehavesLikeASingleFile(self, *args):
+        hostsData = configurations['online_rack_conf.yaml']['HOSTS']
+        self.fakeFilesystem.CreateFile("shards/rack01.yaml", contents=yaml.dump(dict(HOSTS=hostsData)))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "shards")
+        self._updateExpectedDnsMasqEntriesUponLoad(hostsData)
+        config.RACK_YAML = "shards/"
+        with self.unlock():
+            self.tested = self._generateTestedInstanceWithMockedThreading()
+        expected = [hostData["id"] for hostData in hostsData]
+        self.assertItemsEqual(self.tested.getOnlineHosts().keys(), expected)
+        self._validateDNSMasqEntries()
+
+    def test_OnlyModifiedShardsAreParsedOnReload(self, *args):
+        hostsData = configurations['online_rack_conf.yaml']['HOSTS']
+        rack02 = dict(id="rack02-server01", primaryMAC="00:1e:67:48:20:10",
+                      secondaryMAC="00:1e:67:48:20:11",
+                      ipmiLogin=dict(username="root", password="strato", hostname="rack02-server01"),
+                      topology=dict(rackID="rack02"), state="online")
+        self.fakeFilesystem.CreateFile("shards/rack01.yaml", contents=yaml.dump(dict(HOSTS=hostsData)))
+        self.fakeFilesystem.CreateFile("shards/rack02.yaml", contents=yaml.dump(dict(HOSTS=[rack02])))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "shards")
+        config.RACK_YAML = "shards"
+        with self.unlock():
+            self.tested = self._generateTestedInstanceWithMockedThreading()
+        shard = self.fakeFilesystem.GetObject("shards/rack02.yaml")
+        shard.SetContents(yaml.dump(dict(HOSTS=[dict(rack02, state="offline")])))
+        shard.SetMTime(shard.st_mtime + 1)
+        with mock.patch.object(dynamicconfig, "_parseShard", side_effect=dynamicconfig._parseShard) as parse:
+            with self.unlock():
+                self.tested._reload()
+        self.assertEquals(parse.call_count, 1)
+        self.assertIn("rack02-server01", self.tested.getOfflineHosts())
+        self.assertEquals(len(self.tested.getOnlineHosts()), len(hostsData))
+
+    def test_HostOfAnotherRackInShardIsRejected(self, *args):
+        hostsData = configurations['online_rack_conf.yaml']['HOSTS']
+        self.fakeFilesystem.CreateFile("shards/rack02.yaml", contents=yaml.dump(dict(HOSTS=hostsData)))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "shards")
+        config.RACK_YAML = "shards"
+        with self.unlock():
+            self.assertRaises(ValueError, self._generateTestedInstanceWithMockedThreading)
+        self.assertEquals(list(self._hosts.all()), [])
+
+    def test_ShardsDirectoryGivenAsARelativePathIsValidated(self, *args):
+        hostsData = configurations['online_rack_conf.yaml']['HOSTS']
+        self.fakeFilesystem.CreateFile("shards/rack02.yaml", contents=yaml.dump(dict(HOSTS=hostsData)))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "shards")
+        config.RACK_YAML = "./shards"
+        with self.unlock():
+            self.assertRaises(ValueError, self._generateTestedInstanceWithMockedThreading)
+        self.assertEquals(list(self._hosts.all()), [])
+
+    def test_HostWithoutTopologyInShardIsRejected(self, *args):
+        hostsData = [dict(hostData) for hostData in configurations['online_rack_conf.yaml']['HOSTS']]
+        del hostsData[1]["topology"]
+        self.fakeFilesystem.CreateFile("shards/rack01.yaml", contents=yaml.dump(dict(HOSTS=hostsData)))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "shards")
+        config.RACK_YAML = "shards"
+        with self.unlock():
+            with self.assertRaisesRegexp(ValueError, "has no topology.rackID"):
+                self._generateTestedInstanceWithMockedThreading()
+        self.assertEquals(list(self._hosts.all()), [])
+
+    def test_ShardsAreParsedInAPoolOfProcesses(self, *args):
+        hostsData = configurations['online_rack_conf.yaml']['HOSTS']
+        rack02 = dict(id="rack02-server01", primaryMAC="00:1e:67:48:20:10",
+                      secondaryMAC="00:1e:67:48:20:11",
+                      ipmiLogin=dict(username="root", password="strato", hostname="rack02-server01"),
+                      topology=dict(rackID="rack02"), state="online")
+        self.fakeFilesystem.CreateFile("shards/rack01.yaml", contents=yaml.dump(dict(HOSTS=hostsData)))
+        self.fakeFilesystem.CreateFile("shards/rack02.yaml", contents=yaml.dump(dict(HOSTS=[rack02])))
+        self.addCleanup(self.fakeFilesystem.RemoveObject, "shards")
+        config.RACK_YAML = "shards"
+        pool = dynamicconfig.createParsingPool(2)
+        self.addCleanup(pool.join)
+        self.addCleanup(pool.terminate)
+        with mock.patch.object(pool, "map", wraps=pool.map) as poolMap:
+            with self.unlock():
+                self.tested = self._generateTestedInstanceWithMockedThreading(parsingPool=pool)
+        self.assertEquals(poolMap.call_count, 1)
+        expected = [hostData["id"] for hostData in hostsData] + ["rack02-server01"]
+        self.assertItemsEqual(self.tested.getOnlineHosts().keys(), expected)
+
+    def test_NoParsingPoolByDefault(self, *args):
+        self.assertIsNone(dynamicconfig.createParsingPool(config.RACK_YAML_PARSING_PROCESSES))
+
+    def test_PendingReloadRequestsAreCoalesced(self, *args):
+        self._init('online_rack_conf.yaml')
+        for _ in xrange(10):
+            self.tested._queue.put(None)
+        self.tested._queue.get()
+        self.tested._coalescePendingRequests()
+        self.assertTrue(self.tested._queue.empty())
+
     def _validateOnlineHostsAreInHostsPool(self, exceptForIDs=None):
         if exceptForIDs is None:
             exceptForIDs = []
@@ -491,7 +719,8 @@ class Test(unittest.TestCase):
                                 allocated=allocated,
                                 broadcaster=mock.Mock(),
                                 freePool=self.freePool,
-                                hosts=self._hosts)
+                                hosts=self._hosts,
+                                heartbeats=Heartbeats())
         self.allocationsMock.allocations.append(allocation)
         self._validate()
         return allocation
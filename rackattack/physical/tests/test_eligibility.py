@@ -0,0 +1,49 @@
+import unittest
+from rackattack.physical.alloc import eligibility
+from rackattack.physical.tests.common import HostStateMachine, Host
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tested = eligibility.Eligibility()
+
+    def test_Mask(self):
+        hosts = [HostStateMachine(Host(str(i), pool="pool%d" % (i % 2))) for i in xrange(6)]
+        hosts[4].hostImplementation().tags = dict(cpu="skylake")
+        for host in hosts:
+            self.tested.add(host)
+        self.assertEquals(self.tested.stateMachines(self.tested.mask("pool0")), hosts[0::2])
+        self.assertEquals(self.tested.stateMachines(self.tested.mask("pool0", tags=dict(cpu="skylake"))),
+                          [hosts[4]])
+        self.assertEquals(self.tested.mask("noSuchPool"), 0)
+        self.assertEquals(self.tested.count(self.tested.mask("pool1")), 3)
+
+    def test_MaskOfIntersectsWithMask(self):
+        hosts = [HostStateMachine(Host(str(i))) for i in xrange(4)]
+        for host in hosts:
+            self.tested.add(host)
+        mask = self.tested.mask("default") & self.tested.maskOf([hosts[1], hosts[3]])
+        self.assertEquals(self.tested.stateMachines(mask), [hosts[1], hosts[3]])
+
+    def test_Remove(self):
+        hosts = [HostStateMachine(Host(str(i))) for i in xrange(3)]
+        for host in hosts:
+            self.tested.add(host)
+        self.tested.remove(hosts[1])
+        self.assertNotIn(hosts[1], self.tested)
+        self.assertEquals(len(self.tested), 2)
+        self.assertEquals(self.tested.stateMachines(self.tested.all()), [hosts[0], hosts[2]])
+
+    def test_SlotsAreCompacted(self):
+        host = HostStateMachine(Host("host"))
+        for _ in xrange(1000):
+            self.tested.add(host)
+            self.tested.remove(host)
+        self.tested.add(host)
+        self.assertLess(self.tested.all().bit_length(),
+                        2 * eligibility.Eligibility._MINIMUM_NR_SLOTS_BEFORE_COMPACTION)
+        self.assertEquals(self.tested.stateMachines(self.tested.mask("default")), [host])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import mock
 import unittest
 from rackattack.common import globallock
 from rackattack.physical.alloc.freepool import FreePool
-from rackattack.physical.tests.common import HostStateMachine, Allocation, Hosts
+from rackattack.physical.tests.common import HostStateMachine, Allocation, Hosts, Host
 
 
 class Test(unittest.TestCase):
@@ -15,21 +15,23 @@ class Test(unittest.TestCase):
         globallock._lock.release()
 
     def test_OneHost(self):
-        host = HostStateMachine('host1')
+        host = HostStateMachine(Host('host1'))
         self.tested.put(host)
         self.assertIn(host, self.tested.all())
+        self.assertIn(host, self.tested)
         self.tested.takeOut(host)
         self.assertNotIn(host, self.tested.all())
+        self.assertNotIn(host, self.tested)
 
     def test_DestroyCallback(self):
-        host = HostStateMachine('host1')
+        host = HostStateMachine(Host('host1'))
         self._hosts.add(host)
         self.tested.put(host)
         host._destroyCallback(host)
         self.assertNotIn(host, self.tested.all())
 
     def test_All(self):
-        hosts = [HostStateMachine(str(i)) for i in xrange(10)]
+        hosts = [HostStateMachine(Host(str(i))) for i in xrange(10)]
         for host in hosts:
             self._hosts.add(host)
 
@@ -39,6 +41,93 @@ class Test(unittest.TestCase):
         actualAll = self.tested.all()
         self.assertEquals(set(actualAll), set(hosts))
 
+    def test_AllKeepsInsertionOrder(self):
+        hosts = [HostStateMachine(Host(str(i))) for i in xrange(10)]
+        for host in hosts:
+            self.tested.put(host)
+        self.tested.takeOut(hosts[3])
+        self.tested.put(hosts[3])
+        self.assertEquals(list(self.tested.all()), hosts[:3] + hosts[4:] + hosts[3:4])
+
+    def test_CandidatesOfPool(self):
+        inPool = [HostStateMachine(Host(str(i), pool="thePool")) for i in xrange(3)]
+        notInPool = [HostStateMachine(Host(str(i))) for i in xrange(3, 6)]
+        for host in inPool + notInPool:
+            self.tested.put(host)
+        self.assertEquals(self.tested.eligible(dict(pool="thePool")), inPool)
+        self.assertEquals(self.tested.eligible(dict()), notInPool)
+        self.assertEquals(self.tested.eligible(dict(pool="noSuchPool")), [])
+        self.assertEquals(self.tested.nrFree(), 6)
+        self.assertEquals(self.tested.nrFree("thePool"), 3)
+        self.tested.takeOut(inPool[1])
+        self.assertEquals(self.tested.eligible(dict(pool="thePool")), [inPool[0], inPool[2]])
+        self.assertEquals(self.tested.nrFree("thePool"), 2)
+
+    def test_EligibleByNrNICBondings(self):
+        host = HostStateMachine(Host('host1'))
+        self.tested.put(host)
+        nrNICBondings = len(host.hostImplementation().getNICBondings())
+        self.assertEquals(self.tested.eligible(self.nrNICBondingsRequirement(nrNICBondings)), [host])
+        self.assertEquals(self.tested.eligible(self.nrNICBondingsRequirement(nrNICBondings + 1)), [])
+        self.assertEquals(self.tested.eligible(self.nrNICBondingsRequirement(0, nrNICBondings)), [host])
+        self.assertEquals(self.tested.eligible(self.nrNICBondingsRequirement(0, nrNICBondings - 1)), [])
+
+    def test_EligibleByTags(self):
+        hosts = [HostStateMachine(Host(str(i))) for i in xrange(3)]
+        hosts[0].hostImplementation().tags = dict(cpu="skylake", ssd=True)
+        hosts[2].hostImplementation().tags = dict(cpu="skylake")
+        for host in hosts:
+            self.tested.put(host)
+        self.assertEquals(self.tested.eligible(self.tagsRequirement(cpu="skylake")), [hosts[0], hosts[2]])
+        self.assertEquals(self.tested.eligible(self.tagsRequirement(cpu="skylake", ssd=True)), [hosts[0]])
+        self.assertEquals(self.tested.eligible(self.tagsRequirement(cpu="haswell")), [])
+
+    def test_EligibleByServerIDWildcard(self):
+        hostIDs = ["rack02-server01", "rack01-server02", "rack10-server01", "rack01-server01", "rack1"]
+        hosts = {hostID: HostStateMachine(Host(hostID)) for hostID in hostIDs}
+        for hostID in hostIDs:
+            self.tested.put(hosts[hostID])
+        self.assertEquals(self.tested.eligible(dict(serverIDWildcard="rack01-*")),
+                          [hosts["rack01-server02"], hosts["rack01-server01"]])
+        self.assertEquals(self.tested.eligible(dict(serverIDWildcard="rack*-server01")),
+                          [hosts["rack02-server01"], hosts["rack10-server01"], hosts["rack01-server01"]])
+        self.assertEquals(self.tested.eligible(dict(serverIDWildcard="rack1")), [hosts["rack1"]])
+        self.assertEquals(self.tested.eligible(dict(pool="otherPool", serverIDWildcard="rack01-*")), [])
+        self.tested.takeOut(hosts["rack01-server01"])
+        self.assertEquals(self.tested.eligible(dict(serverIDWildcard="rack01-*")),
+                          [hosts["rack01-server02"]])
+
+    def test_ManyPutsAndTakeOutsKeepOrder(self):
+        hosts = [HostStateMachine(Host(str(i))) for i in xrange(10)]
+        for host in hosts:
+            self.tested.put(host)
+        for _ in xrange(100):
+            for host in hosts[:5]:
+                self.tested.takeOut(host)
+                self.tested.put(host)
+        self.assertEquals(self.tested.eligible(dict()), hosts[5:] + hosts[:5])
+        self.assertEquals(self.tested.nrFree("default"), 10)
+
+    def test_HostConfigurationChanged(self):
+        host = HostStateMachine(Host('host1'))
+        self.tested.put(host)
+        host.hostImplementation()._pool = "anotherPool"
+        self.tested.hostConfigurationChanged(host)
+        self.assertEquals(self.tested.eligible(dict()), [])
+        self.assertEquals(self.tested.eligible(dict(pool="anotherPool")), [host])
+
+    def test_HostConfigurationChangedForHostNotInPoolIsIgnored(self):
+        host = HostStateMachine(Host('host1'))
+        self.tested.hostConfigurationChanged(host)
+        self.assertEquals(list(self.tested.all()), [])
+
+    @staticmethod
+    def nrNICBondingsRequirement(minimum, maximum=None):
+        return dict(hardwareConstraints=dict(minimumNrNICBondings=minimum, maximumNrNICBondings=maximum))
+
+    @staticmethod
+    def tagsRequirement(**tags):
+        return dict(hardwareConstraints=dict(tags=tags))
 
 if __name__ == '__main__':
     unittest.main()
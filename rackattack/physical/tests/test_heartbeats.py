@@ -0,0 +1,63 @@
+import mock
+import unittest
+from rackattack.physical.alloc import heartbeats
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.5
+        self.timePatcher = mock.patch.object(heartbeats.time, "time", lambda: self.now)
+        self.timePatcher.start()
+        self.addCleanup(self.timePatcher.stop)
+        with mock.patch.object(heartbeats.timer, "scheduleIn") as self.scheduleIn:
+            self.tested = heartbeats.Heartbeats(timeout=10)
+        self.timedOut = []
+
+    def register(self, key):
+        self.tested.register(key, lambda: self.timedOut.append(key))
+
+    def test_SweeperIsScheduledPeriodically(self):
+        self.scheduleIn.assert_called_once_with(timeout=heartbeats.Heartbeats._SWEEP_INTERVAL,
+                                                callback=self.tested._sweep, tag=self.tested)
+        with mock.patch.object(heartbeats.timer, "scheduleIn") as scheduleIn:
+            self.tested._sweep()
+        self.assertEquals(scheduleIn.call_count, 1)
+
+    def test_ExpiresInBatch(self):
+        for key in ("alpha", "bravo", "charlie"):
+            self.register(key)
+        self.assertEquals(self.tested.expire(self.now + 5), [])
+        self.assertEquals(sorted(self.tested.expire(self.now + 12)), ["alpha", "bravo", "charlie"])
+        self.assertEquals(sorted(self.timedOut), ["alpha", "bravo", "charlie"])
+        self.assertEquals(len(self.tested), 0)
+
+    def test_HeartbeatPostponesExpiry(self):
+        self.register("alpha")
+        self.register("bravo")
+        self.now += 8
+        self.tested.heartbeat("alpha")
+        self.assertEquals(self.tested.expire(self.now + 4), ["bravo"])
+        self.assertIn("alpha", self.tested)
+        self.assertEquals(self.tested.expire(self.now + 12), ["alpha"])
+        self.assertEquals(self.timedOut, ["bravo", "alpha"])
+
+    def test_UnregisteredDoesNotExpire(self):
+        self.register("alpha")
+        self.tested.unregister("alpha")
+        self.tested.unregister("alpha")
+        self.assertEquals(self.tested.expire(self.now + 100), [])
+        self.assertEquals(self.timedOut, [])
+
+    def test_ExpiresAfterAClockJump(self):
+        self.register("alpha")
+        self.assertEquals(self.tested.expire(self.now + 10 ** 6), ["alpha"])
+
+    def test_FailingCallbackDoesNotStopOthers(self):
+        self.tested.register("alpha", mock.Mock(side_effect=Exception("boom")))
+        self.register("bravo")
+        self.assertEquals(sorted(self.tested.expire(self.now + 12)), ["alpha", "bravo"])
+        self.assertEquals(self.timedOut, ["bravo"])
+
+
+if __name__ == '__main__':
+    unittest.main()
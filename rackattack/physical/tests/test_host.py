@@ -138,6 +138,44 @@ class Test(unittest.TestCase):
         self.tested.setPool("anotherpool")
         self.assertEquals(self.tested.pool(), "anotherpool")
 
+    def test_ChangeCallbackIsCalledOnStateAndPoolChanges(self):
+        callback = mock.Mock()
+        self.tested.setChangeCallback(callback)
+        self.tested.setPool("thePool")
+        self.assertFalse(callback.called)
+        self.tested.setPool("anotherPool")
+        callback.assert_called_once_with(self.tested)
+        self.tested.setState(host.STATES.OFFLINE)
+        self.assertEquals(callback.call_count, 2)
+
+    def test_CapabilitiesAreRefreshedOnChange(self):
+        self.assertEquals(self.tested.capabilities(),
+                          host.Capabilities(pool="thePool", nrNICBondings=0, targetDevice=None,
+                                            targetDeviceType=None, tags=dict()))
+        self.tested.setPool("anotherpool")
+        self.tested.setNICBondings([["mac1", "mac2"]])
+        self.tested.setTargetDevice("/dev/sdb")
+        self.tested.setTargetDeviceType("ssd")
+        self.tested.setTags(dict(cpu="skylake"))
+        self.assertEquals(self.tested.capabilities(),
+                          host.Capabilities(pool="anotherpool", nrNICBondings=1, targetDevice="/dev/sdb",
+                                            targetDeviceType="ssd", tags=dict(cpu="skylake")))
+
+    def test_FulfillsNrNICBondingsRequirement(self):
+        self.tested.setNICBondings([["mac1", "mac2"], ["mac3", "mac4"]])
+        for minimum, maximum, expected in [(2, None, True), (3, None, False), (1, 2, True), (0, 1, False)]:
+            requirement = dict(pool="thePool", hardwareConstraints=dict(minimumNrNICBondings=minimum,
+                                                                        maximumNrNICBondings=maximum))
+            self.assertEquals(self.tested.fulfillsRequirement(requirement), expected, (minimum, maximum))
+
+    def test_FulfillsTagsRequirement(self):
+        self.tested.setTags(dict(cpu="skylake", ssd=True))
+        for tags, expected in [(dict(), True), (dict(cpu="skylake"), True),
+                               (dict(cpu="skylake", ssd=True), True), (dict(cpu="haswell"), False),
+                               (dict(gpu=True), False)]:
+            requirement = dict(pool="thePool", hardwareConstraints=dict(tags=tags))
+            self.assertEquals(self.tested.fulfillsRequirement(requirement), expected, tags)
+
 
 if __name__ == '__main__':
     unittest.main()
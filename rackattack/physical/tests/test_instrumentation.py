@@ -0,0 +1,67 @@
+import mock
+import unittest
+import threading
+from rackattack.common import globallock
+from rackattack.physical import instrumentation
+
+
+class FakeTimersThread(threading.Thread):
+    pass
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tested = instrumentation.Instrumentation(threadCallers=[(FakeTimersThread, "timer")])
+
+    def test_HistogramBucketsAreCumulative(self):
+        histogram = instrumentation.Histogram(buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            histogram.observe(value)
+        self.assertEquals(histogram.render("latency", 'op="x"'), [
+            'latency_bucket{op="x",le="0.1"} 1',
+            'latency_bucket{op="x",le="1"} 3',
+            'latency_bucket{op="x",le="+Inf"} 4',
+            'latency_sum{op="x"} 4.250000',
+            'latency_count{op="x"} 4'])
+
+    def test_TimedCountsCallsAndErrors(self):
+        succeeding = self.tested.timed("allocate", lambda peer: 5)
+        failing = self.tested.timed("allocation__free", mock.Mock(side_effect=IndexError("no")))
+        self.assertEquals(succeeding(peer=None), 5)
+        self.assertRaises(IndexError, failing, peer=None)
+        rendered = self.tested.render()
+        self.assertIn('rackattack_ipc_command_seconds_count{command="allocate"} 1', rendered)
+        self.assertIn('rackattack_ipc_command_seconds_count{command="allocation__free"} 1', rendered)
+        self.assertIn('rackattack_ipc_command_errors_total{command="allocate"} 0', rendered)
+        self.assertIn('rackattack_ipc_command_errors_total{command="allocation__free"} 1', rendered)
+
+    def test_LockWaitAndHoldByCaller(self):
+        self.tested.install()
+        self.addCleanup(self.tested.uninstall)
+
+        def lockAndRelease():
+            with globallock.lock():
+                assert globallock.assertLocked()
+        thread = FakeTimersThread(target=lockAndRelease)
+        thread.start()
+        thread.join()
+        lockAndRelease()
+        rendered = self.tested.render()
+        self.assertIn('rackattack_globallock_wait_seconds_count{caller="timer"} 1', rendered)
+        self.assertIn('rackattack_globallock_hold_seconds_count{caller="timer"} 1', rendered)
+        self.assertIn('rackattack_globallock_hold_seconds_count{caller="http"} 1', rendered)
+
+    def test_CallerOfThread(self):
+        self.assertEquals(self.tested.callerOf(FakeTimersThread()), "timer")
+        self.assertEquals(self.tested.callerOf(threading.Thread(name="PoolThread-twisted-1")), "ipc")
+        self.assertEquals(self.tested.callerOf(threading.Thread(name="Thread-5")), "stateMachine")
+
+    def test_MetricsResource(self):
+        request = mock.Mock()
+        rendered = instrumentation.MetricsResource(self.tested).render_GET(request)
+        self.assertEquals(rendered, self.tested.render())
+        request.setHeader.assert_called_once_with("Content-Type", "text/plain; version=0.0.4")
+
+
+if __name__ == '__main__':
+    unittest.main()
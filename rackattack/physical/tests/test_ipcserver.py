@@ -1,14 +1,21 @@
+import json
 import mock
+import contextlib
 import unittest
 import threading
+from twisted.internet import defer
+from rackattack.tcp import heartbeat
 from rackattack.common import timer
 from rackattack.common import globallock
 from rackattack.physical import ipcserver
+from rackattack.physical import instrumentation
+from rackattack.physical import responseencoding
 from rackattack.common import baseipcserver
 from rackattack.physical.alloc import freepool
 from rackattack.common import reclaimhostspooler
 from rackattack.physical.alloc import allocations
-from rackattack.physical.tests.common import Hosts, HostStateMachine, Host
+from rackattack.physical.alloc import osmosislabels
+from rackattack.physical.tests.common import Hosts, HostStateMachine, Host, labelsOfListLabelsCommand
 
 
 class Test(unittest.TestCase):
@@ -19,9 +26,10 @@ class Test(unittest.TestCase):
         cls.broadcaster = mock.Mock()
         cls.hosts = Hosts()
         cls.freePool = freepool.FreePool(cls.hosts)
-        allocations.sh.run = cls.osmosisListLabelsFoundMock
+        osmosislabels.sh.run = cls.osmosisListLabelsFoundMock
         cls.dynamicConfig = mock.Mock()
         cls.reclaimHost = mock.Mock(spec=reclaimhostspooler.ReclaimHostSpooler)
+        cls.origThreading = (threading.Thread.daemon, threading.Event, threading.Thread.start)
         baseipcserver.threading.Thread.daemon = mock.Mock()
         baseipcserver.threading.Event = mock.Mock()
         baseipcserver.threading.Thread.start = mock.Mock()
@@ -33,6 +41,7 @@ class Test(unittest.TestCase):
 
     @classmethod
     def tearDownClass(cls):
+        threading.Thread.daemon, threading.Event, threading.Thread.start = cls.origThreading
         globallock._lock.release()
 
     def setUp(self):
@@ -63,14 +72,24 @@ class Test(unittest.TestCase):
                                           self.reclaimHost)
 
     def test_Allocate(self):
-        allocationID = self.tested.cmd_allocate(self.requirements,
-                                                self.allocationInfo,
-                                                self.osmosisServerIP)
+        responses = []
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(), responses.append, None)
+            admit()
         allocation = self.allocations.all()[0]
-        self.assertEquals(allocationID, allocation.index())
+        self.assertEquals(responses, [json.dumps(allocation.index())])
+
+    def test_LoneAllocateRequestIsAdmittedWithoutWaiting(self):
+        self.allocations.createMany = mock.Mock(wraps=self.allocations.createMany)
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(), lambda response: None, None)
+            self.assertTrue(self.tested._admitting)
+            admit()
+        self.assertFalse(self.tested._admitting)
+        self.assertEquals(self.allocations.createMany.call_count, 1)
 
     def test_InauguratorIDs(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         actual = self.tested.cmd_allocation__inauguratorsIDs(id=allocation.index(), peer=None)
         actualAllocatedNames = actual.keys()
@@ -83,7 +102,7 @@ class Test(unittest.TestCase):
         self.assertEquals(len(actualAllocatedIDs), len(expectedAllocatedIDs))
 
     def test_InauguratorIDsCrashesWhenAllocationIsDead(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         allocation.withdraw("goodbye, allocation")
         self.assertRaises(Exception,
@@ -92,18 +111,18 @@ class Test(unittest.TestCase):
                           peer=None)
 
     def test_AllocationNodesFailsWhenAllocationIsNotDone(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         self.assertRaises(Exception, self.tested.cmd_allocation__nodes, id=allocation.index(), peer=None)
 
     def test_AllocationNodesFailsWhenAllocationIsDead(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         allocation.withdraw("goodbye, allocation")
         self.assertRaises(Exception, self.tested.cmd_allocation__nodes, id=allocation.index(), peer=None)
 
     def test_AllocationNodes(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         self.fakeDoneForAllocation(allocation)
         actual = self.tested.cmd_allocation__nodes(id=allocation.index(), peer=None)
@@ -116,14 +135,73 @@ class Test(unittest.TestCase):
         self.assertEquals(set(actualAllocatedIDs), set(expectedAllocatedIDs))
         self.assertEquals(len(actualAllocatedIDs), len(expectedAllocatedIDs))
 
+    def test_AllocationNodesAreServedFromCacheOnceDone(self):
+        allocationID = self.allocate()
+        allocation = self.allocations.byIndex(allocationID)
+        request = json.dumps(dict(cmd="allocation__nodes", arguments=dict(id=allocationID)))
+        with mock.patch.object(baseipcserver.BaseIPCServer, "handle") as handle:
+            self.tested.handle(request, None, None)
+        self.assertEquals(handle.call_count, 1)
+        self.fakeDoneForAllocation(allocation)
+        responses = []
+        with mock.patch.object(baseipcserver.BaseIPCServer, "handle") as handle, \
+                mock.patch.object(allocation, "allocated") as allocated:
+            self.tested.handle(request, responses.append, None)
+            self.tested.handle(request, responses.append, None)
+        self.assertFalse(handle.called)
+        self.assertFalse(allocated.called)
+        self.assertEquals(responses[0], responses[1])
+        self.assertEquals(json.loads(responses[0]),
+                          self.tested.cmd_allocation__nodes(id=allocationID, peer=None))
+
+    def test_AllocationNodesNotInCacheAreEncodedAsAccepted(self):
+        allocationID = self.allocate()
+        request = json.dumps(dict(cmd="allocation__nodes", arguments=dict(id=allocationID),
+                                  accept=["msgpack"]))
+        responses = []
+        with self.fakeAdmission():
+            self.tested.handle(request, responses.append, None)
+        self.assertEquals(responseencoding.encodingOf(responses[0]), responseencoding.MSGPACK)
+        self.assertEquals(responseencoding.decode(responses[0])["exceptionString"],
+                          "Must not fetch nodes from a not done allocation")
+        self.fakeDoneForAllocation(self.allocations.byIndex(allocationID))
+        with self.fakeAdmission():
+            self.tested.handle(request, responses.append, None)
+        self.assertEquals(responseencoding.encodingOf(responses[1]), responseencoding.MSGPACK)
+        self.assertEquals(responseencoding.decode(responses[1]),
+                          self.tested.cmd_allocation__nodes(id=allocationID, peer=None))
+
+    def test_CallerIsAnsweredIfEncodingTheResponseFails(self):
+        string = json.dumps(dict(cmd="admin__queryStatus", arguments=dict(), accept=["msgpack"]))
+        responses = []
+        with self.fakeAdmission(), \
+                mock.patch.object(responseencoding.msgpack, "packb",
+                                  side_effect=[TypeError("cannot serialize"), "\x80"]):
+            self.tested.handle(string, responses.append, None)
+        self.assertEquals(responses, ["M\x80"])
+
+    def test_ReleasingANodeInvalidatesCachedNodes(self):
+        allocationID = self.allocate()
+        allocation = self.allocations.byIndex(allocationID)
+        self.fakeDoneForAllocation(allocation)
+        released = allocation.allocated()['node0']
+        self.tested.cmd_node__releaseFromAllocation(
+            allocationID=allocationID, nodeID=released.hostImplementation().id(), peer=None)
+        responses = []
+        self.tested.handle(json.dumps(dict(cmd="allocation__nodes", arguments=dict(id=allocationID))),
+                           responses.append, None)
+        self.assertEquals(json.loads(responses[0]).keys(), ['node1'])
+        allocation.free()
+        self.assertRaises(Exception, self.tested.cmd_allocation__nodes, id=allocationID, peer=None)
+
     def test_AllocationFree(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         self.tested.cmd_allocation__free(id=allocation.index(), peer=None)
         self.assertEquals("freed", allocation.dead())
 
     def test_AllocationDone(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         actual = self.tested.cmd_allocation__done(id=allocation.index(), peer=None)
         self.assertEquals(actual, False)
@@ -132,7 +210,7 @@ class Test(unittest.TestCase):
         self.assertEquals(actual, True)
 
     def test_AllocationDead(self):
-        self.tested.cmd_allocate(self.requirements, self.allocationInfo, self.osmosisServerIP)
+        self.allocate()
         allocation = self.allocations.all()[0]
         actual = self.tested.cmd_allocation__dead(id=allocation.index(), peer=None)
         self.assertEquals(actual, None)
@@ -140,12 +218,323 @@ class Test(unittest.TestCase):
         actual = self.tested.cmd_allocation__dead(id=allocation.index(), peer=None)
         self.assertEquals(actual, "withdrawn")
 
+    def test_AllocationIsPolledDoneFromTheDoneBroadcast(self):
+        self.allocate()
+        allocation = self.allocations.all()[0]
+        polled = []
+        self.broadcaster.allocationDone.side_effect = lambda allocationID: polled.append(
+            self.tested.cmd_allocation__done(id=allocationID, peer=None))
+        self.addCleanup(setattr, self.broadcaster.allocationDone, "side_effect", None)
+        for machine in allocation.allocated().values():
+            machine.fakeInaugurationDone()
+        self.assertEquals(polled, [True])
+
+    def test_AllocationIsPolledDeadFromTheDeathBroadcast(self):
+        self.allocate()
+        allocation = self.allocations.all()[0]
+        polled = []
+        self.broadcaster.allocationDied.side_effect = lambda allocationID, reason, message: polled.append(
+            self.tested.cmd_allocation__dead(id=allocationID, peer=None))
+        self.addCleanup(setattr, self.broadcaster.allocationDied, "side_effect", None)
+        allocation.withdraw("goodbye, allocation")
+        self.assertEquals(polled, ["withdrawn"])
+
+    def test_PollingCommandsDoNotTakeTheLock(self):
+        self.allocate()
+        allocation = self.allocations.all()[0]
+        responses = []
+        with mock.patch.object(ipcserver.globallock, "lock") as lock:
+            for cmd, arguments in (("allocation__done", dict(id=allocation.index())),
+                                   ("allocation__dead", dict(id=allocation.index())),
+                                   ("heartbeat", dict(ids=[allocation.index()])),
+                                   ("allocation__dead", dict(id=allocation.index() + 1))):
+                self.tested.handle(json.dumps(dict(cmd=cmd, arguments=arguments)), responses.append, None)
+        self.assertFalse(lock.called)
+        responses = [json.loads(response) for response in responses]
+        self.assertEquals(responses[:3], [False, None, heartbeat.HEARTBEAT_OK])
+        self.assertEquals(responses[3]["exceptionType"], "IndexError")
+
+    def test_CommandsAreTimedWhenInstrumented(self):
+        instrumented = instrumentation.Instrumentation()
+        tested = ipcserver.IPCServer(self.osmosisServerIP, self.dnsmasq, self.allocations, self.hosts,
+                                     self.dynamicConfig, self.reclaimHost, instrumentation=instrumented)
+        with self.fakeAdmission() as admit:
+            tested.handle(self.allocateRequest(), lambda response: None, None)
+            admit()
+        allocationID = self.allocations.all()[0].index()
+        tested.handle(json.dumps(dict(cmd="allocation__dead", arguments=dict(id=allocationID))),
+                      lambda response: None, None)
+        rendered = instrumented.render()
+        self.assertIn('rackattack_ipc_command_seconds_count{command="allocate"} 1', rendered)
+        self.assertIn('rackattack_ipc_command_seconds_count{command="allocation__dead"} 1', rendered)
+
+    def test_NegotiatedEncoding(self):
+        self.configureOnlineHosts()
+        responses = []
+        string = json.dumps(dict(cmd="admin__queryStatus", arguments=dict(), accept=["msgpack"]))
+        with self.fakeAdmission():
+            self.tested.handle(string, responses.append, None)
+        self.assertEquals(responseencoding.encodingOf(responses[0]), responseencoding.MSGPACK)
+        self.assertEquals(len(responseencoding.decode(responses[0])["hosts"]), 4)
+
+    def test_LegacyClientsGetJSON(self):
+        string = json.dumps(dict(cmd="admin__queryStatus", arguments=dict()))
+        with mock.patch.object(baseipcserver.BaseIPCServer, "handle") as handle:
+            self.tested.handle(string, None, None)
+        handle.assert_called_once_with(self.tested, string, None, None)
+
+    def test_AllocationDoneOfDeadAllocationFails(self):
+        allocationID = self.allocate()
+        self.tested.cmd_allocation__free(id=allocationID, peer=None)
+        self.assertRaises(Exception, self.tested.cmd_allocation__done, id=allocationID, peer=None)
+
+    def test_AllocateRequestIsPreAdmittedBeforeItIsHandled(self):
+        calls = []
+        self.allocations.preAdmit = mock.Mock(side_effect=lambda requirements: calls.append("preAdmit"))
+        respondCallback = mock.Mock(side_effect=lambda response: calls.append("respond"))
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(), respondCallback, "thePeer")
+            self.assertEquals(calls, ["preAdmit"])
+            admit()
+        self.allocations.preAdmit.assert_called_once_with(self.requirements)
+        self.assertEquals(calls, ["preAdmit", "respond"])
+        allocation = self.allocations.all()[0]
+        respondCallback.assert_called_once_with(json.dumps(allocation.index()))
+
+    def test_AllocateRequestIsHandledEvenIfPreAdmissionFails(self):
+        self.allocations.preAdmit = mock.Mock(side_effect=ValueError("object store is down"))
+        respondCallback = mock.Mock()
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(), respondCallback, None)
+            admit()
+        self.assertEquals(len(self.allocations.all()), 1)
+        self.assertEquals(respondCallback.call_count, 1)
+
+    def test_AllocateRequestsQueuedDuringAnAdmissionAreAdmittedInOneBatchByPriority(self):
+        self.allocations.createMany = mock.Mock(wraps=self.allocations.createMany)
+        requirements = dict(node0=dict(imageLabel="echo-foxtrot", imageHint="golf"))
+        niceties = [0.7, 0.9, 0.1, 0.5]
+        responses = []
+        with self.fakeAdmission() as admit:
+            for nice in niceties:
+                allocationInfo = dict(self.allocationInfo, nice=nice)
+                self.tested.handle(self.allocateRequest(requirements, allocationInfo),
+                                   lambda response, nice=nice: responses.append((nice, response)), None)
+            admit()
+        self.assertEquals([len(call[0][0]) for call in self.allocations.createMany.call_args_list], [1, 3])
+        self.assertEquals(len(responses), 4)
+        indexByNice = {allocation.allocationInfo()['nice']: allocation.index()
+                       for allocation in self.allocations.all()}
+        self.assertEquals(sorted(indexByNice.items(), key=lambda item: item[1]),
+                          [(0.7, 1), (0.1, 2), (0.5, 3), (0.9, 4)])
+        self.assertEquals(dict(responses), {nice: json.dumps(indexByNice[nice]) for nice in niceties})
+
+    def test_EachCallerOfABatchGetsItsOwnError(self):
+        responses = []
+        tooMany = {"node%d" % idx: dict(imageLabel="echo-foxtrot", imageHint="golf") for idx in xrange(5)}
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(tooMany), responses.append, None)
+            self.tested.handle(self.allocateRequest(), responses.append, None)
+            admit()
+        self.assertEquals(json.loads(responses[0])["exceptionType"], "OutOfResourcesError")
+        self.assertEquals(json.loads(responses[1]), self.allocations.all()[0].index())
+
+    def test_MalformedAllocateRequestIsAnsweredImmediately(self):
+        responses = []
+        malformed = json.dumps(dict(cmd="allocate", arguments=dict(requirements=self.requirements)))
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(), responses.append, None)
+            self.tested.handle(malformed, responses.append, None)
+            self.assertEquals(len(responses), 1)
+            self.assertEquals(json.loads(responses[0])["exceptionType"], "ValueError")
+            admit()
+        self.assertEquals(json.loads(responses[1]), self.allocations.all()[0].index())
+
+    def test_AllocateRequestCannotCarryAnAdmissionTicket(self):
+        responses = []
+        string = json.dumps(dict(cmd="allocate", arguments=dict(
+            requirements=self.requirements, allocationInfo=self.allocationInfo, admissionTicket=1)))
+        with self.fakeAdmission() as admit:
+            self.tested.handle(string, responses.append, None)
+            admit()
+        self.assertEquals(json.loads(responses[0])["exceptionType"], "TypeError")
+        self.assertEquals(self.allocations.all(), [])
+
+    def test_AdmittedAllocationIsEncodedAsAccepted(self):
+        responses = []
+        string = json.dumps(dict(cmd="allocate", accept=["json+zlib"], arguments=dict(
+            requirements=self.requirements, allocationInfo=self.allocationInfo)))
+        with self.fakeAdmission() as admit:
+            self.tested.handle(string, responses.append, None)
+            admit()
+        self.assertEquals(responseencoding.decode(responses[0]),
+                          self.allocations.all()[0].index())
+
+    def test_EveryCallerIsAnsweredIfBatchedAdmissionFails(self):
+        self.allocations.createMany = mock.Mock(side_effect=RuntimeError("lock is broken"))
+        responses = []
+        with self.fakeAdmission() as admit:
+            self.tested.handle(self.allocateRequest(), responses.append, None)
+            self.tested.handle(self.allocateRequest(), responses.append, None)
+            admit()
+        self.assertEquals([json.loads(response) for response in responses],
+                          [dict(exceptionString="lock is broken", exceptionType="RuntimeError")] * 2)
+
+    def test_OtherRequestsAreNotPreAdmitted(self):
+        self.allocations.preAdmit = mock.Mock()
+        string = json.dumps(dict(cmd="allocation__free", arguments=dict(id=1)))
+        with mock.patch.object(ipcserver.threads, "deferToThread"), \
+                mock.patch.object(baseipcserver.BaseIPCServer, "handle"):
+            self.tested.handle(string, None, None)
+            baseipcserver.BaseIPCServer.handle.assert_called_once_with(self.tested, string, None, None)
+        self.assertFalse(self.allocations.preAdmit.called)
+
+    def test_QueryOsmosisLabelsCache(self):
+        self.allocate()
+        self.allocate()
+        actual = self.tested.cmd_admin__queryOsmosisLabelsCache(peer=None)
+        self.assertEquals(actual, dict(hits=2, misses=2, listings=1, size=2))
+
+    def test_QueryPoolSummary(self):
+        self.dynamicConfig.poolSummary.return_value = dict(default=dict(ONLINE=2, OFFLINE=1, DETACHED=0))
+        actual = self.tested.cmd_admin__queryPoolSummary(peer=None)
+        self.assertEquals(actual, dict(default=dict(ONLINE=2, OFFLINE=1, DETACHED=0)))
+
+    def test_QueryStatus(self):
+        self.configureOnlineHosts()
+        self.allocate()
+        actual = self.tested.cmd_admin__queryStatus(peer=None)
+        self.assertEquals(len(actual["hosts"]), 4)
+        self.assertEquals(set(host["state"] for host in actual["hosts"]), set(["CHECKED_IN"]))
+        allocation = self.allocations.all()[0]
+        self.assertEquals(actual["allocations"], [dict(
+            index=allocation.index(), allocationInfo=self.allocationInfo, done=False, dead=None, duration=0,
+            allocated={name: stateMachine.hostImplementation().index()
+                       for name, stateMachine in allocation.allocated().iteritems()})])
+        self.assertNotIn("sinceVersion", actual)
+
+    def test_QueryStatusDelta(self):
+        self.configureOnlineHosts()
+        version = self.tested.cmd_admin__queryStatus(peer=None)["version"]
+        unchanged = self.tested.cmd_admin__queryStatus(peer=None, sinceVersion=version)
+        self.assertEquals(unchanged, dict(version=version, sinceVersion=version, allocations=[], hosts=[],
+                                          removedAllocations=[], removedHosts=[]))
+        self.allocate()
+        self.hosts.all()[0].hostImplementation().destroy("out of order")
+        with mock.patch.object(self.tested._status, "_refresh") as refresh:
+            delta = self.tested.cmd_admin__queryStatus(peer=None, sinceVersion=version)
+        self.assertFalse(refresh.called)
+        self.assertEquals(delta["hosts"], [])
+        self.tested._status._publishChanges()
+        delta = self.tested.cmd_admin__queryStatus(peer=None, sinceVersion=version)
+        self.assertGreater(delta["version"], version)
+        self.assertEquals([allocation["index"] for allocation in delta["allocations"]],
+                          [self.allocations.all()[0].index()])
+        self.assertEquals([host["id"] for host in delta["hosts"]], ["alpha"])
+        self.assertEquals(delta["hosts"][0]["reasonForDestruction"], "out of order")
+
+    def test_QueryStatusDeltaOfFreedAllocation(self):
+        self.configureOnlineHosts()
+        allocationID = self.allocate()
+        version = self.tested.cmd_admin__queryStatus(peer=None)["version"]
+        self.tested.cmd_allocation__free(id=allocationID, peer=None)
+        delta = self.tested.cmd_admin__queryStatus(peer=None, sinceVersion=version)
+        self.assertEquals([(allocation["index"], allocation["dead"]) for allocation in delta["allocations"]],
+                          [(allocationID, "freed")])
+
+    def test_QueryStatusOfTooOldVersionReturnsEverything(self):
+        self.configureOnlineHosts()
+        actual = self.tested.cmd_admin__queryStatus(peer=None, sinceVersion=10 ** 6)
+        self.assertNotIn("sinceVersion", actual)
+        self.assertEquals(len(actual["hosts"]), 4)
+
+    def test_QueryStatusFilteredIsPaginated(self):
+        self.configureOnlineHosts()
+        query = dict(peer=None, kind="host", filters=dict(pool="default", state="CHECKED_IN"), fields=["id"])
+        firstPage = self.tested.cmd_admin__queryStatusFiltered(limit=3, **query)
+        self.assertEquals(firstPage["entries"], [dict(id="alpha"), dict(id="bravo"), dict(id="charlie")])
+        self.assertEquals(firstPage["cursor"], "charlie")
+        secondPage = self.tested.cmd_admin__queryStatusFiltered(limit=3, cursor=firstPage["cursor"], **query)
+        self.assertEquals(secondPage["entries"], [dict(id="delta")])
+        self.assertIsNone(secondPage["cursor"])
+
+    def test_QueryStatusFilteredIsServedFromThePeriodicRefresh(self):
+        self.configureOnlineHosts()
+        query = dict(peer=None, kind="host", filters=dict(pool="default"), fields=["reasonForDestruction"],
+                     limit=1)
+        self.assertEquals(self.tested.cmd_admin__queryStatusFiltered(**query)["entries"],
+                          [dict(reasonForDestruction=None)])
+        self.hosts.all()[0].hostImplementation().destroy("out of order")
+        with mock.patch.object(self.tested._status, "_refresh") as refresh:
+            self.assertEquals(self.tested.cmd_admin__queryStatusFiltered(**query)["entries"],
+                              [dict(reasonForDestruction=None)])
+        self.assertFalse(refresh.called)
+        self.tested._status._publishChanges()
+        self.assertEquals(self.tested.cmd_admin__queryStatusFiltered(**query)["entries"],
+                          [dict(reasonForDestruction="out of order")])
+
+    def test_QueryStatusFilteredAllocations(self):
+        self.configureOnlineHosts()
+        allocationID = self.allocate()
+        actual = self.tested.cmd_admin__queryStatusFiltered(
+            peer=None, kind="allocation", filters=dict(purpose=self.allocationInfo["purpose"]),
+            fields=["index", "duration"])
+        self.assertEquals(actual["entries"], [dict(index=allocationID, duration=0)])
+        actual = self.tested.cmd_admin__queryStatusFiltered(peer=None, kind="allocation",
+                                                            filters=dict(purpose="noSuchPurpose"))
+        self.assertEquals(actual["entries"], [])
+        self.assertRaises(ValueError, self.tested.cmd_admin__queryStatusFiltered, peer=None,
+                          kind="allocation", filters=dict(pool="default"))
+
+    def configureOnlineHosts(self):
+        onlineHosts = {stateMachine.hostImplementation().id(): stateMachine.hostImplementation()
+                       for stateMachine in self.hosts.all()}
+        self.dynamicConfig.getOnlineHosts.return_value = onlineHosts
+        self.dynamicConfig.getOfflineHosts.return_value = dict()
+        self.dynamicConfig.getDetachedHosts.return_value = dict()
+
     @classmethod
     def osmosisListLabelsFoundMock(cls, cmd):
         if cmd[0:2] == ['osmosis', 'listlabels']:
-            return cmd[2]
+            return "\n".join(labelsOfListLabelsCommand(cmd))
         raise ValueError("Implement me")
 
+    def allocate(self):
+        return self.allocations.create(self.requirements, self.allocationInfo).index()
+
+    def allocateRequest(self, requirements=None, allocationInfo=None):
+        requirements = self.requirements if requirements is None else requirements
+        allocationInfo = self.allocationInfo if allocationInfo is None else allocationInfo
+        return json.dumps(dict(cmd="allocate", arguments=dict(requirements=requirements,
+                                                              allocationInfo=allocationInfo)))
+
+    @contextlib.contextmanager
+    def fakeAdmission(self):
+        pendingAdmissions = []
+
+        def handle(server, string, respondCallback, peer):
+            incoming = json.loads(string)
+            handler = getattr(server, "cmd_" + incoming['cmd'])
+            try:
+                respondCallback(dict(result=handler(peer=peer, **incoming['arguments'])))
+            except Exception as e:
+                respondCallback(dict(exception=str(e)))
+
+        def deferToThread(function, *args):
+            if not (args and isinstance(args[0], list)):
+                return defer.maybeDeferred(function, *args)
+            deferred = defer.Deferred()
+            pendingAdmissions.append(lambda: defer.maybeDeferred(function, *args).chainDeferred(deferred))
+            return deferred
+
+        def admit():
+            while pendingAdmissions:
+                pendingAdmissions.pop(0)()
+        with mock.patch.object(ipcserver.threads, "deferToThread", side_effect=deferToThread), \
+                mock.patch.object(ipcserver.globallock, "lock", mock.MagicMock()), \
+                mock.patch.object(baseipcserver.BaseIPCServer, "handle", handle):
+            yield admit
+
     @staticmethod
     def fakeDoneForAllocation(allocation):
         for machine in allocation.allocated().values():
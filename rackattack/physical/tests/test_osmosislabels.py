@@ -0,0 +1,143 @@
+import os
+import mock
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+import subprocess
+from rackattack.virtual import sh
+from rackattack.physical.alloc import osmosislabels
+
+
+FAKE_OSMOSIS = """#!/usr/bin/env python
+import os
+import re
+import sys
+with open(os.environ["FAKE_OSMOSIS_LOG"], "a") as log:
+    log.write(" ".join(sys.argv[1:]) + "\\n")
+regex = re.compile(sys.argv[2])
+with open(os.environ["FAKE_OSMOSIS_LABELS"]) as labels:
+    for label in labels.read().split():
+        if regex.search(label) is not None:
+            sys.stdout.write(label + "\\n")
+"""
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempDir)
+        osmosisPath = os.path.join(self.tempDir, "osmosis")
+        with open(osmosisPath, "w") as f:
+            f.write(FAKE_OSMOSIS)
+        os.chmod(osmosisPath, 0755)
+        self.logPath = os.path.join(self.tempDir, "log")
+        open(self.logPath, "w").close()
+        self.labelsPath = os.path.join(self.tempDir, "labels")
+        self.setExistingLabels(["alpha", "bravo", "charlie-1.0"])
+        self.env = dict(os.environ, PATH=self.tempDir + os.pathsep + os.environ["PATH"],
+                        FAKE_OSMOSIS_LOG=self.logPath, FAKE_OSMOSIS_LABELS=self.labelsPath)
+        runPatcher = mock.patch.object(sh, "run", self.runWithFakeOsmosis)
+        runPatcher.start()
+        self.addCleanup(runPatcher.stop)
+        self.tested = osmosislabels.OsmosisLabels("objectstore:1010")
+
+    def runWithFakeOsmosis(self, cmd):
+        return subprocess.check_output(cmd, env=self.env)
+
+    def setExistingLabels(self, labels):
+        with open(self.labelsPath, "w") as f:
+            f.write("\n".join(labels))
+
+    def listings(self):
+        with open(self.logPath) as f:
+            return f.read().splitlines()
+
+    def test_ExistingLabels(self):
+        self.assertEquals(self.tested.missing(["alpha", "charlie-1.0"]), [])
+
+    def test_MissingLabels(self):
+        self.assertEquals(self.tested.missing(["alpha", "delta", "charlie"]), ["charlie", "delta"])
+
+    def test_LabelsAreListedInOneBatch(self):
+        self.tested.missing(["alpha", "bravo", "delta"])
+        self.assertEquals(len(self.listings()), 1)
+        self.assertIn("--objectStores objectstore:1010", self.listings()[0])
+
+    def test_ExistingLabelsAreCached(self):
+        self.tested.missing(["alpha", "bravo"])
+        self.setExistingLabels([])
+        self.assertEquals(self.tested.missing(["alpha", "bravo"]), [])
+        self.assertEquals(len(self.listings()), 1)
+        self.assertEquals(self.tested.stats(), dict(hits=2, misses=2, listings=1, size=2))
+
+    def test_OnlyUncachedLabelsAreListed(self):
+        self.tested.missing(["alpha"])
+        self.tested.missing(["alpha", "bravo"])
+        self.assertEquals(len(self.listings()), 2)
+        self.assertIn("bravo", self.listings()[1])
+        self.assertNotIn("alpha", self.listings()[1])
+
+    def test_MissingLabelIsCachedForTheNegativeTTL(self):
+        self.assertEquals(self.tested.missing(["delta"]), ["delta"])
+        self.setExistingLabels(["delta"])
+        self.assertEquals(self.tested.missing(["delta"]), ["delta"])
+        self.assertEquals(len(self.listings()), 1)
+        afterNegativeTTL = time.time() + osmosislabels.OsmosisLabels.NEGATIVE_TTL + 1
+        with mock.patch.object(osmosislabels.time, "time", return_value=afterNegativeTTL):
+            self.assertEquals(self.tested.missing(["delta"]), [])
+        self.assertEquals(len(self.listings()), 2)
+
+    def test_ExistingLabelIsListedAgainAfterThePositiveTTL(self):
+        self.tested.missing(["alpha"])
+        self.setExistingLabels([])
+        afterPositiveTTL = time.time() + osmosislabels.OsmosisLabels.POSITIVE_TTL + 1
+        with mock.patch.object(osmosislabels.time, "time", return_value=afterPositiveTTL):
+            self.assertEquals(self.tested.missing(["alpha"]), ["alpha"])
+        self.assertEquals(len(self.listings()), 2)
+
+    def test_SizeIsBounded(self):
+        self.tested = osmosislabels.OsmosisLabels("objectstore:1010", maxSize=2)
+        self.tested.missing(["alpha", "bravo", "delta"])
+        self.assertEquals(self.tested.stats()["size"], 2)
+        self.assertEquals(self.tested.missing(["alpha", "bravo", "delta"]), ["delta"])
+
+    def test_ConcurrentMissesAreResolvedInOneListing(self):
+        releaseFirstListing = threading.Event()
+        listed = []
+
+        def blockingRun(cmd):
+            listed.append(cmd[2])
+            if len(listed) == 1:
+                releaseFirstListing.wait()
+            return self.runWithFakeOsmosis(cmd)
+        results = dict()
+
+        def verify(label):
+            results[label] = self.tested.missing([label])
+        with mock.patch.object(sh, "run", blockingRun):
+            threads = [threading.Thread(target=verify, args=(label,))
+                       for label in ("alpha", "bravo", "delta")]
+            threads[0].start()
+            while not listed:
+                time.sleep(0.001)
+            for thread in threads[1:]:
+                thread.start()
+            while self.tested._pending != set(["bravo", "delta"]):
+                time.sleep(0.001)
+            releaseFirstListing.set()
+            for thread in threads:
+                thread.join()
+        self.assertEquals(results, dict(alpha=[], bravo=[], delta=["delta"]))
+        self.assertEquals(len(listed), 2)
+        self.assertEquals(self.tested.stats()["listings"], 2)
+
+    def test_FailedListingIsRaisedAndNothingIsCached(self):
+        with mock.patch.object(sh, "run", side_effect=subprocess.CalledProcessError(1, "osmosis")):
+            self.assertRaises(subprocess.CalledProcessError, self.tested.missing, ["alpha"])
+        self.assertEquals(self.tested.stats()["size"], 0)
+        self.assertEquals(self.tested.missing(["alpha"]), [])
+
+if __name__ == '__main__':
+    unittest.main()
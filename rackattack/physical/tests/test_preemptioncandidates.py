@@ -0,0 +1,50 @@
+import unittest
+from rackattack.common import globallock
+from rackattack.physical.alloc import preemptioncandidates
+from rackattack.physical.tests.common import HostStateMachine, Allocation, Host, Hosts
+from rackattack.physical.alloc.freepool import FreePool
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(globallock._lock.release)
+        globallock._lock.acquire()
+        self.hosts = Hosts()
+        self.freePool = FreePool(self.hosts)
+        self.tested = preemptioncandidates.PreemptionCandidates()
+
+    def test_NicerThanIsOrderedByDescendingNiceAndThenByAscendingAge(self):
+        niceValues = [0.6, 0.9, 0.8, 0.9, 0.5]
+        allocations = [self._allocation(nice) for nice in niceValues]
+        for allocation in allocations:
+            self.tested.add(allocation)
+        expected = [allocations[3], allocations[1], allocations[2], allocations[0]]
+        self.assertEquals(list(self.tested.nicerThan(0.5)), expected)
+
+    def test_NicerThanSkipsDeadAllocations(self):
+        alive = self._allocation(0.9)
+        dead = self._allocation(0.9)
+        self.tested.add(alive)
+        self.tested.add(dead)
+        dead.withdraw("some reason")
+        self.assertEquals(list(self.tested.nicerThan(0)), [alive])
+
+    def test_Remove(self):
+        allocation = self._allocation(0.9)
+        self.tested.add(allocation)
+        self.assertEquals(len(self.tested), 1)
+        self.tested.remove(allocation)
+        self.assertEquals(len(self.tested), 0)
+        self.assertEquals(list(self.tested.nicerThan(0)), [])
+
+    def test_RemoveOfUnknownAllocationIsIgnored(self):
+        self.tested.remove(self._allocation(0.9))
+        self.assertEquals(len(self.tested), 0)
+
+    def _allocation(self, nice):
+        stateMachine = HostStateMachine(Host("host%d" % len(self.hosts.all())))
+        self.hosts.add(stateMachine)
+        return Allocation([stateMachine], self.freePool, self.hosts, nice)
+
+if __name__ == '__main__':
+    unittest.main()
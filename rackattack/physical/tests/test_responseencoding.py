@@ -0,0 +1,54 @@
+import json
+import mock
+import unittest
+from rackattack.physical import responseencoding
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.response = dict(version=3, hosts=[dict(id="rack01-server%02d" % idx, pool="default",
+                                                    state="CHECKED_IN") for idx in xrange(50)])
+
+    def test_RoundTrip(self):
+        for encoding in responseencoding.supported():
+            encoded = responseencoding.encode(self.response, encoding)
+            self.assertEquals(responseencoding.decode(encoded), self.response)
+
+    def test_LegacyResponsesArePlainJSON(self):
+        encoded = responseencoding.encode(self.response, responseencoding.LEGACY)
+        self.assertEquals(json.loads(encoded), self.response)
+        self.assertEquals(responseencoding.encodingOf(encoded), responseencoding.LEGACY)
+        self.assertEquals(responseencoding.decode(encoded), self.response)
+
+    def test_HeaderIdentifiesTheEncodingOfTheResponse(self):
+        for encoding in responseencoding.supported():
+            encoded = responseencoding.encode(self.response, encoding)
+            self.assertEquals(responseencoding.encodingOf(encoded), encoding.replace("+zlib", ""))
+        with mock.patch.object(responseencoding, "COMPRESSION_THRESHOLD", 100):
+            for encoding in responseencoding.supported():
+                encoded = responseencoding.encode(self.response, encoding)
+                self.assertEquals(responseencoding.encodingOf(encoded), encoding)
+
+    def test_OnlyLargeResponsesAreCompressed(self):
+        small = responseencoding.encode(self.response, responseencoding.MSGPACK_ZLIB)
+        self.assertEquals(small, responseencoding.encode(self.response, responseencoding.MSGPACK))
+        with mock.patch.object(responseencoding, "COMPRESSION_THRESHOLD", 100):
+            compressed = responseencoding.encode(self.response, responseencoding.MSGPACK_ZLIB)
+        self.assertLess(len(compressed), len(small))
+        self.assertEquals(responseencoding.decode(compressed), self.response)
+
+    def test_Negotiate(self):
+        self.assertEquals(responseencoding.negotiate(None), responseencoding.LEGACY)
+        self.assertEquals(responseencoding.negotiate(["bson", "msgpack"]), responseencoding.MSGPACK)
+        self.assertEquals(responseencoding.negotiate(["bson"]), responseencoding.JSON)
+        self.assertEquals(responseencoding.negotiate("msgpack"), responseencoding.LEGACY)
+
+    def test_FallsBackToJSONWithoutMsgpack(self):
+        with mock.patch.object(responseencoding, "msgpack", None):
+            self.assertEquals(responseencoding.negotiate(["msgpack+zlib", "msgpack"]), responseencoding.JSON)
+            self.assertEquals(responseencoding.negotiate(["msgpack", "json+zlib"]),
+                              responseencoding.JSON_ZLIB)
+
+
+if __name__ == '__main__':
+    unittest.main()
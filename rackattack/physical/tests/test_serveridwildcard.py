@@ -0,0 +1,28 @@
+import unittest
+from rackattack.physical import serveridwildcard
+
+
+class Test(unittest.TestCase):
+    def test_Matches(self):
+        self.assertTrue(serveridwildcard.matches("rack01-server49", "rack01-*"))
+        self.assertTrue(serveridwildcard.matches("rack01-server49", "*-server49"))
+        self.assertTrue(serveridwildcard.matches("rack01-server49", "rack01-server49"))
+        self.assertFalse(serveridwildcard.matches("rack01-server49", "rack01-server4"))
+        self.assertFalse(serveridwildcard.matches("rack01-server49", "rack0.-*"))
+
+    def test_CompiledPatternsAreCached(self):
+        self.assertIs(serveridwildcard.compiled("rack07-*"), serveridwildcard.compiled("rack07-*"))
+
+    def test_CacheIsBounded(self):
+        for idx in xrange(serveridwildcard._MAX_NR_CACHED + 1):
+            serveridwildcard.compiled("rack%d-*" % idx)
+        self.assertLessEqual(len(serveridwildcard._compiled), serveridwildcard._MAX_NR_CACHED)
+
+    def test_LiteralPrefix(self):
+        self.assertEquals(serveridwildcard.literalPrefix("rack07-*"), "rack07-")
+        self.assertEquals(serveridwildcard.literalPrefix("*-server01"), "")
+        self.assertEquals(serveridwildcard.literalPrefix("rack07-server01"), "rack07-server01")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+from rackattack.physical import statusdocument
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tested = statusdocument.StatusDocument()
+
+    def test_VersionGrowsOnlyWhenAnEntryChanges(self):
+        self.tested.setHost("alpha", dict(state="ONLINE"))
+        self.assertEquals(self.tested.version(), 1)
+        self.tested.setHost("alpha", dict(state="ONLINE"))
+        self.assertEquals(self.tested.version(), 1)
+        self.tested.setHost("alpha", dict(state="OFFLINE"))
+        self.assertEquals(self.tested.version(), 2)
+        self.assertEquals(self.tested.hosts(), [dict(state="OFFLINE")])
+
+    def test_ChangedSince(self):
+        self.tested.setHost("alpha", dict(id="alpha"))
+        self.tested.setHost("bravo", dict(id="bravo"))
+        version = self.tested.version()
+        self.tested.setHost("alpha", dict(id="alpha", pool="other"))
+        self.tested.setAllocation(1, dict(index=1))
+        self.assertEquals(self.tested.hostsChangedSince(version), [dict(id="alpha", pool="other")])
+        self.assertEquals(self.tested.allocationsChangedSince(version), [dict(index=1)])
+        self.assertEquals(self.tested.hostsChangedSince(self.tested.version()), [])
+
+    def test_RemovedSince(self):
+        self.tested.setAllocation(1, dict(index=1))
+        self.tested.setAllocation(2, dict(index=2))
+        version = self.tested.version()
+        self.tested.removeAllocation(1)
+        self.tested.removeAllocation(3)
+        self.assertEquals(self.tested.removedSince(version, "allocation"), [1])
+        self.assertEquals(self.tested.removedSince(version, "host"), [])
+        self.assertEquals(self.tested.allocations(), [dict(index=2)])
+
+    def test_CannotDeltaSinceVersionsOlderThanTheRetainedTombstones(self):
+        self.tested.MAX_NR_TOMBSTONES = 2
+        for index in xrange(3):
+            self.tested.setAllocation(index, dict(index=index))
+        version = self.tested.version()
+        self.assertTrue(self.tested.canDeltaSince(0))
+        for index in xrange(3):
+            self.tested.removeAllocation(index)
+        self.assertFalse(self.tested.canDeltaSince(version))
+        self.assertTrue(self.tested.canDeltaSince(version + 1))
+        self.assertFalse(self.tested.canDeltaSince(self.tested.version() + 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
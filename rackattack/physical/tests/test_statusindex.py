@@ -0,0 +1,88 @@
+import mock
+import unittest
+from rackattack.physical import statusindex
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.tested = statusindex.StatusIndex()
+
+    def setHost(self, hostID, pool="default", state="CHECKED_IN"):
+        self.tested.set("host", hostID, dict(id=hostID, pool=pool, state=state))
+
+    def hostIDs(self, *args, **kwargs):
+        found, cursor = self.tested.query("host", *args, **kwargs)
+        return [key for key, _ in found], cursor
+
+    def test_FiltersIntersect(self):
+        self.setHost("rack01-server01", state="DESTROYED")
+        self.setHost("rack01-server02", pool="other", state="DESTROYED")
+        self.setHost("rack01-server03")
+        self.assertEquals(self.hostIDs(dict(state="DESTROYED")),
+                          (["rack01-server01", "rack01-server02"], None))
+        self.assertEquals(self.hostIDs(dict(state="DESTROYED", pool="default")), (["rack01-server01"], None))
+        self.assertEquals(self.hostIDs(dict(pool="noSuchPool")), ([], None))
+
+    def test_ChangedEntryMovesBetweenBuckets(self):
+        self.setHost("rack01-server01")
+        self.setHost("rack01-server01", state="DESTROYED")
+        self.assertEquals(self.hostIDs(dict(state="CHECKED_IN")), ([], None))
+        self.assertEquals(self.hostIDs(dict(state="DESTROYED")), (["rack01-server01"], None))
+        self.tested.remove("host", "rack01-server01")
+        self.tested.remove("host", "rack01-server01")
+        self.assertEquals(self.hostIDs(dict()), ([], None))
+
+    def test_IDWildcard(self):
+        for hostID in ("rack01-server01", "rack02-server01", "rack02-server02", "rack03-server01"):
+            self.setHost(hostID)
+        self.assertEquals(self.hostIDs(dict(), keyWildcard="rack02-*"),
+                          (["rack02-server01", "rack02-server02"], None))
+        self.assertEquals(self.hostIDs(dict(), keyWildcard="*-server01"),
+                          (["rack01-server01", "rack02-server01", "rack03-server01"], None))
+        self.assertEquals(self.hostIDs(dict(pool="default"), keyWildcard="rack0*-server02"),
+                          (["rack02-server02"], None))
+
+    def test_Pagination(self):
+        for idx in xrange(5):
+            self.setHost("server%d" % idx)
+        self.assertEquals(self.hostIDs(dict(), limit=2), (["server0", "server1"], "server1"))
+        self.assertEquals(self.hostIDs(dict(), cursor="server1", limit=2),
+                          (["server2", "server3"], "server3"))
+        self.assertEquals(self.hostIDs(dict(), cursor="server3", limit=2), (["server4"], None))
+        self.assertEquals(self.hostIDs(dict(pool="default"), cursor="server2", limit=2),
+                          (["server3", "server4"], None))
+
+    def test_FilteredPagination(self):
+        for idx in xrange(10):
+            self.setHost("server%d" % idx, state="DESTROYED" if idx % 2 else "CHECKED_IN")
+        filters = dict(state="DESTROYED", pool="default")
+        self.assertEquals(self.hostIDs(filters, limit=2), (["server1", "server3"], "server3"))
+        self.assertEquals(self.hostIDs(filters, cursor="server3", limit=2),
+                          (["server5", "server7"], "server7"))
+        self.assertEquals(self.hostIDs(filters, cursor="server7", limit=2), (["server9"], None))
+
+    def test_FilteredQueryWalksOnlyTheSmallestBucket(self):
+        for idx in xrange(1000):
+            self.setHost("server%04d" % idx)
+        self.setHost("server0500", state="DESTROYED")
+        with mock.patch.object(statusindex.StatusIndex, "_valueOf",
+                               side_effect=statusindex.StatusIndex._valueOf) as valueOf:
+            self.assertEquals(self.hostIDs(dict(state="DESTROYED", pool="default"), limit=10),
+                              (["server0500"], None))
+        self.assertEquals(valueOf.call_count, 2)
+
+    def test_AllocationsByAllocationInfo(self):
+        self.tested.set("allocation", 1, dict(index=1, allocationInfo=dict(user="alice", purpose="user")))
+        self.tested.set("allocation", 2, dict(index=2, allocationInfo=dict(user="bob", purpose="racktest")))
+        self.tested.set("allocation", 3, dict(index=3, allocationInfo=None))
+        found, _ = self.tested.query("allocation", dict(purpose="racktest"))
+        self.assertEquals([key for key, _ in found], [2])
+        found, _ = self.tested.query("allocation", dict(), cursor=1)
+        self.assertEquals([key for key, _ in found], [2, 3])
+
+    def test_UnknownFilter(self):
+        self.assertRaises(ValueError, self.tested.query, "host", dict(user="alice"))
+
+
+if __name__ == '__main__':
+    unittest.main()
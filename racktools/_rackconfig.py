@@ -20,13 +20,29 @@ BACKUP_GIT_REPO_CONFIG_FILES_DIR = "etc"
 
 RACKATTACK_LOCK = "/tmp/rackattack.conf"
 SERVER_STATES = ['detached', 'offline', 'online']
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
 
 
 class RackattackConfig(object):
     def __init__(self, yamlConf=YAML):
-        self._yaml = yaml.load(open(yamlConf))
         self._yamlConfPath = yamlConf
+        if os.path.isdir(yamlConf):
+            shardPaths = [os.path.join(yamlConf, filename) for filename in sorted(os.listdir(yamlConf))
+                          if filename.endswith(".yaml")]
+        else:
+            shardPaths = [yamlConf]
+        self._shards = dict()
+        self._shardOfServer = dict()
+        hosts = []
+        for shardPath in shardPaths:
+            shard = yaml.load(open(shardPath), Loader=YAML_LOADER)
+            self._shards[shardPath] = shard
+            for server in shard['HOSTS']:
+                self._shardOfServer[server['id']] = shardPath
+            hosts.extend(shard['HOSTS'])
+        self._yaml = dict(HOSTS=hosts)
+        self._modifiedShards = set()
         self._client = clientfactory.factory()
 
     def updateState(self, servers, state):
@@ -56,6 +72,7 @@ class RackattackConfig(object):
             if server['id'] in servers:
                 print 'Handling server %s: %s -> %s' % (server['id'], server.get(field, None), value)
                 server[field] = value
+                self._modifiedShards.add(self._shardOfServer[server['id']])
         self._save(field, value)
 
     def _save(self, confChangeType, confChangeValue):
@@ -65,7 +82,9 @@ class RackattackConfig(object):
                                                  confChangeType,
                                                  confChangeValue)
         # shutil.copyfile(self._yamlConfPath, yamlBackupPath)
-        yaml.dump(self._yaml, open(self._yamlConfPath, 'w'))
+        for shardPath in sorted(self._modifiedShards):
+            yaml.dump(self._shards[shardPath], open(shardPath, 'w'))
+        self._modifiedShards = set()
 
     def reloadConf(self):
         self._client.call("admin__asyncReloadConfiguration")
@@ -111,7 +130,14 @@ class RackattackConfig(object):
                           dict(prop=prop, servers=",".join(args.servers), value=value, serversWord=serversWord)
             dest_path = os.path.join(gitrepo_dir, config_files_dir)
             print "\tCopying configuration file to repository..."
-            shutil.copy(args.yaml, os.path.join(dest_path, os.path.basename(args.yaml)))
+            if os.path.isdir(args.yaml):
+                shardsDestPath = os.path.join(dest_path, os.path.basename(os.path.normpath(args.yaml)))
+                if not os.path.isdir(shardsDestPath):
+                    os.makedirs(shardsDestPath)
+                for shardPath in self._shards:
+                    shutil.copy(shardPath, os.path.join(shardsDestPath, os.path.basename(shardPath)))
+            else:
+                shutil.copy(args.yaml, os.path.join(dest_path, os.path.basename(args.yaml)))
             shutil.copy(RACKATTACK_CONFIG_FILE, os.path.join(dest_path, os.path.basename(RACKATTACK_CONFIG_FILE)))
             print "\tValidating that a diff exists..."
             output = subprocess.check_output(["git", "status", "--porcelain"], stderr=subprocess.PIPE)
@@ -119,6 +145,7 @@ class RackattackConfig(object):
                 print "\tNo need to backup. The configuration file is identical to that in origin/master"
                 return
             print "\tCommiting..."
+            subprocess.check_output(["git", "add", "-A", config_files_dir], stderr=subprocess.PIPE)
             subprocess.check_output(["git", "commit", "-am", message], stderr=subprocess.PIPE)
             print "\tPushing..."
             subprocess.check_output(["git", "push", "origin", "master"], stderr=subprocess.PIPE)
@@ -166,7 +193,8 @@ def parse_args():
         description="Safely configure physical rackattack server",
     )
 
-    parser.add_argument("--yaml", "-y", default=YAML, help="Rackattack YAML configuration path")
+    parser.add_argument("--yaml", "-y", default=YAML,
+                        help="Rackattack YAML configuration path, or a directory of per-rack shards")
     group1 = parser.add_mutually_exclusive_group(required=True)
     group1.add_argument("--show", help="Display servers in certain state or pool", action='store_true')
     group1.add_argument("--servers", metavar="rackXX-serverYY", nargs="+", help="servers to change configuration")
@@ -1,6 +1,32 @@
+import os
+import time
 import pprint
+import argparse
 from rackattack import clientfactory
+from rackattack.physical import statusstream
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--follow", action="store_true", help="Keep printing the status whenever it changes")
+args = parser.parse_args()
 
 client = clientfactory.factory()
 
-pprint.pprint(client.call("admin__queryStatus"))
+
+def queryStatus(sinceVersion):
+    return client.call("admin__queryStatus", sinceVersion=sinceVersion)
+
+
+def printStatus(mirror):
+    pprint.pprint(dict(version=mirror.version(), hosts=mirror.hosts(), allocations=mirror.allocations()))
+
+subscription = None
+if args.follow:
+    subscription = statusstream.Subscribe(os.environ["RACKATTACK_PROVIDER"].split("@@")[1])
+mirror = statusstream.StatusMirror(queryStatus, subscription)
+printStatus(mirror)
+printedVersion = mirror.version()
+while args.follow:
+    time.sleep(1)
+    if mirror.version() != printedVersion:
+        printedVersion = mirror.version()
+        printStatus(mirror)